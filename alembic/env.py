@@ -18,9 +18,21 @@ if db_url:
     config.set_main_option('sqlalchemy.url', db_url)
 
 # Define metadata directly to avoid circular imports
-from sqlalchemy import MetaData, Table, Column, String, Text, Integer, Boolean, DateTime
+from sqlalchemy import (
+    MetaData,
+    Table,
+    Column,
+    String,
+    Text,
+    Integer,
+    Boolean,
+    DateTime,
+    Float,
+    Index,
+)
+
 meta = MetaData()
-Table(
+url_mappings = Table(
     "url_mappings",
     meta,
     Column("hash", String(128), primary_key=True),
@@ -32,6 +44,13 @@ Table(
     Column("last_checked", DateTime),
     Column("is_valid", Boolean),
     Column("failed_checks", Integer),
+    Column("hits", Integer),
+    Column("last_hit", DateTime),
+    Column("next_check", Float),
+)
+Index("ux_url_mappings_url", url_mappings.c.url, unique=True)
+Index(
+    "ix_url_mappings_validation", url_mappings.c.next_check, url_mappings.c.last_checked
 )
 
 target_metadata = meta
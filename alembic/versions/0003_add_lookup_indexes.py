@@ -0,0 +1,112 @@
+"""add_lookup_indexes
+
+Indexes for the hot queries:
+- create_short_url looks links up by url (unique, unless legacy duplicates exist)
+- the validator walks url_mappings by next_check/last_checked
+- get_latest_books orders published_books by date_published, optionally per channel
+
+Also adds the revalidation columns (hits, last_hit, next_check) that
+url_cache creates on startup, so databases managed by alembic match.
+
+Revision ID: 0003_lookup_indexes
+Revises: 0002_published_books
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003_lookup_indexes"
+down_revision = "0002_published_books"
+branch_labels = None
+depends_on = None
+
+_URL_COLUMNS = (
+    ("hits", sa.Integer, "0"),
+    ("last_hit", sa.DateTime, None),
+    ("next_check", sa.Float, None),
+)
+
+# (único, alternativa no única)
+_URL_INDEXES = ("ux_url_mappings_url", "ix_url_mappings_url")
+
+
+def _create_indexes(specs):
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    postgres = bind.dialect.name == "postgresql"
+    for name, table, columns, unique in specs:
+        if name in {ix["name"] for ix in inspector.get_indexes(table)}:
+            continue
+        if postgres:
+            # Sin bloquear escrituras en tablas grandes
+            with op.get_context().autocommit_block():
+                op.create_index(
+                    name, table, columns, unique=unique, postgresql_concurrently=True
+                )
+        else:
+            op.create_index(name, table, columns, unique=unique)
+
+
+def upgrade():
+    bind = op.get_bind()
+    columns = {c["name"] for c in sa.inspect(bind).get_columns("url_mappings")}
+    for name, type_, default in _URL_COLUMNS:
+        if name not in columns:
+            op.add_column(
+                "url_mappings", sa.Column(name, type_, server_default=default)
+            )
+
+    specs = [
+        (
+            "ix_url_mappings_validation",
+            "url_mappings",
+            ["next_check", "last_checked"],
+            False,
+        ),
+        (
+            "ix_published_books_date",
+            "published_books",
+            [sa.text("date_published DESC")],
+            False,
+        ),
+        (
+            "ix_published_books_channel_date",
+            "published_books",
+            ["channel_id", sa.text("date_published DESC")],
+            False,
+        ),
+    ]
+    # Un solo índice por url: el único, o el normal si hay URLs duplicadas de
+    # versiones antiguas (como url_cache.init_db); downgrade borra el que haya
+    existing = {ix["name"] for ix in sa.inspect(bind).get_indexes("url_mappings")}
+    if not existing & set(_URL_INDEXES):
+        duplicated = bind.execute(
+            sa.text(
+                "SELECT url FROM url_mappings GROUP BY url HAVING COUNT(*) > 1 LIMIT 1"
+            )
+        ).first()
+        name = _URL_INDEXES[1] if duplicated else _URL_INDEXES[0]
+        specs.append((name, "url_mappings", ["url"], not duplicated))
+    _create_indexes(specs)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table, names in (
+        (
+            "published_books",
+            ("ix_published_books_channel_date", "ix_published_books_date"),
+        ),
+        ("url_mappings", ("ix_url_mappings_validation",) + _URL_INDEXES),
+    ):
+        existing = {ix["name"] for ix in inspector.get_indexes(table)}
+        for name in names:
+            if name in existing:
+                op.drop_index(name, table_name=table)
+    with op.batch_alter_table("url_mappings") as batch:
+        for name, _, _ in reversed(_URL_COLUMNS):
+            batch.drop_column(name)
@@ -2,6 +2,7 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from core.bot import ZeePubBot
+import asyncio
 import logging
 
 # Configurar logging
@@ -32,6 +33,14 @@ async def lifespan(app: FastAPI):
 
     # Run validator every hour by default (can be tuned via environment)
     start_background_validator()
+    # Escanear el almacén de EPUBs en un hilo, sin esperar a la primera descarga
+    from utils.epub_store import open_epub_store
+
+    asyncio.create_task(open_epub_store())
+    # Lo mismo con la caché de portadas del proxy de imágenes
+    from utils.image_cache import open_image_cache
+
+    asyncio.create_task(open_image_cache())
     # Guardar el bot en app_state para acceso desde rutas
     app_state["bot"] = bot.app.bot
     yield
@@ -41,6 +50,21 @@ async def lifespan(app: FastAPI):
     from utils.url_validator import stop_background_validator
 
     stop_background_validator()
+    from utils.url_cache import flush_hits
+
+    try:
+        flush_hits()
+    except Exception as e:
+        logger.error(f"No se pudieron guardar los clics pendientes: {e}")
+    from utils.thumbnails import shutdown_thumbnail_pool
+
+    shutdown_thumbnail_pool()
+    from services.epub_service import shutdown_epub_pool
+
+    shutdown_epub_pool()
+    from utils.database import dispose_engines
+
+    dispose_engines()
 
 
 app = FastAPI(
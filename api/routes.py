@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Query, Request, Response, Depends, Header
-from typing import Optional
-import httpx
+from fastapi.responses import StreamingResponse
+from typing import Callable, Optional
 import os
+import asyncio
 import hmac
 import hashlib
 import json
@@ -9,8 +10,22 @@ from config.config_settings import config
 from utils.http_client import parse_feed_from_url
 from utils.helpers import build_search_url
 from utils.security import validate_telegram_data
-from utils.http_client import fetch_bytes
-from services.epub_service import parse_opf_from_epub, extract_cover_from_epub, extract_internal_title
+from utils.rate_limiter import get_rate_limit_manager
+from utils.http_client import fetch_bytes, cleanup_tmp
+from utils.epub_store import fetch_epub, open_epub_store
+from utils.image_cache import fetch_image
+from utils.thumbnails import allowed_sizes
+from utils.streaming import (
+    PASSTHROUGH_HEADERS,
+    RangeNotSatisfiable,
+    UpstreamFlight,
+    iter_file,
+    iter_upstream,
+    open_upstream,
+    parse_range,
+)
+from services.epub_service import inspect_epub
+from services.epub_meta_cache import lookup_epub_meta
 from utils.helpers import (
     formatear_mensaje_portada,
 )
@@ -53,6 +68,26 @@ async def get_current_user(
     return 0
 
 
+async def limit_origin(request: Request) -> None:
+    """
+    Límite global por origen (IP del cliente), compartido por todos los
+    usuarios que llegan desde ella. Responde 429 con Retry-After.
+    """
+    limit = config.API_ORIGIN_RATE_LIMIT_PER_MINUTE
+    if limit <= 0:
+        return
+    key = ("origin", request.client.host if request.client else "")
+    manager = get_rate_limit_manager()
+    manager.add_global_limit(key, limit, 60, pinned=False)
+    wait = manager.acquire_global(key)
+    if wait > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(int(wait) + 1)},
+        )
+
+
 @router.get("/feed")
 async def get_feed(
     url: Optional[str] = None, current_uid: int = Depends(get_current_user)
@@ -169,29 +204,35 @@ async def search_books(
 async def proxy_image(rest_of_path: str, request: Request):
     """
     Proxies image requests to the upstream OPDS server.
+    Las portadas se cachean en memoria y disco; el navegador revalida con ETag.
+    `?size=160|320|original` devuelve una miniatura de ese ancho.
     """
+    query_params = dict(request.query_params)
+    size_param = query_params.pop("size", None)
+    size = None
+    if size_param and size_param != "original":
+        if not size_param.isdigit() or int(size_param) not in allowed_sizes():
+            raise HTTPException(status_code=400, detail="Invalid size")
+        size = int(size_param)
+
     try:
         base_url_cleaned = config.BASE_URL.rstrip("/")
         full_url = f"{base_url_cleaned}/{rest_of_path}"
-        query_params = dict(request.query_params)
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                full_url, params=query_params, follow_redirects=True
-            )
-            response.raise_for_status()
 
-            return Response(
-                content=response.content,
-                media_type=response.headers.get("content-type", "image/jpeg"),
-                headers={"Cache-Control": "public, max-age=86400"},
-            )
+        image = await fetch_image(full_url, query_params, size=size)
     except Exception as e:
         logger.error(f"Error proxying image: {e}")
+        image = None
+    if image is None:
         raise HTTPException(status_code=404, detail="Image not found")
 
+    headers = {"Cache-Control": "public, max-age=86400", "ETag": image.etag}
+    if request.headers.get("if-none-match") == image.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=image.data, media_type=image.content_type, headers=headers)
+
 
-from utils.url_cache import get_url_from_hash
+from utils.url_cache import resolve_short_link, record_hit
 
 
 @router.get("/dl/{url_hash}")
@@ -200,16 +241,13 @@ async def short_download(url_hash: str):
     Endpoint acortado para descargas usando hash SHA256.
     """
     try:
-        # Buscar en BD SQLite
-        url = get_url_from_hash(url_hash)
-        if not url:
+        # Caché en memoria delante de la BD (incluye hashes inexistentes)
+        link = resolve_short_link(url_hash)
+        if not link:
             raise HTTPException(status_code=404, detail="Short URL not found")
-
-        # Extraer título del final de la URL
-        from urllib.parse import unquote, urlparse
-
-        parsed = urlparse(url)
-        title = unquote(parsed.path.split("/")[-1]).replace(".epub", "")
+        url, title = link
+        # Tráfico del enlace: prioriza su revalidación
+        record_hit(url_hash)
 
         # Redirigir al endpoint público
         from fastapi.responses import RedirectResponse
@@ -220,69 +258,251 @@ async def short_download(url_hash: str):
         raise HTTPException(status_code=404, detail="Invalid short URL")
 
 
-@router.get("/public/dl")
+def _local_epub_response(
+    path: str, range_header: Optional[str], headers: dict
+) -> Response:
+    """Sirve un EPUB del almacén local respetando la cabecera Range."""
+    size = os.path.getsize(path)
+    try:
+        rng = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    headers = dict(headers, **{"Accept-Ranges": "bytes"})
+    if rng is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            content=iter_file(path),
+            media_type="application/epub+zip",
+            headers=headers,
+        )
+    start, end = rng
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        content=iter_file(path, start, end),
+        status_code=206,
+        media_type="application/epub+zip",
+        headers=headers,
+    )
+
+
+class _ReleasingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse que cierra su cuerpo y llama a `release` al terminar,
+    también si el cuerpo nunca se llega a iterar (el cliente se fue antes
+    del primer byte): la plaza del limitador y la conexión al origen no
+    pueden depender del `finally` del generador.
+    """
+
+    def __init__(self, *args, release: Callable[[], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self._release()
+
+
+@router.get("/public/dl", dependencies=[Depends(limit_origin)])
 async def public_download(
+    request: Request,
     url: str = Query(..., description="Source EPUB URL"),
     title: str = Query("libro", description="Filename hint"),
 ):
     """
     Proxy público para descargas.
-    Sirve el archivo desde la fuente OPDS original.
+    Sirve el archivo desde el almacén local o, si no está, reenvía en streaming
+    los trozos del origen OPDS según llegan (con soporte de Range).
     """
     try:
         # Validar URL básica para evitar SSRF flagrante (aunque fetch_bytes ya es genérico)
         if not url.startswith("http"):
             raise HTTPException(status_code=400, detail="Invalid URL")
 
-        # Usar fetch_bytes para obtener el contenido (memoria o archivo temp)
-        # Nota: fetch_bytes maneja archivos grandes escribiendo a disco
-        data = await fetch_bytes(url, timeout=120)
-
-        if not data:
+        range_header = request.headers.get("range")
+        headers = {"Content-Disposition": f'attachment; filename="{title}.epub"'}
+
+        store = await open_epub_store()
+        hit = await asyncio.to_thread(store.lookup, url) if store.enabled else None
+        if hit and hit.fresh:
+            if hit.etag:
+                headers["ETag"] = hit.etag
+            return _local_epub_response(hit.path, range_header, headers)
+
+        # Otra petición ya está copiando esta URL al almacén: leer su copia
+        # según crece en lugar de abrir otra descarga al origen
+        flight = None
+        if store.enabled and not range_header:
+            flight = UpstreamFlight.get(url)
+        if flight is not None:
+            part = await flight.join()
+            if part is not None:
+                return _ReleasingStreamingResponse(
+                    content=flight.tail(part),
+                    release=part.close,
+                    media_type="application/epub+zip",
+                    headers={**headers, **flight.headers},
+                )
+            # No llegó a empezar o ya terminó: objeto almacenado u origen
+            path = await flight.wait()
+            if path and os.path.exists(path):
+                return _local_epub_response(path, range_header, headers)
+            hit = await asyncio.to_thread(store.lookup, url)
+
+        # Copia local antigua: revalidarla con una petición condicional
+        upstream_headers = {}
+        if range_header:
+            upstream_headers["Range"] = range_header
+        if hit and hit.etag:
+            upstream_headers["If-None-Match"] = hit.etag
+        if hit and hit.last_modified:
+            upstream_headers["If-Modified-Since"] = hit.last_modified
+
+        # Streaming directo desde el origen: el primer byte sale en cuanto llega
+        upstream = None
+        try:
+            upstream = await open_upstream(url, headers=upstream_headers or None)
+        except Exception as e:
+            logger.warning(f"public_download: origen no disponible {url}: {e}")
+        if upstream is not None and upstream.status == 304 and hit:
+            upstream.release()
+            await asyncio.to_thread(store.mark_checked, url)
+            if hit.etag:
+                headers["ETag"] = hit.etag
+            return _local_epub_response(hit.path, range_header, headers)
+        if upstream is None or upstream.status >= 300:
+            status = upstream.status if upstream is not None else None
+            if upstream is not None:
+                upstream.release()
+            if hit:
+                # Copia local antigua mejor que nada
+                return _local_epub_response(hit.path, range_header, headers)
+            if status == 416:
+                raise HTTPException(status_code=416, detail="Range not satisfiable")
             raise HTTPException(status_code=404, detail="Could not fetch file")
 
-        from fastapi.responses import StreamingResponse
-
-        # Determinar si es archivo o bytes
-        if isinstance(data, str) and os.path.exists(data):
-            # Es un archivo temporal - usar aiofiles para streaming async
-            import aiofiles
-
-            async def iterfile_async():
-                try:
-                    async with aiofiles.open(data, mode="rb") as f:
-                        chunk = await f.read(64 * 1024)
-                        while chunk:
-                            yield chunk
-                            chunk = await f.read(64 * 1024)
-                finally:
-                    try:
-                        os.unlink(data)
-                    except Exception as e:
-                        logger.debug(
-                            "Could not remove temp file from streaming proxy: %s", e
-                        )
-
-            return StreamingResponse(
-                content=iterfile_async(),
-                media_type="application/epub+zip",
-                headers={"Content-Disposition": f'attachment; filename="{title}.epub"'},
-            )
-        else:
-            # Son bytes en memoria
-            # StreamingResponse espera un iterador o bytes-like object?
-            # Response normal funciona para bytes.
-            return Response(
-                content=data,
+        on_complete = flight = None
+        try:
+            for name in PASSTHROUGH_HEADERS:
+                if name == "Content-Length" and "Content-Encoding" in upstream.headers:
+                    # aiohttp descomprime: la longitud del origen no aplica
+                    continue
+                if name in upstream.headers:
+                    headers[name] = upstream.headers[name]
+
+            # Solo las respuestas completas se guardan en el almacén, y mientras
+            # tanto las demás peticiones de la URL leen la copia de esta
+            if store.enabled and upstream.status == 200:
+                etag = upstream.headers.get("ETag")
+                last_modified = upstream.headers.get("Last-Modified")
+
+                async def on_complete(tmp_path):
+                    return await asyncio.to_thread(
+                        store.put, url, tmp_path, etag, last_modified
+                    )
+
+                if UpstreamFlight.get(url) is None:
+                    flight = UpstreamFlight(url)
+                    flight.headers = {
+                        k: v for k, v in headers.items() if k != "Content-Disposition"
+                    }
+
+            def release():
+                upstream.release()
+                if flight is not None and not flight.started:
+                    flight.finish(None)
+
+            return _ReleasingStreamingResponse(
+                content=iter_upstream(
+                    upstream,
+                    tee_dir=store.objects_dir if on_complete else None,
+                    on_complete=on_complete,
+                    flight=flight,
+                ),
+                release=release,
+                status_code=upstream.status,
                 media_type="application/epub+zip",
-                headers={"Content-Disposition": f'attachment; filename="{title}.epub"'},
+                headers=headers,
             )
+        except BaseException:
+            upstream.release()
+            if flight is not None:
+                flight.finish(None)
+            raise
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in public download proxy: {e}")
         raise HTTPException(status_code=500, detail="Download failed")
 
 
+def _short_link(url_hash: str) -> str:
+    """Enlace público /api/dl/{hash} en DL_DOMAIN."""
+    dl_domain = config.DL_DOMAIN.rstrip("/")
+    # Asegurar esquema
+    if not dl_domain.startswith("http"):
+        dl_domain = f"https://{dl_domain}"
+    return f"{dl_domain}/api/dl/{url_hash}"
+
+
+@router.post("/facebook/links")
+async def create_facebook_links(
+    request: Request, current_uid: int = Depends(get_current_user)
+):
+    """
+    Crea (o reutiliza) los enlaces cortos de varios libros en una sola
+    llamada, para preparar publicaciones por lotes.
+    Body: {"items": [{"url": ..., "title": ...}, ...]} o {"urls": [...]}.
+    """
+    if current_uid not in config.FACEBOOK_PUBLISHERS:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    items = data.get("items") or data.get("urls") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="Missing items")
+    if len(items) > config.SHORT_LINK_BATCH_MAX:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items (max {config.SHORT_LINK_BATCH_MAX})",
+        )
+    for item in items:
+        url = item.get("url") if isinstance(item, dict) else item
+        if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+            raise HTTPException(
+                status_code=400, detail="Each item needs an http(s) url"
+            )
+
+    from utils.url_cache import create_short_urls
+
+    try:
+        # Una transacción para todo el lote, fuera del event loop
+        hashes = await asyncio.to_thread(create_short_urls, items)
+    except Exception as e:
+        logger.error(f"Error creating short links in batch: {e}")
+        raise HTTPException(status_code=500, detail="Could not create links")
+
+    return {
+        "links": [
+            {
+                "url": item.get("url") if isinstance(item, dict) else item,
+                "hash": url_hash,
+                "short_url": _short_link(url_hash),
+            }
+            for item, url_hash in zip(items, hashes)
+        ]
+    }
+
+
 @router.post("/facebook/prepare")
 async def prepare_facebook_post(
     request: Request, current_uid: int = Depends(get_current_user)
@@ -316,60 +536,42 @@ async def prepare_facebook_post(
 
         # Construir link público acortado con SHA256
         from utils.url_cache import create_short_url
-        from urllib.parse import quote, unquote, urlparse
-
-        dl_domain = config.DL_DOMAIN.rstrip("/")
-        # Asegurar esquema
-        if not dl_domain.startswith("http"):
-            dl_domain = f"https://{dl_domain}"
 
         # Crear hash y guardar en BD SQLite
         url_hash = create_short_url(download_url)
-        public_link = f"{dl_domain}/api/dl/{url_hash}"
+        public_link = _short_link(url_hash)
 
         # Intentar obtener metadatos completos del EPUB para el título
-        header_title = f"📚 <b>{title}</b>"  # Fallback
+        caption_base = f"📚 <b>{title}</b>"  # Fallback
 
         try:
-            # Descargar primeros bytes o todo para parsear
-            epub_bytes = await fetch_bytes(download_url, timeout=60)
-            if epub_bytes:
-                meta = {
-                    "titulo": title,
-                    "epub_version": "2.0",
-                    "fecha_modificacion": "Desconocida",
-                }
-
-                # Parsear OPF
-                opf_meta = await parse_opf_from_epub(epub_bytes)
-                if opf_meta:
-                    meta.update(opf_meta)
-
-                # Extraer título interno
-                internal_title = extract_internal_title(epub_bytes)
-                if internal_title:
-                    meta["internal_title"] = internal_title
-
-                # Extraer filename title
-                filename_title = unquote(
-                    urlparse(download_url).path.split("/")[-1]
-                ).replace(".epub", "")
-                meta["filename_title"] = filename_title
+            meta = {
+                "titulo": title,
+                "epub_version": "2.0",
+                "fecha_modificacion": "Desconocida",
+            }
+            # Metadatos ya extraídos de este EPUB: sin descargar ni parsear
+            cached = await lookup_epub_meta(download_url)
+            if cached is not None:
+                meta.update(cached.meta)
+            else:
+                epub_bytes = await fetch_epub(download_url, timeout=60)
+                if not epub_bytes:
+                    meta = None
+                else:
+                    meta, _cover = await inspect_epub(epub_bytes, download_url, meta)
 
+            if meta:
                 # Debug logging
                 logger.info(
                     f"FB Post Meta - internal_title: {meta.get('internal_title')}, collection_title: {meta.get('titulo_serie')}, titulo_volumen: {meta.get('titulo_volumen')}"
                 )
 
                 # Generar caption completo (sin slug para FB)
-                full_caption = formatear_mensaje_portada(meta, include_slug=False)
-
-                # Usar el caption completo
-                caption_base = full_caption
+                caption_base = formatear_mensaje_portada(meta, include_slug=False)
 
         except Exception as e:
             logger.warning(f"Could not fetch/parse EPUB for FB post: {e}")
-            caption_base = f"📚 <b>{title}</b>"  # Fallback
 
         caption = f"{caption_base}\n\n" f"⬇️ <b>Descarga directa:</b>\n" f"{public_link}"
 
@@ -429,10 +631,12 @@ async def publish_facebook_post(
             "access_token": config.FACEBOOK_PAGE_ACCESS_TOKEN,
         }
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, params=params, timeout=30)
-            resp.raise_for_status()
-            fb_data = resp.json()
+        from core.session_manager import session_manager
+
+        client = session_manager.get_http_client()
+        resp = await client.post(url, params=params, timeout=30)
+        resp.raise_for_status()
+        fb_data = resp.json()
 
         return {"success": True, "fb_id": fb_data.get("id")}
 
@@ -92,6 +92,31 @@ class BotConfig:
         os.getenv("WHITELIST_DOWNLOADS_PER_DAY", "10")
     )
     VIP_DOWNLOADS_PER_DAY: int = int(os.getenv("VIP_DOWNLOADS_PER_DAY", "20"))
+    # Fichero SQLite de los contadores de descarga (compartirlo entre réplicas)
+    DOWNLOADS_DB_PATH: str = os.getenv("DOWNLOADS_DB_PATH", "data/daily_downloads.db")
+    # Rate limit por usuario y minuto de búsquedas y botones (0 desactiva)
+    RATE_LIMIT_SEARCH_PER_MINUTE: int = int(
+        os.getenv("RATE_LIMIT_SEARCH_PER_MINUTE", "10")
+    )
+    RATE_LIMIT_CALLBACKS_PER_MINUTE: int = int(
+        os.getenv("RATE_LIMIT_CALLBACKS_PER_MINUTE", "60")
+    )
+    # Descargas de /api/public/dl por origen (IP del cliente) y minuto (0 desactiva)
+    API_ORIGIN_RATE_LIMIT_PER_MINUTE: int = int(
+        os.getenv("API_ORIGIN_RATE_LIMIT_PER_MINUTE", "60")
+    )
+    # Caché en memoria de roles de usuario (segundos; 0 desactiva la caché)
+    USER_ROLE_CACHE_TTL: int = int(os.getenv("USER_ROLE_CACHE_TTL", "120"))
+    USER_ROLE_CACHE_MAX_ENTRIES: int = int(
+        os.getenv("USER_ROLE_CACHE_MAX_ENTRIES", "10000")
+    )
+    # Caché de resolución de enlaces cortos (/api/dl/{hash}): entradas, TTL
+    # (s; 0 desactiva la caché) y TTL de los hashes que no existen
+    SHORT_LINK_CACHE_SIZE: int = int(os.getenv("SHORT_LINK_CACHE_SIZE", "10000"))
+    SHORT_LINK_CACHE_TTL: int = int(os.getenv("SHORT_LINK_CACHE_TTL", "600"))
+    SHORT_LINK_NEGATIVE_TTL: int = int(os.getenv("SHORT_LINK_NEGATIVE_TTL", "60"))
+    # Máximo de enlaces por llamada a POST /api/facebook/links
+    SHORT_LINK_BATCH_MAX: int = int(os.getenv("SHORT_LINK_BATCH_MAX", "500"))
 
     # Otros ajustes
     MAX_IN_MEMORY_BYTES: int = int(os.getenv("MAX_IN_MEMORY_BYTES", "10485760"))
@@ -100,11 +125,89 @@ class BotConfig:
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
     ENABLE_PLUGINS: bool = os.getenv("ENABLE_PLUGINS", "true").lower() == "true"
     PLUGIN_DIRECTORY: str = os.getenv("PLUGIN_DIRECTORY", "plugins")
+    # Concurrencia adaptativa por host de origen (AIMD): límite inicial,
+    # mínimo y máximo, y latencia objetivo (s) hasta recibir cabeceras
+    HOST_CONCURRENCY_INITIAL: int = int(os.getenv("HOST_CONCURRENCY_INITIAL", "4"))
+    HOST_CONCURRENCY_MIN: int = int(os.getenv("HOST_CONCURRENCY_MIN", "1"))
+    HOST_CONCURRENCY_MAX: int = int(os.getenv("HOST_CONCURRENCY_MAX", "16"))
+    HOST_LATENCY_TARGET: float = float(os.getenv("HOST_LATENCY_TARGET", "5"))
+    # Pool de conexiones HTTP salientes (SessionManager): conexiones totales y
+    # por host, TTL de la caché DNS (0 la desactiva), keep-alive y timeouts
+    # de conexión y de lectura (s) por separado
+    HTTP_POOL_LIMIT: int = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+    HTTP_POOL_LIMIT_PER_HOST: int = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "16"))
+    HTTP_DNS_TTL: int = int(os.getenv("HTTP_DNS_TTL", "300"))
+    HTTP_KEEPALIVE_TIMEOUT: float = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+    HTTP_READ_TIMEOUT: float = float(
+        os.getenv("HTTP_READ_TIMEOUT", os.getenv("AIOHTTP_TIMEOUT", "60"))
+    )
+    # Compresión aceptada en las respuestas (feeds OPDS); añadir "br" solo si
+    # el paquete brotli está instalado
+    HTTP_ACCEPT_ENCODING: str = os.getenv("HTTP_ACCEPT_ENCODING", "gzip, deflate")
+    # Validación de enlaces acortados: "batch" (lote cada VALIDATOR_INTERVAL)
+    # o "continuous" (reparte las comprobaciones en ticks de VALIDATOR_TICK s
+    # para revisar cada enlace una vez por intervalo); comprobaciones
+    # simultáneas y espacio mínimo (s) entre peticiones a un mismo host
+    VALIDATOR_MODE: str = os.getenv("VALIDATOR_MODE", "batch").lower()
+    VALIDATOR_INTERVAL: int = int(os.getenv("VALIDATOR_INTERVAL", "3600"))
+    VALIDATOR_BATCH_SIZE: int = int(os.getenv("VALIDATOR_BATCH_SIZE", "50"))
+    VALIDATOR_TICK: float = float(os.getenv("VALIDATOR_TICK", "60"))
+    VALIDATOR_CONCURRENCY: int = int(os.getenv("VALIDATOR_CONCURRENCY", "10"))
+    VALIDATOR_HOST_INTERVAL: float = float(os.getenv("VALIDATOR_HOST_INTERVAL", "0.2"))
+    # Espera máxima (s) entre comprobaciones de un enlace que sigue roto
+    VALIDATOR_MAX_BACKOFF: int = int(os.getenv("VALIDATOR_MAX_BACKOFF", "604800"))
+    # Caché de feeds OPDS parseados (TTL en segundos; 0 desactiva la caché)
+    FEED_CACHE_TTL: int = int(os.getenv("FEED_CACHE_TTL", "300"))
+    FEED_CACHE_MAX_BYTES: int = int(os.getenv("FEED_CACHE_MAX_BYTES", "33554432"))
+    # Almacén persistente de EPUBs descargados (0 bytes desactiva el almacén)
+    EPUB_STORE_DIR: str = os.getenv("EPUB_STORE_DIR", "data/epub_store")
+    EPUB_STORE_MAX_BYTES: int = int(os.getenv("EPUB_STORE_MAX_BYTES", "2147483648"))
+    # Segundos tras los que una copia local se revalida contra el origen
+    EPUB_STORE_REVALIDATE: int = int(os.getenv("EPUB_STORE_REVALIDATE", "21600"))
+    # Caché de portadas del proxy /api/image (memoria + disco, TTL en segundos)
+    IMAGE_CACHE_DIR: str = os.getenv("IMAGE_CACHE_DIR", "data/image_cache")
+    IMAGE_CACHE_MEMORY_BYTES: int = int(
+        os.getenv("IMAGE_CACHE_MEMORY_BYTES", "16777216")
+    )
+    IMAGE_CACHE_MAX_BYTES: int = int(os.getenv("IMAGE_CACHE_MAX_BYTES", "268435456"))
+    IMAGE_CACHE_TTL: int = int(os.getenv("IMAGE_CACHE_TTL", "86400"))
+    # Miniaturas de portadas (?size= en /api/image)
+    THUMBNAIL_SIZES: str = os.getenv("THUMBNAIL_SIZES", "160,320")
+    THUMBNAIL_QUALITY: int = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+    THUMBNAIL_WORKERS: int = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+    # Ancho máximo de las portadas que se suben a Telegram (0 = sin cambios)
+    TELEGRAM_COVER_WIDTH: int = int(os.getenv("TELEGRAM_COVER_WIDTH", "1280"))
+    # Pool para inspeccionar EPUBs fuera del event loop ("thread" o "process")
+    EPUB_WORKER_MODE: str = os.getenv("EPUB_WORKER_MODE", "thread").lower()
+    EPUB_WORKERS: int = int(os.getenv("EPUB_WORKERS", "2"))
+    EPUB_PARSE_TIMEOUT: int = int(os.getenv("EPUB_PARSE_TIMEOUT", "60"))
+    # Validez (segundos) de los metadatos cacheados por URL cuando el almacén
+    # de EPUBs no puede confirmar que el contenido sigue siendo el mismo
+    EPUB_META_CACHE_TTL: int = int(os.getenv("EPUB_META_CACHE_TTL", "604800"))
+    # Estado por usuario en memoria: inactividad (s) tras la que se descarta,
+    # presupuesto total (bytes) y periodo del barrido (s)
+    STATE_IDLE_TTL: int = int(os.getenv("STATE_IDLE_TTL", "21600"))
+    STATE_MAX_BYTES: int = int(os.getenv("STATE_MAX_BYTES", "268435456"))
+    STATE_SWEEP_INTERVAL: int = int(os.getenv("STATE_SWEEP_INTERVAL", "300"))
+    # Dónde vive el estado: "memory" (un proceso) o "sqlite" (compartido entre
+    # réplicas; los EPUB en memoria se guardan como ficheros en STATE_BLOB_DIR)
+    STATE_BACKEND: str = os.getenv("STATE_BACKEND", "memory").lower()
+    STATE_DB_PATH: str = os.getenv("STATE_DB_PATH", "data/state.db")
+    STATE_BLOB_DIR: str = os.getenv("STATE_BLOB_DIR", "data/state_blobs")
     # Ruta para la base de datos de URL acortadas (puede ser absoluta o relativa).
     URL_CACHE_DB_PATH: str = os.getenv("URL_CACHE_DB_PATH", "data/url_cache.db")
+    # Pool de conexiones SQLite: lectores por fichero y sentencias preparadas por conexión
+    SQLITE_POOL_READERS: int = int(os.getenv("SQLITE_POOL_READERS", "4"))
+    SQLITE_STATEMENT_CACHE: int = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
     # Optional SQLAlchemy URL for external DB (Postgres, MySQL etc.). If provided
     # url_cache will prefer this over the local SQLite file.
     DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    # Pool de conexiones del engine compartido (solo bases de datos servidor)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
     @property
     def OPDS_ROOT_START(self) -> str:
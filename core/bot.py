@@ -1,16 +1,19 @@
 # core/bot.py
 
 import logging
+from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 from telegram.error import TimedOut
 from config.config_settings import config
 from core.session_manager import session_manager
+from core.state_manager import state_manager
 from handlers.command_handlers import CommandHandlers
 from handlers.callback_handlers import (
     set_destino,
@@ -34,6 +37,18 @@ async def error_handler(update, context):
     return
 
 
+async def refresh_user_state(update, context):
+    """Antes de los handlers: recarga el estado si otra réplica lo cambió."""
+    if update.effective_user:
+        state_manager.refresh(update.effective_user.id)
+
+
+async def persist_user_state(update, context):
+    """Después de los handlers: guarda el estado en el backend compartido."""
+    if update.effective_user:
+        state_manager.persist(update.effective_user.id)
+
+
 class ZeePubBot:
     """Clase principal del bot."""
 
@@ -42,6 +57,11 @@ class ZeePubBot:
         self.app = ApplicationBuilder().token(token).build()
         self.app.add_error_handler(error_handler)
 
+        # Estado compartido entre réplicas: sincronizar alrededor de cada update
+        if state_manager.backend.persistent:
+            self.app.add_handler(TypeHandler(Update, refresh_user_state), group=-100)
+            self.app.add_handler(TypeHandler(Update, persist_user_state), group=100)
+
         # Inicializar plugins manager (async init happens in initialize())
         self.plugin_manager = PluginManager()
         # attach plugin manager to app so handlers can access it
@@ -52,15 +72,23 @@ class ZeePubBot:
         # Handlers are registered in CommandHandlers.__init__
 
         # Callbacks
+        from utils.decorators import rate_limit
+
         self.app.add_handler(CallbackQueryHandler(set_destino, pattern="^destino"))
         self.app.add_handler(CallbackQueryHandler(buscar_epub, pattern="^buscar"))
-        self.app.add_handler(CallbackQueryHandler(abrir_zeepubs, pattern="^abrir"))
+        abrir = rate_limit("search", config.RATE_LIMIT_SEARCH_PER_MINUTE, key="search")(
+            abrir_zeepubs
+        )
+        self.app.add_handler(CallbackQueryHandler(abrir, pattern="^abrir"))
         
         # Log Level Interface
         from handlers.callback_handlers import set_log_level_callback
         self.app.add_handler(CallbackQueryHandler(set_log_level_callback, pattern="^setlog\\|"))
 
-        self.app.add_handler(CallbackQueryHandler(button_handler))
+        buttons = rate_limit("command", config.RATE_LIMIT_CALLBACKS_PER_MINUTE)(
+            button_handler
+        )
+        self.app.add_handler(CallbackQueryHandler(buttons))
 
         # Mini App handlers
         from handlers.webapp_handlers import (
@@ -133,10 +161,18 @@ class ZeePubBot:
         except Exception as e:
             logger.error(f"Error iniciando daily reset scheduler: {e}", exc_info=True)
 
+        # Barrido periódico de estados de usuario inactivos
+        from core.state_manager import start_state_sweeper
+
+        start_state_sweeper()
+
     async def stop_async(self):
         """Detiene el bot de forma asíncrona."""
         await self.app.updater.stop()
         await self.app.stop()
         await self.app.shutdown()
-        session_manager.close()
+        await session_manager.aclose()
+        from core.state_manager import stop_state_sweeper
+
+        stop_state_sweeper()
         logger.info("Bot detenido (API).")
@@ -2,41 +2,120 @@
 
 import aiohttp
 import asyncio
+import httpx
 import logging
+from typing import Any, Dict, Optional
+from config.config_settings import config
 
 
 class SessionManager:
-    """Gestión única de la sesión HTTP y locks por usuario."""
+    """
+    Gestión única de las conexiones HTTP salientes y locks por usuario.
+
+    `get_session` (aiohttp: OPDS, EPUBs, validación) y `get_http_client`
+    (httpx: portadas, Graph API de Facebook) comparten el mismo perfil de
+    pool definido en config: conexiones totales y por host, caché DNS,
+    keep-alive, compresión y timeouts de conexión/lectura por separado.
+    """
 
     def __init__(self):
-        self._session = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
         self._locks = {}  # Inicializar diccionario de locks
         self.logger = logging.getLogger(__name__)
 
+    def _default_headers(self) -> Dict[str, str]:
+        headers = {}
+        if config.HTTP_ACCEPT_ENCODING:
+            headers["Accept-Encoding"] = config.HTTP_ACCEPT_ENCODING
+        return headers
+
     def get_session(self) -> aiohttp.ClientSession:
         """Devuelve un único ClientSession, creándolo si es necesario."""
-        if self._session is None:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.HTTP_POOL_LIMIT,
+                limit_per_host=config.HTTP_POOL_LIMIT_PER_HOST,
+                use_dns_cache=config.HTTP_DNS_TTL > 0,
+                ttl_dns_cache=config.HTTP_DNS_TTL or None,
+                keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+                enable_cleanup_closed=True,
+            )
             self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=None)
+                connector=connector,
+                headers=self._default_headers(),
+                auto_decompress=True,
+                # Sin límite total: las descargas grandes solo cortan si el
+                # origen deja de enviar datos durante HTTP_READ_TIMEOUT
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    connect=config.HTTP_CONNECT_TIMEOUT,
+                    sock_read=config.HTTP_READ_TIMEOUT,
+                ),
             )
             self.logger.debug("Sesión HTTP creada.")
         return self._session
 
+    def get_http_client(self) -> httpx.AsyncClient:
+        """Cliente httpx compartido con el mismo perfil de pool."""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                follow_redirects=True,
+                headers=self._default_headers(),
+                timeout=httpx.Timeout(
+                    config.HTTP_READ_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT
+                ),
+                limits=httpx.Limits(
+                    max_connections=config.HTTP_POOL_LIMIT,
+                    max_keepalive_connections=config.HTTP_POOL_LIMIT_PER_HOST,
+                    keepalive_expiry=config.HTTP_KEEPALIVE_TIMEOUT,
+                ),
+            )
+        return self._http_client
+
     def get_publish_lock(self, uid: int) -> asyncio.Lock:
         """
         Obtiene un lock asyncio por usuario (idempotente).
         Permite serializar descargas/publicaciones por usuario.
+        El lock es de este proceso: no se comparte con otras réplicas aunque
+        el estado sí (STATE_BACKEND=sqlite).
         """
         if uid not in self._locks:
             self._locks[uid] = asyncio.Lock()
         return self._locks[uid]
 
-    def close(self):
-        """Cierra la sesión HTTP si existe."""
-        if self._session:
+    def stats(self) -> Dict[str, Any]:
+        """Uso del pool de conexiones de aiohttp (en uso / libres por host)."""
+        stats: Dict[str, Any] = {
+            "limit": config.HTTP_POOL_LIMIT,
+            "limit_per_host": config.HTTP_POOL_LIMIT_PER_HOST,
+            "in_use": 0,
+            "idle": 0,
+            "httpx": self._http_client is not None and not self._http_client.is_closed,
+        }
+        session = self._session
+        if session is None or session.closed:
+            return stats
+        connector = session.connector
+        # aiohttp no expone estos contadores públicamente
+        stats["in_use"] = len(getattr(connector, "_acquired", ()))
+        stats["idle"] = sum(len(v) for v in getattr(connector, "_conns", {}).values())
+        return stats
+
+    async def aclose(self):
+        """Cierra las conexiones (desde el event loop)."""
+        if self._session and not self._session.closed:
             self.logger.debug("Cerrando sesión HTTP.")
-            asyncio.get_event_loop().run_until_complete(self._session.close())
-            self._session = None
+            await self._session.close()
+        self._session = None
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    def close(self):
+        """Cierra la sesión HTTP si existe (fuera del event loop)."""
+        if self._session or self._http_client:
+            asyncio.get_event_loop().run_until_complete(self.aclose())
 
 
 # Instancia global
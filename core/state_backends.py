@@ -0,0 +1,242 @@
+# core/state_backends.py
+"""
+Backends de almacenamiento para el estado por usuario (ver StateManager).
+
+- MemoryStateBackend: el estado solo existe en el proceso (comportamiento
+  histórico; un único worker).
+- SQLiteStateBackend: el estado se serializa a JSON en un fichero SQLite
+  compartido, de modo que varias réplicas del bot/API ven el mismo estado.
+  Los blobs (`epub_buffer` en bytes) no se guardan en la fila: se escriben
+  en STATE_BLOB_DIR y la fila guarda la ruta, que el resto del código ya
+  sabe tratar igual que un temporal de descarga.
+
+Solo se comparte el estado: los locks por usuario de SessionManager
+(`get_publish_lock`) y los buckets del rate limiter siguen siendo de cada
+proceso, así que los updates de un mismo usuario deben llegar a una sola
+réplica del bot (un único polling/webhook); el API no usa ninguno de los dos.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+from utils.sqlite_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+_BLOB_KEY = "__blob__"
+# Diccionario con claves no str (p. ej. los índices int de `colecciones`):
+# se guarda como lista de pares para que JSON no convierta las claves a str
+_PAIRS_KEY = "__pairs__"
+_SKIP = object()
+# (clave, tipo) ya avisados, para no repetir el aviso en cada `save`
+_warned_skips = set()
+
+
+class StateBackend:
+    """Interfaz común. `persistent` indica si el estado sobrevive al proceso."""
+
+    persistent = False
+
+    def load(self, uid: int) -> Optional[Dict[str, Any]]:
+        return None
+
+    def version(self, uid: int) -> Optional[int]:
+        """Contador de escrituras de `uid` (None si no hay estado guardado)."""
+        return None
+
+    def save(self, uid: int, state: Dict[str, Any]) -> Optional[int]:
+        """Guarda el estado y devuelve su nueva versión."""
+        return None
+
+    def delete(self, uid: int) -> None:
+        pass
+
+    def purge(self, max_age: float) -> int:
+        """Borra los estados sin escribir desde hace `max_age` segundos."""
+        return 0
+
+
+class MemoryStateBackend(StateBackend):
+    """Sin almacenamiento externo: el diccionario del StateManager es el estado."""
+
+
+class SQLiteStateBackend(StateBackend):
+    """Estado serializado en SQLite, con los blobs guardados por referencia."""
+
+    persistent = True
+
+    def __init__(self, path: str, blob_dir: str):
+        self.path = path
+        self.blob_dir = blob_dir
+        with get_pool(path).write() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS user_state (
+                    telegram_id INTEGER PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 1,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    def _user_blob_dir(self, uid: int) -> str:
+        return os.path.join(self.blob_dir, str(uid))
+
+    def _blob_ref(self, uid: int, data: bytes) -> Dict[str, str]:
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        path = os.path.join(self._user_blob_dir(uid), f"{digest}.bin")
+        if not os.path.exists(path):
+            os.makedirs(self._user_blob_dir(uid), exist_ok=True)
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return {_BLOB_KEY: path}
+
+    def _encode(self, uid: int, value: Any, key: str = "") -> Any:
+        if isinstance(value, str) and value.startswith(
+            self._user_blob_dir(uid) + os.sep
+        ):
+            # Blob cargado previamente como ruta: sigue siendo una referencia
+            return {_BLOB_KEY: value}
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        if isinstance(value, (bytes, bytearray)):
+            return self._blob_ref(uid, bytes(value))
+        if isinstance(value, dict):
+            items = []
+            for k, v in value.items():
+                if k is not None and not isinstance(k, (str, int, float, bool)):
+                    self._warn_skip(uid, f"{key}[{k!r}]", k)
+                    continue
+                encoded = self._encode(uid, v, str(k))
+                if encoded is not _SKIP:
+                    items.append((k, encoded))
+            if all(isinstance(k, str) for k, _ in items):
+                return dict(items)
+            return {_PAIRS_KEY: [[k, v] for k, v in items]}
+        if isinstance(value, (list, tuple, set)):
+            return [
+                e for e in (self._encode(uid, v, key) for v in value) if e is not _SKIP
+            ]
+        self._warn_skip(uid, key, value)
+        return _SKIP
+
+    @staticmethod
+    def _warn_skip(uid: int, key: str, value: Any) -> None:
+        marker = (key, type(value).__name__)
+        if marker in _warned_skips:
+            logger.debug(f"Estado de {uid}: '{key}' no serializable, se omite")
+            return
+        _warned_skips.add(marker)
+        logger.warning(
+            f"Estado de {uid}: '{key}' ({type(value).__name__}) no es "
+            "serializable y no se guarda en el backend"
+        )
+
+    def _prune_blobs(self, uid: int, keep) -> None:
+        """Borra los blobs del usuario que el estado ya no referencia."""
+        try:
+            entries = list(os.scandir(self._user_blob_dir(uid)))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.path not in keep:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+
+    def _decode(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            if len(value) == 1 and _BLOB_KEY in value:
+                path = value[_BLOB_KEY]
+                # El blob puede haberse consumido (cleanup_tmp) en otra réplica
+                return path if os.path.exists(path) else None
+            if len(value) == 1 and _PAIRS_KEY in value:
+                return {k: self._decode(v) for k, v in value[_PAIRS_KEY]}
+            return {k: self._decode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._decode(v) for v in value]
+        return value
+
+    def load(self, uid: int) -> Optional[Dict[str, Any]]:
+        with get_pool(self.path).read() as conn:
+            row = conn.execute(
+                "SELECT data FROM user_state WHERE telegram_id = ?", (uid,)
+            ).fetchone()
+        if not row:
+            return None
+        try:
+            return self._decode(json.loads(row[0]))
+        except ValueError as e:
+            logger.error(f"Estado de {uid} corrupto, se descarta: {e}")
+            return None
+
+    def version(self, uid: int) -> Optional[int]:
+        with get_pool(self.path).read() as conn:
+            row = conn.execute(
+                "SELECT version FROM user_state WHERE telegram_id = ?", (uid,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def save(self, uid: int, state: Dict[str, Any]) -> Optional[int]:
+        encoded = self._encode(uid, state)
+        data = json.dumps(encoded, ensure_ascii=False)
+        with get_pool(self.path).write() as conn:
+            conn.execute(
+                "INSERT INTO user_state (telegram_id, data, updated_at) "
+                "VALUES (?, ?, ?) ON CONFLICT(telegram_id) DO UPDATE SET "
+                "data = excluded.data, version = version + 1, "
+                "updated_at = excluded.updated_at",
+                (uid, data, time.time()),
+            )
+            version = conn.execute(
+                "SELECT version FROM user_state WHERE telegram_id = ?", (uid,)
+            ).fetchone()[0]
+        self._prune_blobs(uid, set(_blob_paths(encoded)))
+        return version
+
+    def delete(self, uid: int) -> None:
+        with get_pool(self.path).write() as conn:
+            conn.execute("DELETE FROM user_state WHERE telegram_id = ?", (uid,))
+        self._prune_blobs(uid, set())
+
+    def purge(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        with get_pool(self.path).read() as conn:
+            uids = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT telegram_id FROM user_state WHERE updated_at < ?",
+                    (cutoff,),
+                )
+            ]
+        for uid in uids:
+            self.delete(uid)
+        return len(uids)
+
+
+def _blob_paths(value: Any):
+    if isinstance(value, dict):
+        if _BLOB_KEY in value and len(value) == 1:
+            yield value[_BLOB_KEY]
+            return
+        for v in value.values():
+            yield from _blob_paths(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _blob_paths(v)
+
+
+def create_state_backend(kind: str, path: str = "", blob_dir: str = "") -> StateBackend:
+    """Crea el backend configurado en STATE_BACKEND ("memory" o "sqlite")."""
+    if kind == "sqlite":
+        return SQLiteStateBackend(path, blob_dir)
+    if kind != "memory":
+        raise ValueError(f"STATE_BACKEND desconocido: {kind}")
+    return MemoryStateBackend()
@@ -1,38 +1,234 @@
 # core/state_manager.py
 
-from typing import Dict, Any
+import sys
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
 from config.config_settings import config
+from utils.http_client import cleanup_tmp
+from core.state_backends import StateBackend, MemoryStateBackend, create_state_backend
+
+logger = logging.getLogger(__name__)
+
+
+def _estimate_size(value: Any, depth: int = 0) -> int:
+    """Tamaño aproximado en memoria de un valor del estado (bytes)."""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    size = sys.getsizeof(value, 64)
+    if depth >= 4:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += _estimate_size(k, depth + 1) + _estimate_size(v, depth + 1)
+    elif isinstance(value, (list, tuple, set)):
+        for v in value:
+            size += _estimate_size(v, depth + 1)
+    return size
 
 
 class StateManager:
-    """Gestión de estado por usuario en memoria."""
+    """
+    Gestión de estado por usuario en memoria.
+
+    Los estados se guardan en orden de último acceso. Un barrido periódico
+    (`sweep`) expulsa los que llevan más de STATE_IDLE_TTL segundos sin usarse
+    y, si el total supera STATE_MAX_BYTES, los menos recientes hasta volver
+    al presupuesto. Al expulsar un estado se borra el EPUB temporal que
+    tuviera pendiente.
+
+    Con un backend persistente (STATE_BACKEND=sqlite) `user_state` es solo
+    la copia local: `refresh` la descarta si otra réplica escribió después
+    y `persist` la guarda al terminar cada update. Las copias locales que se
+    expulsan se pueden volver a cargar del backend.
+    """
+
+    def __init__(
+        self,
+        idle_ttl: float = 0,
+        max_bytes: int = 0,
+        backend: Optional[StateBackend] = None,
+    ):
+        self.user_state: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.backend = backend or MemoryStateBackend()
+        self._last_seen: Dict[int, float] = {}
+        self._versions: Dict[int, Optional[int]] = {}
+        self._bytes = 0
+        self.evicted_idle = 0
+        self.evicted_budget = 0
 
-    def __init__(self):
-        self.user_state: Dict[int, Dict[str, Any]] = {}
+    def _default_state(self) -> Dict[str, Any]:
+        return {
+            "historial": [],
+            "libros": {},
+            "colecciones": {},
+            "nav": {"prev": None, "next": None},
+            "titulo": "📚 Todas las bibliotecas",
+            "destino": None,
+            "chat_origen": None,
+            "message_thread_id": None,  # Para soporte de topics en grupos
+            "esperando_destino_manual": False,
+            "esperando_busqueda": False,
+            "esperando_password": False,
+            "ultima_pagina": None,
+            "opds_root": config.OPDS_ROOT_START,
+            "opds_root_base": config.OPDS_ROOT_START,
+            "series_id": None,
+            "volume_id": None,
+            "msg_que_hacer": None,
+        }
 
     def get_user_state(self, uid: int) -> Dict[str, Any]:
+        self._last_seen[uid] = time.monotonic()
         if uid not in self.user_state:
-            self.user_state[uid] = {
-                "historial": [],
-                "libros": {},
-                "colecciones": {},
-                "nav": {"prev": None, "next": None},
-                "titulo": "📚 Todas las bibliotecas",
-                "destino": None,
-                "chat_origen": None,
-                "message_thread_id": None,  # Para soporte de topics en grupos
-                "esperando_destino_manual": False,
-                "esperando_busqueda": False,
-                "esperando_password": False,
-                "ultima_pagina": None,
-                "opds_root": config.OPDS_ROOT_START,
-                "opds_root_base": config.OPDS_ROOT_START,
-                "series_id": None,
-                "volume_id": None,
-                "msg_que_hacer": None,
-            }
+            st = self._default_state()
+            if self.backend.persistent:
+                try:
+                    stored = self.backend.load(uid)
+                    if stored:
+                        st.update(stored)
+                    self._versions[uid] = self.backend.version(uid)
+                except Exception as e:
+                    logger.error(f"No se pudo cargar el estado de {uid}: {e}")
+            self.user_state[uid] = st
+        else:
+            self.user_state.move_to_end(uid)
         return self.user_state[uid]
 
+    def refresh(self, uid: int) -> None:
+        """Descarta la copia local si el backend tiene una versión distinta."""
+        if not self.backend.persistent or uid not in self.user_state:
+            return
+        try:
+            if self.backend.version(uid) != self._versions.get(uid):
+                self._drop_local(uid)
+        except Exception as e:
+            logger.error(f"No se pudo comprobar el estado de {uid}: {e}")
+
+    def persist(self, uid: int) -> None:
+        """Guarda la copia local en el backend (no hace nada en memoria)."""
+        st = self.user_state.get(uid)
+        if st is None or not self.backend.persistent:
+            return
+        try:
+            self._versions[uid] = self.backend.save(uid, st)
+        except Exception as e:
+            logger.error(f"No se pudo guardar el estado de {uid}: {e}")
+
+    def _drop_local(self, uid: int) -> None:
+        self.user_state.pop(uid, None)
+        self._last_seen.pop(uid, None)
+        self._versions.pop(uid, None)
+
+    def evict(self, uid: int) -> bool:
+        """Elimina el estado de un usuario y su EPUB temporal, si lo hay."""
+        st = self.user_state.get(uid)
+        self._drop_local(uid)
+        if self.backend.persistent:
+            try:
+                self.backend.delete(uid)
+            except Exception as e:
+                logger.error(f"No se pudo borrar el estado de {uid}: {e}")
+        if st is None:
+            return False
+        epub_buffer = st.get("epub_buffer")
+        if isinstance(epub_buffer, str):
+            cleanup_tmp(epub_buffer)
+        return True
+
+    def _release(self, uid: int) -> None:
+        # Con backend persistente la copia local sobra (quizá el usuario siga
+        # activo en otra réplica); en memoria el estado desaparece del todo
+        if self.backend.persistent:
+            self.persist(uid)
+            self._drop_local(uid)
+        else:
+            self.evict(uid)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Expulsa estados inactivos y ajusta al presupuesto. Devuelve cuántos."""
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        if self.idle_ttl > 0:
+            # user_state está en orden de acceso: los inactivos van primero
+            for uid in list(self.user_state):
+                if now - self._last_seen.get(uid, 0) < self.idle_ttl:
+                    break
+                self._release(uid)
+                self.evicted_idle += 1
+                evicted += 1
+            if self.backend.persistent:
+                try:
+                    self.backend.purge(max_age=self.idle_ttl)
+                except Exception as e:
+                    logger.error(f"No se pudieron purgar estados antiguos: {e}")
+
+        sizes = {uid: _estimate_size(st) for uid, st in self.user_state.items()}
+        self._bytes = sum(sizes.values())
+        if self.max_bytes > 0:
+            for uid in list(self.user_state):
+                if self._bytes <= self.max_bytes or len(self.user_state) <= 1:
+                    break
+                self._bytes -= sizes[uid]
+                self._release(uid)
+                self.evicted_budget += 1
+                evicted += 1
+        if evicted:
+            logger.debug(
+                f"StateManager: {evicted} estados expulsados, "
+                f"{len(self.user_state)} activos, {self._bytes} bytes"
+            )
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        """Usuarios vivos y bytes aproximados (según el último barrido)."""
+        return {
+            "users": len(self.user_state),
+            "bytes": self._bytes,
+            "evicted_idle": self.evicted_idle,
+            "evicted_budget": self.evicted_budget,
+        }
+
 
 # Instancia global
-state_manager = StateManager()
+state_manager = StateManager(
+    idle_ttl=config.STATE_IDLE_TTL,
+    max_bytes=config.STATE_MAX_BYTES,
+    backend=create_state_backend(
+        config.STATE_BACKEND, config.STATE_DB_PATH, config.STATE_BLOB_DIR
+    ),
+)
+
+_sweeper_task: Optional[asyncio.Task] = None
+
+
+async def _sweeper_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            state_manager.sweep()
+        except Exception as e:
+            logger.error(f"Error en el barrido de estados: {e}", exc_info=True)
+
+
+def start_state_sweeper(interval: Optional[float] = None):
+    """Inicia el barrido periódico de estados en el event loop actual."""
+    global _sweeper_task
+    if _sweeper_task and not _sweeper_task.done():
+        return _sweeper_task
+    interval = interval or config.STATE_SWEEP_INTERVAL
+    if interval <= 0:
+        return None
+    _sweeper_task = asyncio.get_event_loop().create_task(_sweeper_loop(interval))
+    return _sweeper_task
+
+
+def stop_state_sweeper():
+    global _sweeper_task
+    if _sweeper_task and not _sweeper_task.done():
+        _sweeper_task.cancel()
+    _sweeper_task = None
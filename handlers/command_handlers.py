@@ -18,8 +18,13 @@ logger = logging.getLogger(__name__)
 class CommandHandlers:
     def __init__(self, app):
         self.app = app
-        # Registrar handlers existentes
-        app.add_handler(CommandHandler("search", self.search))
+        from utils.decorators import rate_limit
+
+        # Registrar handlers existentes (las búsquedas comparten cupo)
+        search = rate_limit(
+            "search", config.RATE_LIMIT_SEARCH_PER_MINUTE, key="search"
+        )(self.search)
+        app.add_handler(CommandHandler("search", search))
         app.add_handler(CommandHandler("start", self.start))
         app.add_handler(CommandHandler("help", self.help))
         app.add_handler(CommandHandler("status", self.status))
@@ -305,7 +310,9 @@ class CommandHandlers:
             max_dl = config.MAX_DOWNLOADS_PER_DAY
 
         # Descargas usadas y restantes
-        used = st.get("downloads_used", 0)
+        from utils.download_limiter import downloads_used
+
+        used = downloads_used(uid)
 
         if max_dl is None:
             left_text = "✅ Descargas ilimitadas"
@@ -640,13 +647,9 @@ class CommandHandlers:
                 # PostgreSQL backend
                 try:
                     import sqlalchemy as sa
-                    from sqlalchemy import Table, MetaData
+                    from utils.database import get_engine, url_mappings
 
-                    engine = sa.create_engine(
-                        config.DATABASE_URL, future=True, pool_pre_ping=True
-                    )
-                    metadata = MetaData()
-                    url_mappings = Table("url_mappings", metadata, autoload_with=engine)
+                    engine = get_engine(config.DATABASE_URL)
 
                     with engine.begin() as conn:
                         # Check if exists
@@ -661,6 +664,9 @@ class CommandHandlers:
                                 url_mappings.c.hash == hash_to_purge
                             )
                             conn.execute(delete_stmt)
+                            from utils.url_cache import invalidate_link_cache
+
+                            invalidate_link_cache(hash_to_purge)
 
                             await update.message.reply_text(
                                 f"✅ Link con hash <code>{hash_to_purge}</code> eliminado de la caché.",
@@ -681,18 +687,15 @@ class CommandHandlers:
                     raise  # Re-raise to trigger the SQLite fallback below
             else:
                 # SQLite backend
-                from utils.url_cache import DB_PATH
-                import sqlite3
-
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
+                from utils.url_cache import DB_PATH, invalidate_link_cache
+                from utils.sqlite_pool import get_pool
 
-                cursor.execute(
-                    "DELETE FROM url_mappings WHERE hash = ?", (hash_to_purge,)
-                )
-                rows_deleted = cursor.rowcount
-                conn.commit()
-                conn.close()
+                with get_pool(DB_PATH).write() as conn:
+                    cursor = conn.execute(
+                        "DELETE FROM url_mappings WHERE hash = ?", (hash_to_purge,)
+                    )
+                    rows_deleted = cursor.rowcount
+                invalidate_link_cache(hash_to_purge)
 
                 if rows_deleted > 0:
                     await update.message.reply_text(
@@ -915,13 +918,9 @@ class CommandHandlers:
             return
 
         # Resetear descargas
-        from utils.download_limiter import save_download
-
-        user_state = state_manager.get_user_state(target_uid)
-        old_count = user_state.get("downloads_used", 0)
-        user_state["downloads_used"] = 0
+        from utils.download_limiter import downloads_used, save_download
 
-        # Actualizar persistencia
+        old_count = downloads_used(target_uid)
         save_download(target_uid, 0)
 
         await update.message.reply_text(
@@ -962,8 +961,8 @@ class CommandHandlers:
                 get_recent_links,
                 DB_PATH,
             )
+            from utils.sqlite_pool import get_pool
             import asyncio
-            import sqlite3
 
             # Validar solo 5 links recientes (reducido de 20 para evitar timeouts)
             recent_links = get_recent_links(limit=5)
@@ -1008,14 +1007,11 @@ class CommandHandlers:
                     )
 
                     # Obtener fecha de creación
-                    conn = sqlite3.connect(DB_PATH)
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "SELECT created_at FROM url_mappings WHERE hash = ?",
-                        (hash_val,),
-                    )
-                    created_row = cursor.fetchone()
-                    conn.close()
+                    with get_pool(DB_PATH).read() as conn:
+                        created_row = conn.execute(
+                            "SELECT created_at FROM url_mappings WHERE hash = ?",
+                            (hash_val,),
+                        ).fetchone()
                     created_date = created_row[0] if created_row else "Desconocida"
 
                     report += f"  • {title_short}\n"
@@ -1170,6 +1166,52 @@ class CommandHandlers:
                 except Exception:
                     parts.append(f"{k}: <unprintable>")
 
+        from services.epub_service import get_epub_pool
+
+        pool = get_epub_pool().stats()
+        parts.append(
+            f"epub_pool: {pool['mode']} x{pool['workers']}, "
+            f"running={pool['running']}, waiting={pool['waiting']}, "
+            f"queue_wait_avg={pool['queue_wait_avg']:.2f}s, "
+            f"timeouts={pool['timeouts']}"
+        )
+        states = state_manager.stats()
+        parts.append(
+            f"states: users={states['users']}, bytes={states['bytes']}, "
+            f"evicted_idle={states['evicted_idle']}, "
+            f"evicted_budget={states['evicted_budget']}"
+        )
+        from services.user_service import get_user_cache_stats
+
+        roles = get_user_cache_stats()
+        parts.append(
+            f"role_cache: size={roles['size']}, hits={roles['hits']}, "
+            f"misses={roles['misses']}, invalidations={roles['invalidations']}"
+        )
+        from utils.url_cache import get_link_cache_stats
+
+        links = get_link_cache_stats()
+        parts.append(
+            f"link_cache: size={links['size']}, hit_ratio={links['hit_ratio']:.0%}, "
+            f"hits={links['hits']}, negative_hits={links['negative_hits']}, "
+            f"misses={links['misses']}"
+        )
+        from core.session_manager import session_manager
+
+        http = session_manager.stats()
+        parts.append(
+            f"http_pool: in_use={http['in_use']}, idle={http['idle']}, "
+            f"limit={http['limit']}/{http['limit_per_host']} por host"
+        )
+        from utils.host_limiter import get_host_limiter_stats
+
+        for host, hs in get_host_limiter_stats().items():
+            parts.append(
+                f"origin {host}: limit={hs['limit']}, inflight={hs['inflight']}, "
+                f"waiting={sum(hs['waiting'].values())}, "
+                f"overloaded={hs['overloaded']}"
+            )
+
         text = "\n".join(parts)
         thread_id = get_thread_id(update)
         await context.bot.send_message(
@@ -1355,18 +1397,31 @@ class CommandHandlers:
                     )
                     return
 
-                # Sobrescribir el archivo de base de datos
-                db_path = config.URL_CACHE_DB_PATH
+                import asyncio as _asyncio
+
+                # La misma ruta (absoluta) que usan los pools de conexiones
+                from utils.url_cache import DB_PATH as db_path
+                from utils.sqlite_pool import backup_database, replace_database
+
+                # Descargar aparte: el fichero en uso no se toca hasta el final
+                restore_path = f"{db_path}.restore"
+                await file.download_to_drive(restore_path)
+                with open(restore_path, "rb") as f:
+                    if f.read(16) != b"SQLite format 3\x00":
+                        os.remove(restore_path)
+                        raise Exception("El archivo no es una base de datos SQLite")
 
                 # Backup de seguridad antes de sobrescribir
                 if os.path.exists(db_path):
-                    backup_path = f"{db_path}.bak"
-                    import shutil
+                    await _asyncio.to_thread(backup_database, db_path, f"{db_path}.bak")
 
-                    shutil.copy2(db_path, backup_path)
+                await _asyncio.to_thread(replace_database, db_path, restore_path)
 
-                await file.download_to_drive(db_path)
+            from services.user_service import invalidate_user_cache
+            from utils.url_cache import invalidate_link_cache
 
+            invalidate_user_cache()
+            invalidate_link_cache()
             await context.bot.edit_message_text(
                 chat_id=update.effective_chat.id,
                 message_id=msg.message_id,
@@ -1409,9 +1464,10 @@ class CommandHandlers:
             # Determinar si usar PostgreSQL o SQLite
             if config.DATABASE_URL:
                 # PostgreSQL usando SQLAlchemy
-                from sqlalchemy import create_engine, text
+                from sqlalchemy import text
+                from utils.database import get_engine
 
-                engine = create_engine(config.DATABASE_URL)
+                engine = get_engine(config.DATABASE_URL)
 
                 with engine.connect() as conn:
                     result = conn.execute(
@@ -1433,15 +1489,15 @@ class CommandHandlers:
 
             else:
                 # SQLite
-                import sqlite3
                 from utils.url_cache import DB_PATH
+                from utils.sqlite_pool import get_pool
 
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM url_mappings ORDER BY created_at DESC")
-                rows = cursor.fetchall()
-                columns = [description[0] for description in cursor.description]
-                conn.close()
+                with get_pool(DB_PATH).read() as conn:
+                    cursor = conn.execute(
+                        "SELECT * FROM url_mappings ORDER BY created_at DESC"
+                    )
+                    rows = cursor.fetchall()
+                    columns = [description[0] for description in cursor.description]
 
                 # Escribir CSV en thread pool para no bloquear el loop
                 import asyncio as _asyncio
@@ -0,0 +1,281 @@
+"""
+Caché persistente de metadatos extraídos de EPUBs.
+
+Guarda, por (hash del contenido, URL de origen), el dict que produce
+enrich_metadata_from_epub, la entrada del zip que contiene la portada y el
+tamaño del fichero. Así volver a elegir el mismo volumen no obliga a
+reparsear el OPF ni las páginas de título, y los flujos que solo necesitan
+metadatos (vista previa de Facebook) pueden evitar la descarga.
+Usa la misma base de datos que url_cache (SQLite o PostgreSQL).
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from config.config_settings import config
+from utils.sqlite_pool import get_pool
+from utils.database import get_engine, ensure_tables, epub_metadata
+
+# Optional SQLAlchemy support
+_HAS_SQLALCHEMY = False
+try:
+    import sqlalchemy as sa
+
+    _HAS_SQLALCHEMY = True
+except Exception:
+    sa = None
+
+logger = logging.getLogger(__name__)
+
+# Reusing the same DB path/configuration as url_cache
+_DEFAULT_DB = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "url_cache.db"
+)
+DB_PATH = config.URL_CACHE_DB_PATH or _DEFAULT_DB
+if not os.path.isabs(DB_PATH):
+    DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), DB_PATH)
+
+_COLUMNS = (
+    "content_hash",
+    "source_url",
+    "etag",
+    "size",
+    "cover_path",
+    "meta_json",
+    "updated_at",
+)
+
+
+@dataclass
+class CachedEpubMeta:
+    content_hash: str
+    source_url: str
+    meta: Dict[str, Any]
+    cover_path: Optional[str] = None
+    size: int = 0
+    etag: Optional[str] = None
+    updated_at: float = 0.0
+
+
+def _pool():
+    """Pool de conexiones compartido con url_cache (ver utils.sqlite_pool)."""
+    return get_pool(DB_PATH)
+
+
+def _get_sa_engine():
+    return get_engine(config.DATABASE_URL)
+
+
+def init_epub_meta_db():
+    """Inicializa la tabla epub_metadata."""
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        ensure_tables(_get_sa_engine(), epub_metadata)
+        return
+
+    with _pool().write() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS epub_metadata (
+                content_hash TEXT NOT NULL,
+                source_url TEXT NOT NULL,
+                etag TEXT,
+                size INTEGER DEFAULT 0,
+                cover_path TEXT,
+                meta_json TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, source_url)
+            )
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_epub_metadata_url "
+            "ON epub_metadata(source_url)"
+        )
+
+
+def _from_row(row) -> Optional[CachedEpubMeta]:
+    if not row:
+        return None
+    data = dict(zip(_COLUMNS, row))
+    try:
+        meta = json.loads(data.pop("meta_json"))
+    except (TypeError, ValueError):
+        return None
+    return CachedEpubMeta(meta=meta, **data)
+
+
+def _select(where_sql: str, params: tuple, sa_where) -> Optional[CachedEpubMeta]:
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        engine = _get_sa_engine()
+        table = epub_metadata
+        sel = (
+            sa.select(*[table.c[c] for c in _COLUMNS])
+            .where(sa_where(table))
+            .order_by(table.c.updated_at.desc())
+        )
+        with engine.connect() as conn:
+            return _from_row(conn.execute(sel).first())
+
+    with _pool().read() as conn:
+        row = conn.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM epub_metadata WHERE {where_sql} "
+            "ORDER BY updated_at DESC LIMIT 1",
+            params,
+        ).fetchone()
+        return _from_row(row)
+
+
+def get_epub_meta(content_hash: str, source_url: str) -> Optional[CachedEpubMeta]:
+    """Metadatos guardados para exactamente este contenido y esta URL."""
+    if not content_hash or not source_url:
+        return None
+    try:
+        return _select(
+            "content_hash = ? AND source_url = ?",
+            (content_hash, source_url),
+            lambda t: sa.and_(
+                t.c.content_hash == content_hash, t.c.source_url == source_url
+            ),
+        )
+    except Exception as e:
+        logger.error(f"Error getting EPUB metadata {content_hash}: {e}")
+        return None
+
+
+def get_epub_meta_by_url(source_url: str) -> Optional[CachedEpubMeta]:
+    """Última versión guardada para una URL, sin comprobar si sigue vigente."""
+    if not source_url:
+        return None
+    try:
+        return _select(
+            "source_url = ?",
+            (source_url,),
+            lambda t: t.c.source_url == source_url,
+        )
+    except Exception as e:
+        logger.error(f"Error getting EPUB metadata for {source_url}: {e}")
+        return None
+
+
+def save_epub_meta(
+    content_hash: str,
+    source_url: str,
+    meta: Dict[str, Any],
+    cover_path: Optional[str] = None,
+    size: int = 0,
+    etag: Optional[str] = None,
+):
+    """
+    Guarda los metadatos de un EPUB. Las versiones anteriores de la misma URL
+    (otro contenido) se eliminan.
+    """
+    if not content_hash or not source_url:
+        return
+    try:
+        meta_json = json.dumps(meta, ensure_ascii=False)
+    except (TypeError, ValueError) as e:
+        logger.debug(f"save_epub_meta: metadatos no serializables: {e}")
+        return
+    values = {
+        "etag": etag,
+        "size": size,
+        "cover_path": cover_path,
+        "meta_json": meta_json,
+        "updated_at": time.time(),
+    }
+
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        try:
+            engine = _get_sa_engine()
+            table = epub_metadata
+            with engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.source_url == source_url))
+                conn.execute(
+                    table.insert().values(
+                        content_hash=content_hash, source_url=source_url, **values
+                    )
+                )
+        except Exception as e:
+            logger.error(f"Error saving EPUB metadata {content_hash} (SQLAlchemy): {e}")
+        return
+
+    try:
+        with _pool().write() as conn:
+            conn.execute(
+                "DELETE FROM epub_metadata WHERE source_url = ?", (source_url,)
+            )
+            conn.execute(
+                f"INSERT INTO epub_metadata ({', '.join(_COLUMNS)}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, source_url, *values.values()),
+            )
+    except Exception as e:
+        logger.error(f"Error saving EPUB metadata {content_hash} (SQLite): {e}")
+
+
+def forget_epub_meta(source_url: str):
+    """Elimina los metadatos guardados para una URL."""
+    if not source_url:
+        return
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        try:
+            engine = _get_sa_engine()
+            table = epub_metadata
+            with engine.begin() as conn:
+                conn.execute(table.delete().where(table.c.source_url == source_url))
+        except Exception as e:
+            logger.error(f"Error deleting EPUB metadata {source_url} (SQLAlchemy): {e}")
+        return
+
+    try:
+        with _pool().write() as conn:
+            conn.execute(
+                "DELETE FROM epub_metadata WHERE source_url = ?", (source_url,)
+            )
+    except Exception as e:
+        logger.error(f"Error deleting EPUB metadata {source_url} (SQLite): {e}")
+
+
+def _is_current(entry: CachedEpubMeta) -> bool:
+    """
+    Comprueba que la entrada corresponde a lo que hoy sirve la URL. Si el
+    almacén de EPUBs conoce la URL manda su hash y su ETag. Si no, no se
+    consulta al origen: la entrada vale durante EPUB_META_CACHE_TTL segundos
+    desde que se guardó, aunque el EPUB haya cambiado entretanto.
+    """
+    from utils.epub_store import get_epub_store
+
+    store = get_epub_store()
+    hit = store.peek(entry.source_url) if store.enabled else None
+    if hit is not None:
+        if hit.sha != entry.content_hash:
+            return False
+        return not (hit.etag and entry.etag and hit.etag != entry.etag)
+    return (time.time() - entry.updated_at) < config.EPUB_META_CACHE_TTL
+
+
+async def lookup_epub_meta(source_url: str) -> Optional[CachedEpubMeta]:
+    """
+    Metadatos vigentes para `source_url` sin descargar ni abrir el EPUB,
+    o None si no hay entrada o ha quedado obsoleta.
+    """
+    entry = await asyncio.to_thread(get_epub_meta_by_url, source_url)
+    if entry is None:
+        return None
+    try:
+        if await asyncio.to_thread(_is_current, entry):
+            return entry
+    except Exception as e:
+        logger.debug(f"lookup_epub_meta: no se pudo validar {source_url}: {e}")
+    return None
+
+
+# Inicializar al importar
+try:
+    init_epub_meta_db()
+except Exception as e:
+    logger.error(f"Could not init EPUB metadata DB: {e}")
@@ -2,65 +2,392 @@
 
 import io
 import os
+import copy
+import asyncio
 import zipfile
+import logging
 import xml.etree.ElementTree as ET
-from typing import Optional, Dict, Any, Union
+from contextlib import contextmanager
+from functools import cached_property, lru_cache
+from typing import Optional, Dict, Any, List, Tuple, Union
+from config.config_settings import config
 from utils.helpers import limpiar_html_basico
+from utils.worker_pool import WorkerPool
 import re
 
-
-def extract_internal_title(data_or_path: Union[bytes, str]) -> Optional[str]:
+logger = logging.getLogger(__name__)
+
+
+# Patrones para el título interno (archivos 'title'/'titulo' del EPUB)
+_FULLTITLE_PAT = re.compile(
+    r'<(\w+)[^>]*epub:type="fulltitle"[^>]*>(.*?)</\1>',
+    re.IGNORECASE | re.DOTALL,
+)
+_TITLE_PAT = re.compile(r'epub:type="title"[^>]*>(.*?)<', re.IGNORECASE | re.DOTALL)
+_SUBTITLE_PAT = re.compile(
+    r'epub:type="subtitle"[^>]*>(.*?)<', re.IGNORECASE | re.DOTALL
+)
+_TITLE_LEGACY_PAT = re.compile(
+    r'<span[^>]*class="grande"[^>]*epub:type="title"[^>]*>(.*?)</span>',
+    re.IGNORECASE | re.DOTALL,
+)
+_TITLE_LOOSE_PAT = re.compile(
+    r'<span[^>]*epub:type="title"[^>]*>(.*?)</span>', re.IGNORECASE | re.DOTALL
+)
+
+# Patrones para la URL del publisher en las mismas páginas
+# <p class="salto1"><b>Página Web</b><br/><a href="...">
+_PUBLISHER_WEB_PAT = re.compile(
+    r'<p[^>]*class="salto1"[^>]*>.*?<b>Página Web</b>.*?<a[^>]+href="([^"]+)"',
+    re.IGNORECASE | re.DOTALL,
+)
+# <p class="salto1"><b>Redes sociales</b><br/><a href="...">
+_PUBLISHER_SOCIAL_PAT = re.compile(
+    r'<p[^>]*class="salto1"[^>]*>.*?<b>Redes sociales</b>.*?<a[^>]+href="([^"]+)"',
+    re.IGNORECASE | re.DOTALL,
+)
+
+_CONTAINER_ROOTFILE = "{urn:oasis:names:tc:opendocument:xmlns:container}rootfile"
+_OPF_NS = {"opf": "http://www.idpf.org/2007/opf"}
+
+
+def extract_internal_title(
+    data_or_path: Union[bytes, str, "EpubDocument"]
+) -> Optional[str]:
     """
     Busca un título interno en archivos 'title' o 'titulo' dentro del EPUB.
     Prioriza <... epub:type="fulltitle"> y combina title/subtitle.
     Fallback a <span class="grande" epub:type="title">.
     """
     try:
+        with _document(data_or_path) as doc:
+            return doc.internal_title()
+    except Exception:
+        return None
+
+
+_DEMOGRAPHY_KEYS = {"seinen", "shounen", "shônen", "shoujo", "josei", "juvenil"}
+_MAQUET_ROLES = {"mrk", "dst", "mqt", "mkr"}
+_OPF_PROPERTY = "{http://www.idpf.org/2007/opf}property"
+_OPF_REFINES = "{http://www.idpf.org/2007/opf}refines"
+_OPF_CHUNK = 16 * 1024
+
+
+@lru_cache(maxsize=512)
+def _local_name(tag: str) -> str:
+    """Nombre local en minúsculas sin namespace ('{ns}Title' -> 'title')."""
+    if not isinstance(tag, str):
+        # Comentarios / processing instructions
+        return ""
+    return (tag.split("}", 1)[-1] if "}" in tag else tag).lower()
+
+
+def _parse_date(raw_date: str) -> str:
+    try:
+        if "T" in raw_date:
+            dt_str = raw_date.split("T")[0]
+            parts = dt_str.split("-")
+            if len(parts) == 3:
+                return f"{parts[2]}-{parts[1]}-{parts[0]}"
+        else:
+            parts = raw_date.split("-")
+            if len(parts) == 3:
+                return f"{parts[2]}-{parts[1]}-{parts[0]}"
+    except Exception:
+        pass
+    return raw_date
+
+
+def _opf_metadata_root(data: bytes) -> Tuple[ET.Element, ET.Element]:
+    """
+    Parsea el OPF de forma incremental y se detiene al cerrar <metadata>:
+    manifest y spine (lo más voluminoso del OPF) no llegan a parsearse.
+    Retorna (package, metadata); si no hay bloque <metadata>, ambos son la raíz.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    package = None
+    depth = 0
+    for offset in range(0, len(data), _OPF_CHUNK):
+        parser.feed(data[offset : offset + _OPF_CHUNK])
+        for event, el in parser.read_events():
+            if event == "start":
+                depth += 1
+                if package is None:
+                    package = el
+            else:
+                depth -= 1
+                if depth == 1 and _local_name(el.tag) == "metadata":
+                    return package, el
+    root = parser.close()
+    return root, root
+
+
+def _parse_opf_metadata(data: bytes) -> Dict[str, Any]:
+    """Parsea el OPF (solo hasta <metadata>) y extrae sus metadatos."""
+    root, metadata = _opf_metadata_root(data)
+    return _extract_opf_metadata(root, metadata)
+
+
+def _extract_opf_metadata(root: ET.Element, metadata: ET.Element) -> Dict[str, Any]:
+    """
+    Extrae los metadatos del OPF recorriendo el árbol una sola vez.
+    Cada elemento se despacha por su nombre local; los campos de "primer
+    valor" se rellenan con el primer elemento que los satisface.
+    """
+    out: Dict[str, Any] = {
+        "titulo_volumen": None,
+        "titulo_serie": None,
+        "autores": [],
+        "ilustrador": None,
+        "generos": [],
+        "demografia": [],
+        "categoria": None,
+        "maquetadores": [],
+        "traductor": None,
+        "publisher": None,
+        "publisher_url": None,
+        "sinopsis": None,
+        "epub_version": None,
+        "fecha_modificacion": None,
+        "fecha_publicacion": None,
+    }
+
+    # Version EPUB: <package version="...">
+    out["epub_version"] = root.attrib.get("version")
+    logger.debug(f"EPUB version extracted: {out['epub_version']}")
+
+    found = set()  # campos de "primer valor" ya resueltos
+    contributors = []
+    id_to_name: Dict[str, str] = {}
+    roles: Dict[str, str] = {}
+
+    for el in metadata.iter():
+        ln = _local_name(el.tag)
+        text = el.text
+
+        if ln == "meta":
+            if "modified" not in found and text:
+                # dcterms:modified, con property o name (ignorando namespaces)
+                attribs = {_local_name(k): v for k, v in el.attrib.items()}
+                kinds = (attribs.get("property", ""), attribs.get("name", ""))
+                if any("modified" in kind for kind in kinds):
+                    out["fecha_modificacion"] = _parse_date(text.strip())
+                    found.add("modified")
+            prop = el.attrib.get("property", "") or el.attrib.get(_OPF_PROPERTY, "")
+            if prop == "belongs-to-collection":
+                if "serie" not in found and text:
+                    out["titulo_serie"] = text.strip()
+                    found.add("serie")
+            elif prop.lower() == "role":
+                ref = el.attrib.get("refines", "") or el.attrib.get(_OPF_REFINES, "")
+                if ref and text:
+                    roles[ref.lstrip("#")] = text.strip().lower()
+
+        elif ln == "date":
+            # Primera dc:date; una posterior con event="publication" la reemplaza
+            if "date" not in found and text:
+                attribs = {_local_name(k): v for k, v in el.attrib.items()}
+                event = attribs.get("event", "")
+                parsed = _parse_date(text.strip())
+                if not out["fecha_publicacion"]:
+                    out["fecha_publicacion"] = parsed
+                elif event == "publication":
+                    out["fecha_publicacion"] = parsed
+                    found.add("date")
+
+        elif ln == "title":
+            if "title" not in found and text:
+                out["titulo_volumen"] = text.strip()
+                found.add("title")
+
+        elif ln == "creator":
+            name = (text or "").strip()
+            if name:
+                out["autores"].append(name)
+                cid = el.attrib.get("id")
+                if cid:
+                    id_to_name[cid] = name
+
+        elif ln == "contributor":
+            name = (text or "").strip()
+            if name:
+                contributors.append(name)
+                cid = el.attrib.get("id")
+                if cid:
+                    id_to_name[cid] = name
+
+        elif ln == "subject":
+            if text:
+                subject = text.strip()
+                if any(k in subject.lower() for k in _DEMOGRAPHY_KEYS):
+                    out["demografia"].append(subject)
+                else:
+                    out["generos"].append(subject)
+
+        elif ln in ("description", "summary"):
+            if "sinopsis" not in found and text:
+                out["sinopsis"] = limpiar_html_basico(text.strip())
+                found.add("sinopsis")
+
+        elif ln == "type":
+            if "categoria" not in found and text:
+                out["categoria"] = text.strip()
+                found.add("categoria")
+
+        elif ln == "publisher":
+            if "publisher" not in found and text:
+                out["publisher"] = text.strip()
+                found.add("publisher")
+
+        elif ln == "identifier":
+            # Publisher URL: dc:identifier con http o urn:uri
+            if "publisher_url" not in found and text:
+                txt = text.strip()
+                if txt.startswith("http") or txt.startswith("urn:uri:"):
+                    if txt.startswith("urn:uri:"):
+                        parts = txt.split(":", 2)
+                        txt = parts[-1] if len(parts) == 3 else txt
+                    out["publisher_url"] = txt
+                    found.add("publisher_url")
+
+    # Asignar roles
+    for rid, role in roles.items():
+        name = id_to_name.get(rid)
+        if not name:
+            continue
+        if role in _MAQUET_ROLES:
+            out["maquetadores"].append(name)
+        elif role in ("trl", "translator"):
+            out["traductor"] = name
+        elif role in ("ill", "illustrator", "artist"):
+            out["ilustrador"] = name
+        elif role in ("aut", "author") and not out["autores"]:
+            out["autores"].append(name)
+
+    # Heurísticas si falta ilustrador o maquetadores
+    if not out["ilustrador"]:
+        for c in contributors:
+            if any(tok in c.lower() for tok in ("ill", "artist")):
+                out["ilustrador"] = c
+                break
+    if not out["maquetadores"]:
+        for c in contributors:
+            if any(tok in c.lower() for tok in ("saosora", "zeepub")):
+                out["maquetadores"].append(c)
+        if not out["maquetadores"]:
+            out["maquetadores"].extend(contributors)
+
+    # Dedupe maquetadores
+    out["maquetadores"] = list(dict.fromkeys(out["maquetadores"]))
+    return out
+
+
+class EpubDocument:
+    """
+    EPUB abierto una sola vez. El directorio del zip, container.xml y el OPF
+    se leen y parsean bajo demanda y se reutilizan para título interno,
+    metadatos, URL del publisher y portada.
+    """
+
+    def __init__(self, data_or_path: Union[bytes, str]):
         if isinstance(data_or_path, (bytes, bytearray)):
-            zf = zipfile.ZipFile(io.BytesIO(data_or_path))
+            self._zf = zipfile.ZipFile(io.BytesIO(data_or_path))
         else:
-            zf = zipfile.ZipFile(data_or_path)
+            self._zf = zipfile.ZipFile(data_or_path)
+        self._texts: Dict[str, str] = {}
 
-        # Buscar archivos candidatos
-        candidates = [
-            n for n in zf.namelist() if "title" in n.lower() or "titulo" in n.lower()
-        ]
+    def close(self) -> None:
+        self._zf.close()
 
-        # Regex para fulltitle: <tag ... epub:type="fulltitle" ...> content </tag>
-        fulltitle_pattern = re.compile(
-            r'<(\w+)[^>]*epub:type="fulltitle"[^>]*>(.*?)</\1>',
-            re.IGNORECASE | re.DOTALL,
-        )
+    def __enter__(self) -> "EpubDocument":
+        return self
 
-        # Regex para componentes internos
-        title_pat = re.compile(
-            r'epub:type="title"[^>]*>(.*?)<', re.IGNORECASE | re.DOTALL
-        )
-        subtitle_pat = re.compile(
-            r'epub:type="subtitle"[^>]*>(.*?)<', re.IGNORECASE | re.DOTALL
-        )
+    def __exit__(self, *exc) -> None:
+        self.close()
 
-        # Regex legacy/fallback
-        pattern_legacy = re.compile(
-            r'<span[^>]*class="grande"[^>]*epub:type="title"[^>]*>(.*?)</span>',
-            re.IGNORECASE | re.DOTALL,
-        )
-        pattern_loose = re.compile(
-            r'<span[^>]*epub:type="title"[^>]*>(.*?)</span>', re.IGNORECASE | re.DOTALL
-        )
+    # --- Entradas del zip -------------------------------------------------
+
+    @cached_property
+    def names(self) -> List[str]:
+        return self._zf.namelist()
+
+    @cached_property
+    def _lower_map(self) -> Dict[str, str]:
+        return {n.lower(): n for n in self.names}
 
-        for name in candidates:
+    def resolve(self, name: str) -> str:
+        """Nombre real de una entrada, sin distinguir mayúsculas."""
+        return self._lower_map.get(name.lower(), name)
+
+    def read(self, name: str) -> bytes:
+        return self._zf.read(self.resolve(name))
+
+    def read_text(self, name: str) -> str:
+        if name not in self._texts:
+            self._texts[name] = self.read(name).decode("utf-8", errors="ignore")
+        return self._texts[name]
+
+    @cached_property
+    def title_pages(self) -> List[str]:
+        """Archivos candidatos a contener el título interno ('title'/'titulo')."""
+        return [n for n in self.names if "title" in n.lower() or "titulo" in n.lower()]
+
+    # --- OPF --------------------------------------------------------------
+
+    @cached_property
+    def opf_path(self) -> Optional[str]:
+        # Leer container.xml para ubicar el .opf
+        try:
+            tree = ET.fromstring(self._zf.read("META-INF/container.xml"))
+            for rf in tree.iter(_CONTAINER_ROOTFILE):
+                path = rf.attrib.get("full-path", "")
+                if path.lower().endswith(".opf"):
+                    return self.resolve(path)
+        except Exception:
+            pass
+        # Fallback: primer .opf en el zip
+        for name in self.names:
+            if name.lower().endswith(".opf"):
+                return name
+        return None
+
+    @cached_property
+    def opf_root(self) -> Optional[ET.Element]:
+        if not self.opf_path:
+            return None
+        return ET.fromstring(self.read(self.opf_path))
+
+    @cached_property
+    def _metadata(self) -> Optional[Dict[str, Any]]:
+        root = self.opf_root
+        if root is None:
+            return None
+        metadata = next((el for el in root if _local_name(el.tag) == "metadata"), root)
+        return _extract_opf_metadata(root, metadata)
+
+    def metadata(self) -> Optional[Dict[str, Any]]:
+        """Metadatos OPF (mismo dict que parse_opf_from_epub) o None."""
+        try:
+            meta = self._metadata
+        except Exception:
+            return None
+        return copy.deepcopy(meta) if meta is not None else None
+
+    # --- Extracciones -----------------------------------------------------
+
+    def internal_title(self) -> Optional[str]:
+        for name in self.title_pages:
             try:
-                content = zf.read(name).decode("utf-8", errors="ignore")
+                content = self.read_text(name)
 
                 # 1. Intentar fulltitle
-                match = fulltitle_pattern.search(content)
+                match = _FULLTITLE_PAT.search(content)
                 if match:
                     inner_html = match.group(2)
 
                     # Buscar title y subtitle dentro
-                    t_match = title_pat.search(inner_html)
-                    s_match = subtitle_pat.search(inner_html)
+                    t_match = _TITLE_PAT.search(inner_html)
+                    s_match = _SUBTITLE_PAT.search(inner_html)
 
                     if t_match and s_match:
                         t_text = re.sub(r"<[^>]+>", "", t_match.group(1)).strip()
@@ -79,363 +406,183 @@ def extract_internal_title(data_or_path: Union[bytes, str]) -> Optional[str]:
                         return clean
 
                 # 2. Fallback a lógica anterior
-                match = pattern_legacy.search(content)
+                match = _TITLE_LEGACY_PAT.search(content)
                 if not match:
-                    match = pattern_loose.search(content)
+                    match = _TITLE_LOOSE_PAT.search(content)
 
                 if match:
                     text = re.sub(r"<[^>]+>", "", match.group(1)).strip()
                     return text
             except Exception:
                 continue
-
-        return None
-    except Exception:
         return None
 
+    def publisher_url(self) -> Optional[str]:
+        for name in self.title_pages:
+            try:
+                content = self.read_text(name)
 
-async def parse_opf_from_epub(data_or_path: Union[bytes, str]) -> Dict[str, Any]:
-    """
-    Extrae metadatos OPF de un EPUB (bytes o ruta) usando namespaces y heurísticas.
-    Retorna dict con claves:
-      titulo_volumen, titulo_serie, autores (list), ilustrador, generos (list),
-      demografia (list), categoria, maquetadores (list), traductor, publisher,
-      publisher_url, sinopsis.
-    """
+                # 1. Intentar Página Web
+                match_web = _PUBLISHER_WEB_PAT.search(content)
+                if match_web:
+                    return match_web.group(1).strip()
 
-    def _read_opf(z: zipfile.ZipFile) -> Optional[bytes]:
-        # Leer container.xml para ubicar el .opf
-        try:
-            container = z.read("META-INF/container.xml")
-            tree = ET.fromstring(container)
-            for rf in tree.findall(
-                ".//{urn:oasis:names:tc:opendocument:xmlns:container}rootfile"
-            ):
-                path = rf.attrib.get("full-path", "")
-                if path.lower().endswith(".opf"):
-                    return z.read(path)
-        except Exception:
-            pass
-        # Fallback: primer .opf en el zip
-        for name in z.namelist():
-            if name.lower().endswith(".opf"):
-                return z.read(name)
+                # 2. Intentar Redes sociales
+                match_social = _PUBLISHER_SOCIAL_PAT.search(content)
+                if match_social:
+                    return match_social.group(1).strip()
+            except Exception:
+                continue
         return None
 
-    def local_name(elem: ET.Element) -> str:
-        tag = elem.tag
-        return tag.split("}", 1)[-1] if "}" in tag else tag
-
-    def local_name_attr(attr_name: str) -> str:
-        return attr_name.split("}", 1)[-1] if "}" in attr_name else attr_name
-
-    def parse_date(raw_date: str) -> str:
+    def cover(self) -> Optional[bytes]:
+        """
+        Bytes de la portada embebida: primero <meta property="cover"> y luego
+        cualquier image/* con 'cover' en id o href. None si no la halla.
+        """
+        path = self.cover_path()
+        if not path:
+            return None
         try:
-            if "T" in raw_date:
-                dt_str = raw_date.split("T")[0]
-                parts = dt_str.split("-")
-                if len(parts) == 3:
-                    return f"{parts[2]}-{parts[1]}-{parts[0]}"
-            else:
-                parts = raw_date.split("-")
-                if len(parts) == 3:
-                    return f"{parts[2]}-{parts[1]}-{parts[0]}"
+            return self.read(path)
         except Exception:
-            pass
-        return raw_date
-
-    def _parse_opf(data: bytes) -> Dict[str, Any]:
-        import logging
-
-        logger = logging.getLogger(__name__)
-
-        root = ET.fromstring(data)
-        out: Dict[str, Any] = {
-            "titulo_volumen": None,
-            "titulo_serie": None,
-            "autores": [],
-            "ilustrador": None,
-            "generos": [],
-            "demografia": [],
-            "categoria": None,
-            "maquetadores": [],
-            "traductor": None,
-            "publisher": None,
-            "publisher_url": None,
-            "sinopsis": None,
-            "epub_version": None,
-            "fecha_modificacion": None,
-            "fecha_publicacion": None,
-        }
-
-        # Version EPUB: <package version="...">
-        # root es el elemento <package>
-        version = root.attrib.get("version")
-        out["epub_version"] = version
-        logger.debug(f"EPUB version extracted: {version}")
-
-        # Fecha modificación: dcterms:modified
-        # Ejemplo: <meta property="dcterms:modified">2022-07-03T10:28:12Z</meta>
-        for el in root.iter():
-            ln = local_name(el).lower()
-            if ln == "meta":
-                # Obtener atributos property y name ignorando namespaces
-                attribs = {local_name_attr(k).lower(): v for k, v in el.attrib.items()}
-                prop = attribs.get("property", "")
-                name = attribs.get("name", "")
-
-                if "modified" in prop or "modified" in name:
-                    if el.text:
-                        raw_date = el.text.strip()
-                        out["fecha_modificacion"] = parse_date(raw_date)
-                        logger.debug(
-                            f"Modified date found: {raw_date} -> {out['fecha_modificacion']}"
-                        )
-                        break
+            return None
 
-        # Fecha publicación: dc:date
-        # Ejemplo: <dc:date>2020-07-02T00:00:00Z</dc:date>
-        for el in root.iter():
-            ln = local_name(el).lower()
-            if ln == "date":
-                # Verificar si es dc:date (aunque local_name ya lo filtra, aseguramos que sea fecha)
-                if el.text:
-                    raw_date = el.text.strip()
-                    # Si ya tenemos una fecha, solo sobrescribimos si el evento es 'publication'
-                    attribs = {
-                        local_name_attr(k).lower(): v for k, v in el.attrib.items()
-                    }
-                    event = attribs.get("event", "")
-
-                    parsed = parse_date(raw_date)
-                    if not out["fecha_publicacion"]:
-                        out["fecha_publicacion"] = parsed
-                        logger.debug(f"Publication date found: {raw_date} -> {parsed}")
-                    elif event == "publication":
-                        out["fecha_publicacion"] = parsed
-                        logger.debug(
-                            f"Publication date (event=publication) found: {raw_date} -> {parsed}"
-                        )
+    def cover_path(self) -> Optional[str]:
+        """Entrada del zip que contiene la portada (ver cover()) o None."""
+        try:
+            root = self.opf_root
+            if root is None:
+                return None
+
+            # meta cover id
+            cover_id = None
+            for m in root.iterfind(".//opf:meta", _OPF_NS):
+                if m.attrib.get("property", "").lower() == "cover":
+                    cover_id = m.attrib.get("content")
+                    break
+
+            # manifest lookup
+            manifest = root.findall(".//opf:item", _OPF_NS)
+            target_href = None
+            if cover_id:
+                for item in manifest:
+                    if item.attrib.get("id") == cover_id:
+                        target_href = item.attrib.get("href")
+                        break
+            if not target_href:
+                for item in manifest:
+                    href = item.attrib.get("href", "").lower()
+                    iid = item.attrib.get("id", "").lower()
+                    mt = item.attrib.get("media-type", "")
+                    if mt.startswith("image/") and "cover" in (iid + href):
+                        target_href = item.attrib.get("href")
                         break
 
-        # Título volumen: primer <dc:title> o <title>
-        for el in root.iter():
-            if local_name(el).lower() == "title" and el.text:
-                out["titulo_volumen"] = el.text.strip()
-                break
+            if not target_href:
+                return None
 
-        # Título serie: <meta property="belongs-to-collection">
-        for el in root.iter():
-            if local_name(el).lower() == "meta":
-                prop = el.attrib.get("property", "") or el.attrib.get(
-                    "{http://www.idpf.org/2007/opf}property", ""
-                )
-                if prop == "belongs-to-collection" and el.text:
-                    out["titulo_serie"] = el.text.strip()
-                    break
+            base = os.path.dirname(self.opf_path)
+            return self.resolve(f"{base}/{target_href}".lstrip("/"))
+        except Exception:
+            return None
 
-        # Creators & contributors
-        contributors = []
-        id_to_name: Dict[str, str] = {}
-        for el in root.iter():
-            ln = local_name(el).lower()
-            if ln in ("creator", "dc:creator"):
-                text = (el.text or "").strip()
-                if text:
-                    out["autores"].append(text)
-                cid = el.attrib.get("id")
-                if cid and text:
-                    id_to_name[cid] = text
-            elif ln in ("contributor", "dc:contributor"):
-                text = (el.text or "").strip()
-                if text:
-                    contributors.append(text)
-                cid = el.attrib.get("id")
-                if cid and text:
-                    id_to_name[cid] = text
-
-        # Subjects => géneros y demografía
-        subjects = [
-            (el.text or "").strip()
-            for el in root.iter()
-            if local_name(el).lower() in ("subject", "dc:subject") and el.text
-        ]
-        dem_keys = {"seinen", "shounen", "shônen", "shoujo", "josei", "juvenil"}
-        for s in subjects:
-            if any(k in s.lower() for k in dem_keys):
-                out["demografia"].append(s)
-            else:
-                out["generos"].append(s)
 
-        # Sinopsis: dc:description, description o summary
-        for el in root.iter():
-            ln = local_name(el).lower()
-            if ln in ("description", "dc:description", "summary") and el.text:
-                out["sinopsis"] = limpiar_html_basico(el.text.strip())
-                break
+@contextmanager
+def _document(data_or_path: Union[bytes, str, EpubDocument]):
+    """Reutiliza un EpubDocument ya abierto o abre uno temporal."""
+    if isinstance(data_or_path, EpubDocument):
+        yield data_or_path
+    else:
+        with EpubDocument(data_or_path) as doc:
+            yield doc
+
+
+_pool: Optional[WorkerPool] = None
+
+
+def get_epub_pool() -> WorkerPool:
+    """Pool de trabajadores para inspeccionar EPUBs (EPUB_WORKER_MODE/EPUB_WORKERS)."""
+    global _pool
+    if _pool is None:
+        mode = config.EPUB_WORKER_MODE
+        if mode not in ("thread", "process"):
+            logger.error(f"EPUB_WORKER_MODE inválido ({mode!r}), usando 'thread'")
+            mode = "thread"
+        _pool = WorkerPool(
+            "epub",
+            mode=mode,
+            workers=config.EPUB_WORKERS,
+            timeout=config.EPUB_PARSE_TIMEOUT,
+        )
+    return _pool
 
-        # Categoría: dc:type
-        for el in root.iter():
-            if local_name(el).lower() in ("type", "dc:type") and el.text:
-                out["categoria"] = el.text.strip()
-                break
 
-        # Publisher
-        for el in root.iter():
-            if local_name(el).lower() in ("publisher", "dc:publisher") and el.text:
-                out["publisher"] = el.text.strip()
-                break
+async def _run_in_pool(fn, *args, fallback=None):
+    """
+    Ejecuta fn(*args) en el pool de EPUB. Si supera el timeout o falla,
+    devuelve fallback() (o None) en lugar de propagar el error.
+    """
+    try:
+        return await get_epub_pool().run(fn, *args)
+    except asyncio.TimeoutError:
+        logger.warning(f"{fn.__name__}: timeout inspeccionando EPUB")
+    except Exception as e:
+        logger.error(f"{fn.__name__}: error en el pool de EPUB: {e}")
+    return fallback() if fallback else None
 
-        # Publisher URL: dc:identifier con http o urn:uri
-        for el in root.iter():
-            if local_name(el).lower() in ("identifier", "dc:identifier") and el.text:
-                txt = el.text.strip()
-                if txt.startswith("http") or txt.startswith("urn:uri:"):
-                    if txt.startswith("urn:uri:"):
-                        parts = txt.split(":", 2)
-                        txt = parts[-1] if len(parts) == 3 else txt
-                    out["publisher_url"] = txt
-                    break
 
-        # Roles meta: map id->role
-        roles: Dict[str, str] = {}
-        for el in root.iter():
-            if local_name(el).lower() == "meta":
-                prop = el.attrib.get("property", "") or el.attrib.get(
-                    "{http://www.idpf.org/2007/opf}property", ""
-                )
-                if prop.lower() == "role":
-                    ref = el.attrib.get("refines", "") or el.attrib.get(
-                        "{http://www.idpf.org/2007/opf}refines", ""
-                    )
-                    if ref and el.text:
-                        roles[ref.lstrip("#")] = el.text.strip().lower()
-
-        # Asignar roles
-        maquet_roles = {"mrk", "dst", "mqt", "mkr"}
-        for rid, role in roles.items():
-            name = id_to_name.get(rid)
-            if not name:
-                continue
-            if role in maquet_roles:
-                out["maquetadores"].append(name)
-            elif role in ("trl", "translator"):
-                out["traductor"] = name
-            elif role in ("ill", "illustrator", "artist"):
-                out["ilustrador"] = name
-            elif role in ("aut", "author") and not out["autores"]:
-                out["autores"].append(name)
+def shutdown_epub_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
 
-        # Heurísticas si falta ilustrador o maquetadores
-        if not out["ilustrador"]:
-            for c in contributors:
-                if any(tok in c.lower() for tok in ("ill", "artist")):
-                    out["ilustrador"] = c
-                    break
-        if not out["maquetadores"]:
-            for c in contributors:
-                if any(tok in c.lower() for tok in ("saosora", "zeepub")):
-                    out["maquetadores"].append(c)
-            if not out["maquetadores"]:
-                out["maquetadores"].extend(contributors)
-
-        # Dedupe maquetadores
-        seen = set()
-        mq = []
-        for m in out["maquetadores"]:
-            if m not in seen:
-                seen.add(m)
-                mq.append(m)
-        out["maquetadores"] = mq
-
-        return out
 
+def _read_opf_metadata(data_or_path: Union[bytes, str]) -> Optional[Dict[str, Any]]:
     try:
-        # Abrir EPUB
-        if isinstance(data_or_path, (bytes, bytearray)):
-            zf = zipfile.ZipFile(io.BytesIO(data_or_path))
-        else:
-            zf = zipfile.ZipFile(data_or_path)
-        opf_data = _read_opf(zf)
-        if not opf_data:
-            return None
-        return _parse_opf(opf_data)
+        with EpubDocument(data_or_path) as doc:
+            # Sin portada que buscar basta con parsear hasta </metadata>
+            if not doc.opf_path:
+                return None
+            return _parse_opf_metadata(doc.read(doc.opf_path))
     except Exception:
         return None
 
 
-def extract_cover_from_epub(data_or_path: Union[bytes, str]) -> Optional[bytes]:
+async def parse_opf_from_epub(
+    data_or_path: Union[bytes, str, EpubDocument]
+) -> Dict[str, Any]:
+    """
+    Extrae metadatos OPF de un EPUB (bytes, ruta o EpubDocument) usando
+    namespaces y heurísticas. El parseo se hace en el pool de EPUB.
+    Retorna dict con claves:
+      titulo_volumen, titulo_serie, autores (list), ilustrador, generos (list),
+      demografia (list), categoria, maquetadores (list), traductor, publisher,
+      publisher_url, sinopsis.
+    """
+    if isinstance(data_or_path, EpubDocument):
+        return data_or_path.metadata()
+    return await _run_in_pool(_read_opf_metadata, data_or_path)
+
+
+def extract_cover_from_epub(
+    data_or_path: Union[bytes, str, EpubDocument]
+) -> Optional[bytes]:
     """
     Extrae y devuelve los bytes de la portada embebida en el EPUB,
     buscando primero <meta property="cover"> y luego cualquier
     image/* con 'cover' en id o href. Retorna None si no la halla.
     """
     try:
-        if isinstance(data_or_path, (bytes, bytearray)):
-            zf = zipfile.ZipFile(io.BytesIO(data_or_path))
-        else:
-            zf = zipfile.ZipFile(data_or_path)
-        namelist = zf.namelist()
-        lower_map = {n.lower(): n for n in namelist}
-
-        # 1) localizar OPF
-        try:
-            container = zf.read("META-INF/container.xml")
-            tree = ET.fromstring(container)
-            opf_path = next(
-                rf.attrib["full-path"]
-                for rf in tree.findall(
-                    ".//{urn:oasis:names:tc:opendocument:xmlns:container}rootfile"
-                )
-                if rf.attrib.get("full-path", "").lower().endswith(".opf")
-            )
-        except StopIteration:
-            opf_path = next(name for name in namelist if name.lower().endswith(".opf"))
-        real_opf = lower_map.get(opf_path.lower(), opf_path)
-
-        # 2) leer OPF
-        opf_data = zf.read(real_opf)
-        root = ET.fromstring(opf_data)
-        ns = {"opf": "http://www.idpf.org/2007/opf"}
-
-        # 3) meta cover id
-        cover_id = None
-        for m in root.findall(".//opf:meta", ns):
-            if m.attrib.get("property", "").lower() == "cover":
-                cover_id = m.attrib.get("content")
-                break
-
-        # 4) manifest lookup
-        manifest = root.findall(".//opf:item", ns)
-        target_href = None
-        if cover_id:
-            for item in manifest:
-                if item.attrib.get("id") == cover_id:
-                    target_href = item.attrib.get("href")
-                    break
-        if not target_href:
-            for item in manifest:
-                href = item.attrib.get("href", "").lower()
-                iid = item.attrib.get("id", "").lower()
-                mt = item.attrib.get("media-type", "")
-                if mt.startswith("image/") and "cover" in (iid + href):
-                    target_href = item.attrib.get("href")
-                    break
-
-        if not target_href:
-            return None
-
-        # 5) leer bytes portada
-        base = os.path.dirname(real_opf)
-        full = f"{base}/{target_href}".lstrip("/")
-        real_cover = lower_map.get(full.lower(), full)
-        return zf.read(real_cover)
+        with _document(data_or_path) as doc:
+            return doc.cover()
     except Exception:
         return None
 
 
 async def enrich_metadata_from_epub(
-    epub_bytes: Union[bytes, str],
+    epub_bytes: Union[bytes, str, EpubDocument],
     epub_url: str,
     existing_meta: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
@@ -443,28 +590,55 @@ async def enrich_metadata_from_epub(
     Centralized metadata enrichment function.
 
     Parses OPF metadata, extracts internal title, and extracts filename title from URL.
-    Returns a fully populated metadata dictionary.
+    Returns a fully populated metadata dictionary. The EPUB is inspected in the
+    EPUB worker pool; on timeout only the URL-derived fields are filled.
 
     Args:
-        epub_bytes: EPUB data (bytes or file path)
+        epub_bytes: EPUB data (bytes, file path or an open EpubDocument)
         epub_url: URL of the EPUB (for extracting filename)
         existing_meta: Optional existing metadata to merge with
 
     Returns:
         Enriched metadata dictionary
     """
-    import logging
+    if isinstance(epub_bytes, EpubDocument):
+        # Ya abierto: el llamador está dentro de un trabajador
+        return _enrich_metadata(epub_bytes, epub_url, existing_meta)
+    return await _run_in_pool(
+        _enrich_metadata,
+        epub_bytes,
+        epub_url,
+        existing_meta,
+        fallback=lambda: _enrich_metadata(None, epub_url, existing_meta),
+    )
+
+
+def _enrich_metadata(
+    epub_bytes: Union[bytes, str, EpubDocument, None],
+    epub_url: str,
+    existing_meta: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Implementación síncrona de enrich_metadata_from_epub (bloqueante)."""
     from urllib.parse import unquote, urlparse
 
-    logger = logging.getLogger(__name__)
     meta = existing_meta.copy() if existing_meta else {}
 
     logger.debug(f"Starting metadata enrichment for URL: {epub_url}")
 
+    # Abrir el zip una sola vez para OPF, título interno y URL del publisher
+    if epub_bytes is not None and not isinstance(epub_bytes, EpubDocument):
+        try:
+            with EpubDocument(epub_bytes) as doc:
+                return _enrich_metadata(doc, epub_url, existing_meta)
+        except Exception as e:
+            # EPUB ilegible: seguir solo con los datos derivados de la URL
+            logger.error(f"enrich_metadata_from_epub: could not open EPUB: {e}")
+            epub_bytes = None
+
     try:
         # Parse OPF metadata
         logger.debug("Attempting to parse OPF metadata...")
-        opf_meta = await parse_opf_from_epub(epub_bytes)
+        opf_meta = epub_bytes.metadata() if epub_bytes is not None else None
         if opf_meta:
             logger.debug(f"OPF metadata extracted successfully: titulo_volumen={opf_meta.get('titulo_volumen')}, titulo_serie={opf_meta.get('titulo_serie')}")
             # Merge OPF metadata, preserving existing autores if present
@@ -538,56 +712,117 @@ async def enrich_metadata_from_epub(
     return meta
 
 
-def extract_publisher_url_from_html(data_or_path: Union[bytes, str]) -> Optional[str]:
+async def inspect_epub(
+    epub_bytes: Union[bytes, str],
+    epub_url: str,
+    existing_meta: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], Optional[bytes]]:
     """
-    Busca la URL del publisher/traductor en archivos HTML internos (title/titulo).
-    Prioridad:
-    1. <p class="salto1"><b>Página Web</b>...<a href="...">
-    2. <p class="salto1"><b>Redes sociales</b>...<a href="...">
+    Abre el EPUB una sola vez y devuelve (metadatos enriquecidos, portada).
+    La portada es None si no está embebida o el EPUB no se puede leer.
+    Se ejecuta en el pool de EPUB para no bloquear el event loop; si el mismo
+    contenido ya se inspeccionó para esta URL se reutilizan los metadatos
+    guardados y solo se lee la portada.
     """
-    try:
-        if isinstance(data_or_path, (bytes, bytearray)):
-            zf = zipfile.ZipFile(io.BytesIO(data_or_path))
-        else:
-            zf = zipfile.ZipFile(data_or_path)
-
-        # Buscar archivos candidatos
-        candidates = [
-            n for n in zf.namelist() if "title" in n.lower() or "titulo" in n.lower()
-        ]
-
-        # Regex patterns
-        # Busca el bloque de Página Web
-        # <p class="salto1"><b>Página Web</b><br/><a href="...">
-        pat_web = re.compile(
-            r'<p[^>]*class="salto1"[^>]*>.*?<b>Página Web</b>.*?<a[^>]+href="([^"]+)"',
-            re.IGNORECASE | re.DOTALL,
+    from services.file_id_service import content_key
+    from services.epub_meta_cache import get_epub_meta, save_epub_meta
+
+    merged = dict(existing_meta) if existing_meta else {}
+    key = await content_key(epub_bytes)
+    cached = await asyncio.to_thread(get_epub_meta, key, epub_url) if key else None
+    if cached is not None:
+        cover = None
+        if cached.cover_path:
+            cover = await _run_in_pool(_read_entry, epub_bytes, cached.cover_path)
+        merged.update(cached.meta)
+        return merged, cover
+
+    result = await _run_in_pool(_inspect_epub, epub_bytes, epub_url)
+    if result is None:
+        return _enrich_metadata(None, epub_url, existing_meta), None
+    derived, cover, cover_path = result
+    if key:
+        await asyncio.to_thread(
+            save_epub_meta,
+            key,
+            epub_url,
+            derived,
+            cover_path,
+            _epub_size(epub_bytes),
+            _store_etag(epub_url),
         )
+    merged.update(derived)
+    return merged, cover
 
-        # Busca el bloque de Redes sociales
-        # <p class="salto1"><b>Redes sociales</b><br/><a href="...">
-        pat_social = re.compile(
-            r'<p[^>]*class="salto1"[^>]*>.*?<b>Redes sociales</b>.*?<a[^>]+href="([^"]+)"',
-            re.IGNORECASE | re.DOTALL,
-        )
 
-        for name in candidates:
+def _inspect_epub(
+    epub_bytes: Union[bytes, str], epub_url: str
+) -> Optional[Tuple[Dict[str, Any], Optional[bytes], Optional[str]]]:
+    """
+    Núcleo síncrono de inspect_epub: (metadatos del EPUB, portada, entrada
+    de la portada en el zip), o None si el EPUB no se puede abrir.
+    """
+    try:
+        doc = EpubDocument(epub_bytes)
+    except Exception as e:
+        logger.error(f"inspect_epub: could not open EPUB: {e}")
+        return None
+    with doc:
+        cover_path = doc.cover_path()
+        cover = None
+        if cover_path:
             try:
-                content = zf.read(name).decode("utf-8", errors="ignore")
+                cover = doc.read(cover_path)
+            except Exception:
+                cover_path = None
+        return _enrich_metadata(doc, epub_url), cover, cover_path
 
-                # 1. Intentar Página Web
-                match_web = pat_web.search(content)
-                if match_web:
-                    return match_web.group(1).strip()
 
-                # 2. Intentar Redes sociales
-                match_social = pat_social.search(content)
-                if match_social:
-                    return match_social.group(1).strip()
+def _read_entry(data_or_path: Union[bytes, str], name: str) -> Optional[bytes]:
+    try:
+        with EpubDocument(data_or_path) as doc:
+            return doc.read(name)
+    except Exception:
+        return None
 
-            except Exception:
-                continue
 
+def _epub_size(data_or_path: Union[bytes, str]) -> int:
+    if isinstance(data_or_path, (bytes, bytearray)):
+        return len(data_or_path)
+    try:
+        return os.path.getsize(data_or_path)
+    except (OSError, TypeError):
+        return 0
+
+
+def _store_etag(url: str) -> Optional[str]:
+    """ETag con el que el almacén de EPUBs guardó `url` (sin tocar la red)."""
+    try:
+        from utils.epub_store import get_epub_store
+
+        store = get_epub_store()
+        hit = store.peek(url) if store.enabled else None
+        return hit.etag if hit else None
+    except Exception:
         return None
+
+
+async def extract_cover_async(data_or_path: Union[bytes, str]) -> Optional[bytes]:
+    """extract_cover_from_epub ejecutado en el pool de EPUB."""
+    return await _run_in_pool(extract_cover_from_epub, data_or_path)
+
+
+def extract_publisher_url_from_html(
+    data_or_path: Union[bytes, str, EpubDocument]
+) -> Optional[str]:
+    """
+    Busca la URL del publisher/traductor en archivos HTML internos (title/titulo).
+    Prioridad:
+    1. <p class="salto1"><b>Página Web</b>...<a href="...">
+    2. <p class="salto1"><b>Redes sociales</b>...<a href="...">
+    """
+    try:
+        with _document(data_or_path) as doc:
+            return doc.publisher_url()
     except Exception:
         return None
@@ -0,0 +1,274 @@
+"""
+Registro persistente de file_id de Telegram por contenido.
+
+Cada fichero que el bot sube (EPUB o portada) se indexa por el SHA256 de su
+contenido; la próxima vez que haya que enviar exactamente los mismos bytes se
+reutiliza el file_id en lugar de volver a subirlos.
+Usa la misma base de datos que url_cache (SQLite o PostgreSQL).
+"""
+
+import os
+import hashlib
+import asyncio
+import logging
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple, Union
+from config.config_settings import config
+from utils.sqlite_pool import get_pool
+from utils.database import get_engine, ensure_tables, telegram_file_ids
+
+# Optional SQLAlchemy support
+_HAS_SQLALCHEMY = False
+try:
+    import sqlalchemy as sa
+
+    _HAS_SQLALCHEMY = True
+except Exception:
+    sa = None
+
+logger = logging.getLogger(__name__)
+
+# Reusing the same DB path/configuration as url_cache
+_DEFAULT_DB = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "url_cache.db"
+)
+DB_PATH = config.URL_CACHE_DB_PATH or _DEFAULT_DB
+if not os.path.isabs(DB_PATH):
+    DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), DB_PATH)
+
+# Los file_id no cambian una vez emitidos: un LRU en memoria delante de la BD.
+# Solo aciertos: un file_id que guarde otra réplica (o una BD restaurada)
+# tiene que verse en la siguiente consulta.
+_MEMO_MAX = 4096
+_memo: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _memo_get(key: Tuple[str, str]) -> Optional[str]:
+    with _memo_lock:
+        file_id = _memo.get(key)
+        if file_id is not None:
+            _memo.move_to_end(key)
+        return file_id
+
+
+def _memo_put(key: Tuple[str, str], file_id: str) -> None:
+    with _memo_lock:
+        _memo[key] = file_id
+        _memo.move_to_end(key)
+        while len(_memo) > _MEMO_MAX:
+            _memo.popitem(last=False)
+
+
+def _memo_pop(key: Tuple[str, str]) -> None:
+    with _memo_lock:
+        _memo.pop(key, None)
+
+
+def _pool():
+    """Pool de conexiones compartido con url_cache (ver utils.sqlite_pool)."""
+    return get_pool(DB_PATH)
+
+
+def _get_sa_engine():
+    return get_engine(config.DATABASE_URL)
+
+
+def init_file_id_db():
+    """Inicializa la tabla telegram_file_ids."""
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        _init_with_sqlalchemy()
+        return
+
+    with _pool().write() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS telegram_file_ids (
+                content_hash TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                file_unique_id TEXT,
+                source_url TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (content_hash, kind)
+            )
+            """
+        )
+
+
+def _init_with_sqlalchemy():
+    ensure_tables(_get_sa_engine(), telegram_file_ids)
+
+
+def _hash_path(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def content_key(data_or_path: Union[bytes, str, None]) -> Optional[str]:
+    """SHA256 del contenido (bytes o ruta). Usa el nombre del objeto si viene del almacén."""
+    if not data_or_path:
+        return None
+    try:
+        if isinstance(data_or_path, (bytes, bytearray)):
+            if len(data_or_path) > 1024 * 1024:
+                return await asyncio.to_thread(
+                    lambda: hashlib.sha256(data_or_path).hexdigest()
+                )
+            return hashlib.sha256(data_or_path).hexdigest()
+        if isinstance(data_or_path, str) and os.path.exists(data_or_path):
+            from utils.epub_store import is_store_path
+
+            if is_store_path(data_or_path):
+                # Los objetos del almacén ya se llaman <sha256>.epub
+                return os.path.basename(data_or_path).rsplit(".", 1)[0]
+            return await asyncio.to_thread(_hash_path, data_or_path)
+    except Exception as e:
+        logger.debug("content_key: no se pudo calcular el hash: %s", e)
+    return None
+
+
+def get_file_id(content_hash: str, kind: str) -> Optional[str]:
+    """
+    Devuelve el file_id registrado para (content_hash, kind) o None.
+    Consulta la BD si no está en memoria: desde código async usar
+    lookup_file_id().
+    """
+    if not content_hash:
+        return None
+    key = (content_hash, kind)
+    file_id = _memo_get(key)
+    if file_id is not None:
+        return file_id
+
+    file_id = None
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        try:
+            engine = _get_sa_engine()
+            table = telegram_file_ids
+            with engine.connect() as conn:
+                sel = sa.select(table.c.file_id).where(
+                    table.c.content_hash == content_hash, table.c.kind == kind
+                )
+                row = conn.execute(sel).first()
+                file_id = row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error getting file_id {content_hash} (SQLAlchemy): {e}")
+            return None
+    else:
+        try:
+            with _pool().read() as conn:
+                row = conn.execute(
+                    "SELECT file_id FROM telegram_file_ids WHERE content_hash = ? AND kind = ?",
+                    (content_hash, kind),
+                ).fetchone()
+                file_id = row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error getting file_id {content_hash} (SQLite): {e}")
+            return None
+
+    if file_id:
+        _memo_put(key, file_id)
+    return file_id
+
+
+async def lookup_file_id(content_hash: str, kind: str) -> Optional[str]:
+    """get_file_id sin bloquear el event loop cuando hay que ir a la BD."""
+    if not content_hash:
+        return None
+    file_id = _memo_get((content_hash, kind))
+    if file_id is not None:
+        return file_id
+    return await asyncio.to_thread(get_file_id, content_hash, kind)
+
+
+def remember_file_id(
+    content_hash: str,
+    kind: str,
+    file_id: str,
+    file_unique_id: Optional[str] = None,
+    source_url: Optional[str] = None,
+):
+    """Guarda (o reemplaza) el file_id devuelto por Telegram tras una subida."""
+    if not content_hash or not file_id:
+        return
+    _memo_put((content_hash, kind), file_id)
+
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        try:
+            engine = _get_sa_engine()
+            table = telegram_file_ids
+            where = sa.and_(table.c.content_hash == content_hash, table.c.kind == kind)
+            values = {
+                "file_id": file_id,
+                "file_unique_id": file_unique_id,
+                "source_url": source_url,
+                "updated_at": datetime.utcnow(),
+            }
+            with engine.begin() as conn:
+                if conn.execute(sa.select(table.c.file_id).where(where)).first():
+                    conn.execute(table.update().where(where).values(**values))
+                else:
+                    conn.execute(
+                        table.insert().values(
+                            content_hash=content_hash, kind=kind, **values
+                        )
+                    )
+            return
+        except Exception as e:
+            logger.error(f"Error saving file_id {content_hash} (SQLAlchemy): {e}")
+            return
+
+    try:
+        with _pool().write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO telegram_file_ids "
+                "(content_hash, kind, file_id, file_unique_id, source_url, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                (content_hash, kind, file_id, file_unique_id, source_url),
+            )
+    except Exception as e:
+        logger.error(f"Error saving file_id {content_hash} (SQLite): {e}")
+
+
+def forget_file_id(content_hash: str, kind: str):
+    """Elimina un file_id que Telegram ha rechazado."""
+    if not content_hash:
+        return
+    _memo_pop((content_hash, kind))
+
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        try:
+            engine = _get_sa_engine()
+            table = telegram_file_ids
+            with engine.begin() as conn:
+                conn.execute(
+                    table.delete().where(
+                        table.c.content_hash == content_hash, table.c.kind == kind
+                    )
+                )
+        except Exception as e:
+            logger.error(f"Error deleting file_id {content_hash} (SQLAlchemy): {e}")
+        return
+
+    try:
+        with _pool().write() as conn:
+            conn.execute(
+                "DELETE FROM telegram_file_ids WHERE content_hash = ? AND kind = ?",
+                (content_hash, kind),
+            )
+    except Exception as e:
+        logger.error(f"Error deleting file_id {content_hash} (SQLite): {e}")
+
+
+# Inicializar al importar
+try:
+    init_file_id_db()
+except Exception as e:
+    logger.error(f"Could not init file_id DB: {e}")
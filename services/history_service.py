@@ -5,16 +5,16 @@ import re
 from datetime import datetime
 from typing import Optional, Dict, Any
 import sqlalchemy as sa
-from sqlalchemy import Table, Column, Integer, String, Text, BigInteger, DateTime, MetaData
 from config.config_settings import config
 from utils.helpers import generar_slug_from_meta
+from utils.database import get_engine, ensure_tables, published_books
 
 logger = logging.getLogger(__name__)
 
 # SQLAlchemy setup
 _HAS_SQLALCHEMY = False
 try:
-    from sqlalchemy import create_engine
+    import sqlalchemy  # noqa: F401
     _HAS_SQLALCHEMY = True
 except ImportError:
     pass
@@ -26,35 +26,14 @@ def _get_engine():
     if not config.DATABASE_URL:
         # Fallback to local sqlite if no DATABASE_URL, similar to url_cache
         db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "url_cache.db")
-        return create_engine(f"sqlite:///{db_path}", future=True)
-    return create_engine(config.DATABASE_URL, future=True, pool_pre_ping=True)
+        return get_engine(f"sqlite:///{db_path}")
+    return get_engine(config.DATABASE_URL)
 
 
 def _get_table(engine):
-    metadata = MetaData()
-    table = Table(
-        "published_books",
-        metadata,
-        Column("id", Integer, primary_key=True, autoincrement=True),
-        Column("message_id", Integer, nullable=True),
-        Column("channel_id", BigInteger, nullable=True),
-        Column("title", Text, nullable=True),
-        Column("author", Text, nullable=True),
-        Column("series", Text, nullable=True),
-        Column("volume", Text, nullable=True),
-        Column("slug", Text, nullable=True),
-        Column("file_size", Integer, nullable=True),
-        Column("file_unique_id", Text, nullable=True),
-        Column("date_published", DateTime, default=datetime.utcnow),
-        Column("maquetado_por", Text, nullable=True),
-        Column("demografia", Text, nullable=True),
-        Column("generos", Text, nullable=True),
-        Column("ilustrador", Text, nullable=True),
-        Column("traduccion", Text, nullable=True),
-    )
-    # Ensure table exists
-    metadata.create_all(engine)
-    return table
+    # Ensure table exists (only the first time per engine)
+    ensure_tables(engine, published_books)
+    return published_books
 
 
 def log_published_book(
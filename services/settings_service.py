@@ -3,18 +3,17 @@ Servicio para gestionar configuración dinámica persistente (Key-Value).
 Usa la misma base de datos que url_cache (SQLite o PostgreSQL).
 """
 
-import sqlite3
 import logging
 import os
-import time
 from typing import Optional
 from config.config_settings import config
+from utils.sqlite_pool import get_pool
+from utils.database import get_engine, ensure_tables, bot_settings as settings
 
 # Optional SQLAlchemy support
 _HAS_SQLALCHEMY = False
 try:
     import sqlalchemy as sa
-    from sqlalchemy import Table, Column, String, Text, MetaData
     _HAS_SQLALCHEMY = True
 except Exception:
     sa = None
@@ -30,29 +29,13 @@ if not os.path.isabs(DB_PATH):
     DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), DB_PATH)
 
 
-def _get_conn(retries: int = 3, timeout: float = 0.1) -> sqlite3.Connection:
-    """Open a sqlite connection with retries."""
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    last_exc = None
-    for _ in range(retries):
-        try:
-            conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
-            conn.execute("PRAGMA journal_mode=WAL;")
-            conn.execute("PRAGMA synchronous=NORMAL;")
-            return conn
-        except sqlite3.OperationalError as e:
-            last_exc = e
-            time.sleep(timeout)
-            timeout *= 2
-    raise last_exc
+def _pool():
+    """Pool de conexiones compartido con url_cache (ver utils.sqlite_pool)."""
+    return get_pool(DB_PATH)
 
 
 def _get_sa_engine():
-    if not _HAS_SQLALCHEMY:
-        raise RuntimeError("SQLAlchemy not installed")
-    if not config.DATABASE_URL:
-        raise RuntimeError("DATABASE_URL not configured")
-    return sa.create_engine(config.DATABASE_URL, future=True, pool_pre_ping=True)
+    return get_engine(config.DATABASE_URL)
 
 
 def init_settings_db():
@@ -61,10 +44,8 @@ def init_settings_db():
         _init_with_sqlalchemy()
         return
 
-    conn = _get_conn()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
+    with _pool().write() as conn:
+        conn.execute(
             """
             CREATE TABLE IF NOT EXISTS bot_settings (
                 key TEXT PRIMARY KEY,
@@ -72,21 +53,10 @@ def init_settings_db():
             )
             """
         )
-        conn.commit()
-    finally:
-        conn.close()
 
 
 def _init_with_sqlalchemy():
-    engine = _get_sa_engine()
-    meta = MetaData()
-    Table(
-        "bot_settings",
-        meta,
-        Column("key", String(128), primary_key=True),
-        Column("value", Text),
-    )
-    meta.create_all(engine)
+    ensure_tables(_get_sa_engine(), settings)
 
 
 def get_setting(key: str, default: str = None) -> Optional[str]:
@@ -94,8 +64,6 @@ def get_setting(key: str, default: str = None) -> Optional[str]:
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         try:
             engine = _get_sa_engine()
-            metadata = MetaData()
-            settings = Table("bot_settings", metadata, autoload_with=engine)
             with engine.connect() as conn:
                 sel = sa.select(settings.c.value).where(settings.c.key == key)
                 result = conn.execute(sel).first()
@@ -104,17 +72,15 @@ def get_setting(key: str, default: str = None) -> Optional[str]:
             logger.error(f"Error getting setting {key} (SQLAlchemy): {e}")
             return default
 
-    conn = _get_conn()
     try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM bot_settings WHERE key = ?", (key,))
-        row = cursor.fetchone()
+        with _pool().read() as conn:
+            row = conn.execute(
+                "SELECT value FROM bot_settings WHERE key = ?", (key,)
+            ).fetchone()
         return row[0] if row else default
     except Exception as e:
         logger.error(f"Error getting setting {key} (SQLite): {e}")
         return default
-    finally:
-        conn.close()
 
 
 def set_setting(key: str, value: str):
@@ -122,8 +88,6 @@ def set_setting(key: str, value: str):
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         try:
             engine = _get_sa_engine()
-            metadata = MetaData()
-            settings = Table("bot_settings", metadata, autoload_with=engine)
             with engine.begin() as conn:
                 # Upsert check
                 sel = sa.select(settings.c.key).where(settings.c.key == key)
@@ -141,18 +105,14 @@ def set_setting(key: str, value: str):
         except Exception as e:
             logger.error(f"Error setting {key} (SQLAlchemy): {e}")
 
-    conn = _get_conn()
     try:
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)",
-            (key, str(value)),
-        )
-        conn.commit()
+        with _pool().write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)",
+                (key, str(value)),
+            )
     except Exception as e:
         logger.error(f"Error setting {key} (SQLite): {e}")
-    finally:
-        conn.close()
 
 
 # Inicializar al importar
@@ -1,6 +1,7 @@
 # services/telegram_service.py
 
 import io
+import asyncio
 import os
 import logging
 from urllib.parse import urlparse, unquote
@@ -17,16 +18,92 @@ from services.metadata_service import (
 )
 from services.epub_service import parse_opf_from_epub
 from utils.http_client import fetch_bytes, cleanup_tmp
+from utils.epub_store import fetch_epub
+from services.file_id_service import (
+    content_key,
+    lookup_file_id,
+    remember_file_id,
+    forget_file_id,
+)
 from utils.helpers import (
     generar_slug_from_meta,
     formatear_mensaje_portada,
     escapar_html,
 )
 from utils.download_limiter import record_download, can_download, downloads_left
-from services.epub_service import parse_opf_from_epub, extract_cover_from_epub
+from services.epub_service import parse_opf_from_epub, extract_cover_async
 
 logger = logging.getLogger(__name__)
 
+# BadRequest que indican que el file_id ya no sirve (el resto no es del fichero)
+_STALE_FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "file reference expired",
+    "file_reference_expired",
+)
+
+
+def _is_stale_file_id(error: BadRequest) -> bool:
+    message = str(error).lower()
+    return any(marker in message for marker in _STALE_FILE_ID_ERRORS)
+
+
+async def _send_by_file_id(send, message_thread_id=None, **kwargs):
+    """Envía reutilizando un file_id ya subido (reintenta sin thread si no existe)."""
+    try:
+        return await send(message_thread_id=message_thread_id, **kwargs)
+    except BadRequest as e:
+        if "Message thread not found" in str(e) and message_thread_id is not None:
+            return await send(message_thread_id=None, **kwargs)
+        raise
+
+
+async def _send_cached(kind, send, field, upload, data_or_path, source_url, **kwargs):
+    """
+    Intenta enviar `data_or_path` por su file_id registrado; si no hay o
+    Telegram lo da por inválido/caducado, sube el fichero con `upload` y
+    registra el nuevo file_id. Otros BadRequest se propagan sin tocar el registro.
+    """
+    key = await content_key(data_or_path)
+    file_id = await lookup_file_id(key, kind) if key else None
+    if file_id:
+        try:
+            sent = await _send_by_file_id(
+                send,
+                chat_id=kwargs["chat_id"],
+                caption=kwargs["caption"],
+                parse_mode=kwargs["parse_mode"],
+                message_thread_id=kwargs["message_thread_id"],
+                **{field: file_id},
+            )
+            if sent:
+                return sent
+        except BadRequest as e:
+            # Caption, chat, tamaño del mensaje...: re-subir no lo arregla
+            if not _is_stale_file_id(e):
+                raise
+            logger.info(f"file_id rechazado ({kind}), re-subiendo: {e}")
+            await asyncio.to_thread(forget_file_id, key, kind)
+        except Exception as e:
+            logger.debug(f"Error enviando por file_id ({kind}): {e}")
+
+    sent = await upload(data_or_path=data_or_path, **kwargs)
+    if sent and key:
+        uploaded = sent.document if kind == "document" else sent.photo
+        if isinstance(uploaded, (list, tuple)):
+            uploaded = uploaded[-1] if uploaded else None
+        if uploaded is not None and getattr(uploaded, "file_id", None):
+            await asyncio.to_thread(
+                remember_file_id,
+                key,
+                kind,
+                uploaded.file_id,
+                getattr(uploaded, "file_unique_id", None),
+                source_url,
+            )
+    return sent
+
 
 async def send_photo_bytes(
     bot,
@@ -36,12 +113,55 @@ async def send_photo_bytes(
     filename="cover.jpg",
     parse_mode=None,
     message_thread_id=None,
+    source_url=None,
+):
+    """Envía imagen desde bytes o ruta, reutilizando el file_id si ya se subió."""
+    if not data_or_path:
+        return None
+    return await _send_cached(
+        "photo",
+        bot.send_photo,
+        "photo",
+        _upload_photo,
+        data_or_path,
+        source_url,
+        bot=bot,
+        chat_id=chat_id,
+        caption=caption,
+        filename=filename,
+        parse_mode=parse_mode,
+        message_thread_id=message_thread_id,
+    )
+
+
+async def _shrink_cover(data: bytes) -> bytes:
+    """
+    Reduce la portada a TELEGRAM_COVER_WIDTH px (Telegram no la muestra más
+    grande) en el pool de miniaturas. El file_id se registra con el hash de la
+    original, así que cada portada se redimensiona una sola vez.
+    """
+    if config.TELEGRAM_COVER_WIDTH <= 0:
+        return data
+    from utils.thumbnails import render_thumbnail
+
+    return await render_thumbnail(data, config.TELEGRAM_COVER_WIDTH) or data
+
+
+async def _upload_photo(
+    bot,
+    chat_id,
+    caption,
+    data_or_path,
+    filename="cover.jpg",
+    parse_mode=None,
+    message_thread_id=None,
 ):
     """Envía imagen desde bytes o ruta de archivo."""
     if not data_or_path:
         return None
     try:
         if isinstance(data_or_path, (bytes, bytearray)):
+            data_or_path = await _shrink_cover(data_or_path)
             bio = io.BytesIO(data_or_path)
             bio.name = filename
             bio.seek(0)
@@ -132,7 +252,7 @@ async def send_photo_bytes(
                             )
                         raise e
     except Exception as e:
-        logger.debug(f"Error send_photo_bytes: {e}")
+        logger.debug(f"Error _upload_photo: {e}")
     return None
 
 
@@ -144,6 +264,35 @@ async def send_doc_bytes(
     filename="file.epub",
     parse_mode=None,
     message_thread_id=None,
+    source_url=None,
+):
+    """Envía documento EPUB desde bytes o ruta, reutilizando el file_id si ya se subió."""
+    if not data_or_path:
+        return None
+    return await _send_cached(
+        "document",
+        bot.send_document,
+        "document",
+        _upload_doc,
+        data_or_path,
+        source_url,
+        bot=bot,
+        chat_id=chat_id,
+        caption=caption,
+        filename=filename,
+        parse_mode=parse_mode,
+        message_thread_id=message_thread_id,
+    )
+
+
+async def _upload_doc(
+    bot,
+    chat_id,
+    caption,
+    data_or_path,
+    filename="file.epub",
+    parse_mode=None,
+    message_thread_id=None,
 ):
     """Envía documento EPUB desde bytes o ruta de archivo."""
     if not data_or_path:
@@ -247,7 +396,7 @@ async def send_doc_bytes(
                         )
                     raise e
     except Exception as e:
-        logger.debug(f"Error send_doc_bytes: {e}")
+        logger.debug(f"Error _upload_doc: {e}")
     return None
 
 
@@ -296,13 +445,14 @@ async def publicar_libro(
 
         # Descargar EPUB para parsear metadatos
         epub_downloaded = None
+        cover_bytes = None
         if epub_url:
-            epub_downloaded = await fetch_bytes(epub_url, timeout=120)
+            epub_downloaded = await fetch_epub(epub_url, timeout=120)
             if epub_downloaded:
-                # Use centralized metadata enrichment
-                from services.epub_service import enrich_metadata_from_epub
+                # Metadatos, título interno y portada abriendo el EPUB una vez
+                from services.epub_service import inspect_epub
 
-                meta = await enrich_metadata_from_epub(epub_downloaded, epub_url, meta)
+                meta, cover_bytes = await inspect_epub(epub_downloaded, epub_url, meta)
 
                 # Guardar EPUB y metadatos para envío posterior
                 user_state["epub_buffer"] = epub_downloaded
@@ -333,12 +483,7 @@ async def publicar_libro(
         # Dentro de publicar_libro, donde quieras enviar portada:
         mensaje_portada = formatear_mensaje_portada(meta)
 
-        # Extraer portada embebida
-        cover_bytes = None
-        if epub_downloaded:
-            cover_bytes = extract_cover_from_epub(epub_downloaded)
-
-        # Fallback a URL OPDS
+        # Fallback a URL OPDS si no hay portada embebida
         if cover_bytes:
             portada_data = cover_bytes
         else:
@@ -591,6 +736,7 @@ async def descargar_epub_pendiente(
             filename=fname,
             parse_mode="HTML",
             message_thread_id=thread_id_destino,
+            source_url=epub_url,
         )
 
         if sent_doc:
@@ -695,7 +841,7 @@ async def enviar_libro_directo(
 
         # 3. Descargar EPUB
         logger.info(f"Descargando EPUB desde: {download_url}")
-        epub_bytes = await fetch_bytes(download_url, timeout=120)
+        epub_bytes = await fetch_epub(download_url, timeout=120)
         if not epub_bytes:
             error_msg = "❌ Error al descargar el archivo desde la fuente. Posible problema con Cloudflare o servidor de origen."
             logger.error(f"EPUB download failed for: {download_url}")
@@ -713,15 +859,14 @@ async def enviar_libro_directo(
             "epub_version": "2.0",
             "fecha_modificacion": "Desconocida",
         }
-        # Use centralized metadata enrichment
-        from services.epub_service import enrich_metadata_from_epub
+        # Metadatos, título interno y portada abriendo el EPUB una vez
+        from services.epub_service import inspect_epub
 
         logger.debug(f"Iniciando extracción de metadatos para: {title}")
-        meta = await enrich_metadata_from_epub(epub_bytes, download_url, meta)
+        meta, cover_bytes = await inspect_epub(epub_bytes, download_url, meta)
         logger.debug(f"Metadatos extraídos - titulo_serie: {meta.get('titulo_serie')}, internal_title: {meta.get('internal_title')}, autor: {meta.get('autor')}")
 
         # 5. Preparar Portada
-        cover_bytes = extract_cover_from_epub(epub_bytes)
         portada_data = (
             cover_bytes
             if cover_bytes
@@ -822,7 +967,7 @@ async def enviar_libro_directo(
                     )
                     return False
 
-                import httpx
+                from core.session_manager import session_manager
 
                 # Necesitamos una URL pública para la imagen si usamos 'url' param en FB API.
                 # O subir como multipart/form-data.
@@ -859,15 +1004,15 @@ async def enviar_libro_directo(
                     "access_token": config.FACEBOOK_PAGE_ACCESS_TOKEN,
                 }
 
-                async with httpx.AsyncClient() as client:
-                    resp = await client.post(url, params=params, timeout=30)
-                    if resp.status_code != 200:
-                        logger.error(f"FB Error: {resp.text}")
-                        await bot.send_message(
-                            chat_id=user_id,
-                            text=f"❌ Error publicando en Facebook: {resp.text}",
-                        )
-                        return False
+                client = session_manager.get_http_client()
+                resp = await client.post(url, params=params, timeout=30)
+                if resp.status_code != 200:
+                    logger.error(f"FB Error: {resp.text}")
+                    await bot.send_message(
+                        chat_id=user_id,
+                        text=f"❌ Error publicando en Facebook: {resp.text}",
+                    )
+                    return False
 
                 await bot.send_message(
                     chat_id=user_id,
@@ -924,7 +1069,13 @@ async def enviar_libro_directo(
             )
 
             sent_doc = await send_doc_bytes(
-                bot, destino, caption, epub_bytes, filename=fname, parse_mode="HTML"
+                bot,
+                destino,
+                caption,
+                epub_bytes,
+                filename=fname,
+                parse_mode="HTML",
+                source_url=download_url,
             )
 
             # Registrar en historial
@@ -989,6 +1140,15 @@ async def preparar_post_facebook(update, context: ContextTypes.DEFAULT_TYPE, uid
         await bot.send_message(chat_id=uid, text="❌ No hay libro seleccionado.")
         return
 
+    # Sin metadatos en el estado: reutilizar los ya extraídos de este EPUB
+    cached_meta = None
+    if not meta or not user_state.get("epub_buffer"):
+        from services.epub_meta_cache import lookup_epub_meta
+
+        cached_meta = await lookup_epub_meta(epub_url)
+        if cached_meta is not None and not meta:
+            meta = dict(cached_meta.meta)
+
     # Construir link público acortado con SHA256 persistente
     from utils.url_cache import create_short_url
     from utils.helpers import formatear_titulo_fb, formatear_metadata_fb, escapar_html
@@ -1024,6 +1184,8 @@ async def preparar_post_facebook(update, context: ContextTypes.DEFAULT_TYPE, uid
             size_mb = os.path.getsize(epub_buffer) / (1024 * 1024)
         else:
             size_mb = 0.0
+    elif cached_meta is not None:
+        size_mb = cached_meta.size / (1024 * 1024)
     else:
         size_mb = 0.0
 
@@ -1149,9 +1311,7 @@ async def _publish_choice_facebook(
     cover_bytes = None
     try:
         if epub_buffer:
-            from services.epub_service import extract_cover_from_epub
-
-            cover_bytes = extract_cover_from_epub(epub_buffer)
+            cover_bytes = await extract_cover_async(epub_buffer)
     except Exception:
         cover_bytes = None
 
@@ -1162,21 +1322,18 @@ async def _publish_choice_facebook(
 
     # If we still don't have metadata or buffer, try to fetch EPUB to build meta/cover
     if (not cover_bytes or not meta) and epub_url:
-        epub_downloaded = await fetch_bytes(epub_url, timeout=60)
+        epub_downloaded = await fetch_epub(epub_url, timeout=60)
         if epub_downloaded:
             st["epub_buffer"] = epub_downloaded
             epub_buffer = epub_downloaded
-            # Use centralized metadata enrichment
-            from services.epub_service import enrich_metadata_from_epub
+            # Metadatos y portada abriendo el EPUB una vez (en el pool de EPUB)
+            from services.epub_service import inspect_epub
 
-            meta = await enrich_metadata_from_epub(epub_downloaded, epub_url, meta)
+            meta, epub_cover = await inspect_epub(epub_downloaded, epub_url, meta)
             st["meta_pendiente"] = meta
 
             if not cover_bytes:
-                try:
-                    cover_bytes = extract_cover_from_epub(epub_downloaded)
-                except Exception:
-                    cover_bytes = None
+                cover_bytes = epub_cover
 
     logger.debug(
         "_publish_choice_facebook: sending cover to origin=%s (thread=%s), have_cover=%s",
@@ -1244,7 +1401,7 @@ async def _publish_choice_telegram(
     cover_bytes = None
     if epub_buffer:
         try:
-            cover_bytes = extract_cover_from_epub(epub_buffer)
+            cover_bytes = await extract_cover_async(epub_buffer)
         except Exception:
             cover_bytes = None
 
@@ -1416,7 +1573,7 @@ async def publicar_facebook_action(
     epub_buffer = user_state.get("epub_buffer")
     cover_bytes = None
     if epub_buffer:
-        cover_bytes = extract_cover_from_epub(epub_buffer)
+        cover_bytes = await extract_cover_async(epub_buffer)
 
     if not cover_bytes:
         await bot.send_message(
@@ -1425,7 +1582,7 @@ async def publicar_facebook_action(
         return
 
     # Subir a Facebook usando Graph API
-    import httpx
+    from core.session_manager import session_manager
 
     logger.debug(
         "publicar_facebook_action: uid=%s publish_command_origin=%s thread=%s caption_len=%s",
@@ -1476,10 +1633,10 @@ async def publicar_facebook_action(
         # Enviar archivo
         files = {"source": ("cover.jpg", io.BytesIO(cover_bytes), "image/jpeg")}
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, data=data, files=files, timeout=60)
-            resp.raise_for_status()
-            fb_res = resp.json()
+        client = session_manager.get_http_client()
+        resp = await client.post(url, data=data, files=files, timeout=60)
+        resp.raise_for_status()
+        fb_res = resp.json()
 
         # Notify origin chat and private publisher chat (if different)
         await bot.edit_message_text(
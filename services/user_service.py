@@ -1,23 +1,18 @@
 import logging
 import os
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional, Dict, Any, Union
 from config.config_settings import config
+from utils.sqlite_pool import get_pool
+from utils.database import get_engine, ensure_tables, users
 
 # Optional SQLAlchemy support
 _HAS_SQLALCHEMY = False
 try:
     import sqlalchemy as sa
-    from sqlalchemy import (
-        Table,
-        Column,
-        Integer,
-        String,
-        DateTime,
-        BigInteger,
-        MetaData,
-        text,
-    )
     from sqlalchemy.engine import Engine
 
     _HAS_SQLALCHEMY = True
@@ -37,21 +32,15 @@ if not os.path.isabs(DB_PATH):
 
 def _get_engine():
     if _HAS_SQLALCHEMY and config.DATABASE_URL:
-        return sa.create_engine(config.DATABASE_URL, future=True, pool_pre_ping=True)
+        return get_engine(config.DATABASE_URL)
 
-    # Fallback to SQLite with SQLAlchemy if available, or just return None to signal manual SQLite
-    if _HAS_SQLALCHEMY:
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-        return sa.create_engine(f"sqlite:///{DB_PATH}", future=True)
+    # Sin DATABASE_URL: SQLite a través del pool compartido (None = ruta manual)
     return None
 
 
-def get_sqlite_conn():
-    import sqlite3
-
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    return sqlite3.connect(DB_PATH)
+def _pool():
+    """Pool de conexiones compartido con url_cache (ver utils.sqlite_pool)."""
+    return get_pool(DB_PATH)
 
 
 def init_user_db():
@@ -66,29 +55,13 @@ def init_user_db():
 
 
 def _init_with_sqlalchemy(engine: "Engine"):
-    meta = MetaData()
-    # Define table
-    users_table = Table(
-        "users",
-        meta,
-        Column("telegram_id", BigInteger, primary_key=True),
-        Column(
-            "role", String(50), nullable=False
-        ),  # 'white', 'vip', 'premium', 'staff'
-        Column("added_at", DateTime, default=datetime.utcnow),
-        Column("expires_at", DateTime, nullable=True),
-        Column("custom_status", String(100), nullable=True),
-        Column("created_by", BigInteger, nullable=True),
-    )
-    meta.create_all(engine)
+    ensure_tables(engine, users)
     return "Tables created or existing"
 
 
 def _init_sqlite_manual():
-    conn = get_sqlite_conn()
-    try:
-        cursor = conn.cursor()
-        cursor.execute(
+    with _pool().write() as conn:
+        conn.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
                 telegram_id INTEGER PRIMARY KEY,
@@ -100,9 +73,6 @@ def _init_sqlite_manual():
             )
             """
         )
-        conn.commit()
-    finally:
-        conn.close()
 
 
 def upsert_user(
@@ -134,12 +104,10 @@ def upsert_user(
         _upsert_sa(engine, telegram_id, role, expires_at, custom_status, created_by)
     else:
         _upsert_sqlite(telegram_id, role, expires_at, custom_status, created_by)
+    invalidate_user_cache(telegram_id)
 
 
 def _upsert_sa(engine, telegram_id, role, expires_at, custom_status, created_by):
-    meta = MetaData()
-    users = Table("users", meta, autoload_with=engine)
-
     with engine.begin() as conn:
         # Check if exists
         sel = sa.select(users.c.telegram_id).where(users.c.telegram_id == telegram_id)
@@ -174,8 +142,7 @@ def _upsert_sa(engine, telegram_id, role, expires_at, custom_status, created_by)
 
 
 def _upsert_sqlite(telegram_id, role, expires_at, custom_status, created_by):
-    conn = get_sqlite_conn()
-    try:
+    with _pool().write() as conn:
         cursor = conn.cursor()
         # Check existence
         cursor.execute(
@@ -212,9 +179,6 @@ def _upsert_sqlite(telegram_id, role, expires_at, custom_status, created_by):
                     created_by,
                 ),
             )
-        conn.commit()
-    finally:
-        conn.close()
 
 
 def get_user_info(telegram_id: int) -> Optional[Dict[str, Any]]:
@@ -230,8 +194,6 @@ def get_user_info(telegram_id: int) -> Optional[Dict[str, Any]]:
 
 
 def _get_user_sa(engine, telegram_id):
-    meta = MetaData()
-    users = Table("users", meta, autoload_with=engine)
     with engine.connect() as conn:
         sel = sa.select(users.c.role, users.c.expires_at, users.c.custom_status).where(
             users.c.telegram_id == telegram_id
@@ -243,48 +205,98 @@ def _get_user_sa(engine, telegram_id):
 
 
 def _get_user_sqlite(telegram_id):
-    conn = get_sqlite_conn()
-    try:
-        cursor = conn.cursor()
+    with _pool().read() as conn:
         # Sqlite stores datetime as string usually, might need parsing if read back raw
-        cursor.execute(
+        row = conn.execute(
             "SELECT role, expires_at, custom_status FROM users WHERE telegram_id = ?",
             (telegram_id,),
-        )
-        row = cursor.fetchone()
-        if row:
-            # Parse expires_at if string
-            expires_at = row[1]
-            if isinstance(expires_at, str) and expires_at:
+        ).fetchone()
+    if row:
+        # Parse expires_at if string
+        expires_at = row[1]
+        if isinstance(expires_at, str) and expires_at:
+            try:
+                # Generic parser or fixed format
+                from dateutil import parser
+
+                expires_at = parser.parse(expires_at)
+            except ImportError:
+                # Fallback basic ISO
                 try:
-                    # Generic parser or fixed format
-                    from dateutil import parser
-
-                    expires_at = parser.parse(expires_at)
-                except ImportError:
-                    # Fallback basic ISO
+                    expires_at = datetime.fromisoformat(expires_at)
+                except ValueError:
                     pass
 
-            return {"role": row[0], "expires_at": expires_at, "custom_status": row[2]}
-    finally:
-        conn.close()
+        return {"role": row[0], "expires_at": expires_at, "custom_status": row[2]}
     return None
 
 
 def remove_user(telegram_id: int):
     engine = _get_engine()
     if engine:
-        meta = MetaData()
-        users = Table("users", meta, autoload_with=engine)
         with engine.begin() as conn:
             conn.execute(users.delete().where(users.c.telegram_id == telegram_id))
     else:
-        conn = get_sqlite_conn()
-        try:
+        with _pool().write() as conn:
             conn.execute("DELETE FROM users WHERE telegram_id = ?", (telegram_id,))
-            conn.commit()
-        finally:
-            conn.close()
+    invalidate_user_cache(telegram_id)
+
+
+# --- Caché de roles ---
+# get_effective_user se consulta varias veces por cada descarga (can_download,
+# downloads_left...). Se guarda la fila de la DB (o su ausencia) durante
+# USER_ROLE_CACHE_TTL segundos; la caducidad (expires_at) se evalúa en cada
+# llamada, así que no hace falta volver a la DB para detectar un rol vencido.
+_MISSING = object()
+_role_cache: "OrderedDict[int, tuple]" = OrderedDict()
+_role_cache_lock = threading.Lock()
+_role_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_role_cache_gen = 0  # se incrementa en cada invalidación
+
+
+def invalidate_user_cache(telegram_id: Optional[int] = None):
+    """Olvida el rol cacheado de un usuario, o de todos si no se indica."""
+    global _role_cache_gen
+    with _role_cache_lock:
+        _role_cache_gen += 1
+        if telegram_id is None:
+            _role_cache.clear()
+        else:
+            _role_cache.pop(telegram_id, None)
+        _role_cache_stats["invalidations"] += 1
+
+
+def get_user_cache_stats() -> Dict[str, int]:
+    with _role_cache_lock:
+        return {**_role_cache_stats, "size": len(_role_cache)}
+
+
+def _cached_user_info(telegram_id: int) -> Optional[Dict[str, Any]]:
+    ttl = config.USER_ROLE_CACHE_TTL
+    if ttl <= 0:
+        return get_user_info(telegram_id)
+
+    now = time.monotonic()
+    with _role_cache_lock:
+        entry = _role_cache.get(telegram_id)
+        if entry is not None and entry[0] > now:
+            _role_cache.move_to_end(telegram_id)
+            _role_cache_stats["hits"] += 1
+            info = entry[1]
+            return None if info is _MISSING else dict(info)
+        _role_cache_stats["misses"] += 1
+        gen = _role_cache_gen
+
+    info = get_user_info(telegram_id)
+    with _role_cache_lock:
+        # Si hubo una escritura mientras se leía, no guardar un valor viejo
+        if gen != _role_cache_gen:
+            return None if info is None else dict(info)
+        _role_cache[telegram_id] = (now + ttl, _MISSING if info is None else info)
+        _role_cache.move_to_end(telegram_id)
+        while len(_role_cache) > config.USER_ROLE_CACHE_MAX_ENTRIES:
+            _role_cache.popitem(last=False)
+    return None if info is None else dict(info)
 
 
 # Auto-init on import
@@ -300,8 +312,8 @@ def get_effective_user(uid: int) -> Dict[str, Any]:
     Retorna un dict con keys: role, status_label, expires_at (puede ser None).
     Roles: 'admin', 'staff', 'premium', 'vip', 'white', 'free'.
     """
-    # 1. Check DB
-    info = get_user_info(uid)
+    # 1. Check DB (a través de la caché de roles)
+    info = _cached_user_info(uid)
     if info:
         # Check expiration
         expires_at = info.get("expires_at")
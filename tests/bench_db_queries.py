@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Benchmark de las consultas calientes de url_mappings y published_books.
+
+Uso:
+    python tests/bench_db_queries.py [--rows 1000000] [--database-url URL]
+                                     [--no-indexes] [--repeat 200]
+
+Sin --database-url se crea un SQLite temporal. Siembra `--rows` filas en
+cada tabla (si aún no las tiene) y mide, con las funciones reales de la
+aplicación, la latencia de:
+
+- url_lookup:   create_short_url con una URL existente (WHERE url = ?)
+- hash_lookup:  get_url_from_hash (clave primaria, referencia)
+- candidates:   get_candidates_for_validation (el validador)
+- latest:       get_latest_books sin canal
+- latest_chan:  get_latest_books de un canal
+
+En SQLite se miden las dos rutas de url_cache (sqlite3 nativo y
+SQLAlchemy). Con --no-indexes se eliminan los índices declarados en
+utils.database, para comparar antes/después sobre los mismos datos.
+"""
+
+import os
+import sys
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlalchemy as sa  # noqa: E402
+from config.config_settings import config  # noqa: E402
+from utils import database  # noqa: E402
+from utils import url_cache  # noqa: E402
+from services import history_service  # noqa: E402
+
+CHANNELS = [-1001000000000 - i for i in range(20)]
+CHUNK = 20000
+
+
+def _url(i: int) -> str:
+    return f"https://opds.example/books/{i}/volumen-{i % 97}.epub"
+
+
+def _seed(engine, rows: int) -> None:
+    with engine.connect() as conn:
+        have = conn.execute(
+            sa.select(sa.func.count()).select_from(database.url_mappings)
+        ).scalar()
+    if have >= rows:
+        print(f"url_mappings/published_books ya sembradas ({have} filas)")
+        return
+
+    rnd = random.Random(42)
+    now = datetime.utcnow()
+    epoch = time.time()
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        for base in range(have, rows, CHUNK):
+            links, books = [], []
+            for i in range(base, min(rows, base + CHUNK)):
+                url = _url(i)
+                checked = rnd.random() < 0.9
+                valid = rnd.random() < 0.97
+                links.append(
+                    {
+                        "hash": hashlib.sha256(url.encode()).hexdigest()[:12],
+                        "url": url,
+                        "book_title": f"Libro {i}",
+                        "last_checked": (
+                            now - timedelta(seconds=rnd.randint(0, 7 * 86400))
+                            if checked
+                            else None
+                        ),
+                        "is_valid": valid,
+                        "failed_checks": 0 if valid else rnd.randint(1, 6),
+                        "hits": rnd.choice((0, 0, 0, 1, 2, 5, 40)),
+                        "next_check": (
+                            epoch + rnd.uniform(-3600, 7 * 86400) if checked else None
+                        ),
+                    }
+                )
+                books.append(
+                    {
+                        "channel_id": rnd.choice(CHANNELS),
+                        "title": f"Libro {i}",
+                        "slug": f"libro-{i}",
+                        "date_published": now
+                        - timedelta(seconds=rnd.randint(0, 730 * 86400)),
+                    }
+                )
+            conn.execute(database.url_mappings.insert(), links)
+            conn.execute(database.published_books.insert(), books)
+    print(
+        f"Sembradas {rows - have} filas por tabla en {time.perf_counter() - start:.1f} s"
+    )
+
+
+def _set_indexes(engine, enabled: bool) -> None:
+    for table in (database.url_mappings, database.published_books):
+        for index in table.indexes:
+            if enabled:
+                index.create(engine, checkfirst=True)
+            else:
+                index.drop(engine, checkfirst=True)
+    with engine.begin() as conn:
+        conn.execute(sa.text("ANALYZE"))
+
+
+def _measure(name: str, fn, repeat: int) -> None:
+    fn()  # calentar caché de páginas y pool
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(
+        f"  {name:<12} p50={statistics.median(samples):8.3f} ms  "
+        f"p95={p95:8.3f} ms  max={samples[-1]:8.3f} ms"
+    )
+
+
+def _run(label: str, rows: int, repeat: int) -> None:
+    rnd = random.Random(7)
+    print(f"\n[{label}]")
+
+    def url_lookup():
+        url_cache.create_short_url(_url(rnd.randrange(rows)))
+
+    def hash_lookup():
+        url = _url(rnd.randrange(rows))
+        url_cache.get_url_from_hash(hashlib.sha256(url.encode()).hexdigest()[:12])
+
+    _measure("url_lookup", url_lookup, repeat)
+    _measure("hash_lookup", hash_lookup, repeat)
+    _measure(
+        "candidates",
+        lambda: url_cache.get_candidates_for_validation(limit=50),
+        repeat,
+    )
+
+
+def _run_history(repeat: int) -> None:
+    rnd = random.Random(11)
+    print("\n[history_service]")
+    assert history_service.get_latest_books(limit=10), "published_books vacía"
+    _measure("latest", lambda: history_service.get_latest_books(limit=10), repeat)
+    _measure(
+        "latest_chan",
+        lambda: history_service.get_latest_books(
+            limit=10, channel_id=rnd.choice(CHANNELS)
+        ),
+        repeat,
+    )
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--database-url", default="")
+    parser.add_argument("--no-indexes", action="store_true")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv[1:])
+
+    db_url = args.database_url
+    sqlite_path = None
+    if not db_url:
+        sqlite_path = os.path.join(tempfile.gettempdir(), "zeepub_bench.db")
+        db_url = f"sqlite:///{sqlite_path}"
+    elif db_url.startswith("sqlite:///"):
+        sqlite_path = db_url[len("sqlite:///") :]
+
+    config.DATABASE_URL = db_url
+    engine = database.get_engine(db_url)
+    url_cache.init_db()  # tabla, columnas añadidas e índices
+    database.ensure_tables(engine, database.published_books)
+    _seed(engine, args.rows)
+    _set_indexes(engine, not args.no_indexes)
+    state = "sin índices" if args.no_indexes else "con índices"
+    print(f"{engine.dialect.name}, {args.rows} filas, {state}")
+
+    _run(f"url_cache vía SQLAlchemy ({engine.dialect.name})", args.rows, args.repeat)
+    _run_history(args.repeat)
+
+    if sqlite_path:
+        # Ruta sqlite3 nativa de url_cache (sin DATABASE_URL), mismo fichero
+        config.DATABASE_URL = ""
+        url_cache.DB_PATH = sqlite_path
+        _run("url_cache vía sqlite3", args.rows, args.repeat)
+
+    database.dispose_engines()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
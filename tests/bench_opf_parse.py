@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Benchmark del parser OPF: recorrido múltiple (anterior) frente a una sola pasada.
+
+Uso:
+    python tests/bench_opf_parse.py <carpeta_con_epubs> [repeticiones]
+
+Sin carpeta se usa un OPF sintético. Para cada libro se comprueba que ambos
+parsers devuelven el mismo dict y se imprime el tiempo medio por libro.
+"""
+
+import io
+import os
+import sys
+import timeit
+import zipfile
+import logging
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.epub_service import _parse_opf_metadata  # noqa: E402
+from utils.helpers import limpiar_html_basico  # noqa: E402
+
+logger = logging.getLogger("bench_opf_parse")
+
+SAMPLE_OPF = (
+    """<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="uid">urn:uuid:1234</dc:identifier>
+    <dc:identifier>https://editorial.example/libro</dc:identifier>
+    <dc:title>Volumen 1</dc:title>
+    <dc:creator id="c1">Autora</dc:creator>
+    <dc:contributor id="c2">Ilustradora</dc:contributor>
+    <dc:contributor id="c3">ZeePub</dc:contributor>
+    <dc:contributor id="c4">Traductor</dc:contributor>
+    <meta refines="#c2" property="role">ill</meta>
+    <meta refines="#c3" property="role">mrk</meta>
+    <meta refines="#c4" property="role">trl</meta>
+    <dc:subject>Fantasía</dc:subject>
+    <dc:subject>Seinen</dc:subject>
+    <dc:description>&lt;p&gt;Sinopsis&lt;/p&gt;</dc:description>
+    <dc:type>Novela ligera</dc:type>
+    <dc:publisher>Editorial</dc:publisher>
+    <dc:date>2020-07-02T00:00:00Z</dc:date>
+    <meta property="dcterms:modified">2022-07-03T10:28:12Z</meta>
+    <meta property="belongs-to-collection">Serie</meta>
+  </metadata>
+  <manifest>
+"""
+    + "".join(
+        f'    <item id="x{i}" href="Text/cap{i}.xhtml" media-type="application/xhtml+xml"/>\n'
+        for i in range(300)
+    )
+    + """  </manifest>
+</package>
+"""
+)
+
+
+def read_opf(path: str) -> Optional[bytes]:
+    with zipfile.ZipFile(path) as z:
+        try:
+            container = ET.fromstring(z.read("META-INF/container.xml"))
+            for rf in container.iter(
+                "{urn:oasis:names:tc:opendocument:xmlns:container}rootfile"
+            ):
+                full = rf.attrib.get("full-path", "")
+                if full.lower().endswith(".opf"):
+                    return z.read(full)
+        except Exception:
+            pass
+        for name in z.namelist():
+            if name.lower().endswith(".opf"):
+                return z.read(name)
+    return None
+
+
+# --- Implementación anterior (recorre el árbol ~10 veces) -------------------
+
+
+def local_name(elem: ET.Element) -> str:
+    tag = elem.tag
+    return tag.split("}", 1)[-1] if "}" in tag else tag
+
+
+def local_name_attr(attr_name: str) -> str:
+    return attr_name.split("}", 1)[-1] if "}" in attr_name else attr_name
+
+
+def parse_date(raw_date: str) -> str:
+    try:
+        if "T" in raw_date:
+            dt_str = raw_date.split("T")[0]
+            parts = dt_str.split("-")
+            if len(parts) == 3:
+                return f"{parts[2]}-{parts[1]}-{parts[0]}"
+        else:
+            parts = raw_date.split("-")
+            if len(parts) == 3:
+                return f"{parts[2]}-{parts[1]}-{parts[0]}"
+    except Exception:
+        pass
+    return raw_date
+
+
+def legacy_parse_opf(data: bytes) -> Dict[str, Any]:
+    root = ET.fromstring(data)
+    out: Dict[str, Any] = {
+        "titulo_volumen": None,
+        "titulo_serie": None,
+        "autores": [],
+        "ilustrador": None,
+        "generos": [],
+        "demografia": [],
+        "categoria": None,
+        "maquetadores": [],
+        "traductor": None,
+        "publisher": None,
+        "publisher_url": None,
+        "sinopsis": None,
+        "epub_version": None,
+        "fecha_modificacion": None,
+        "fecha_publicacion": None,
+    }
+
+    # Version EPUB: <package version="...">
+    # root es el elemento <package>
+    version = root.attrib.get("version")
+    out["epub_version"] = version
+    logger.debug(f"EPUB version extracted: {version}")
+
+    # Fecha modificación: dcterms:modified
+    # Ejemplo: <meta property="dcterms:modified">2022-07-03T10:28:12Z</meta>
+    for el in root.iter():
+        ln = local_name(el).lower()
+        if ln == "meta":
+            # Obtener atributos property y name ignorando namespaces
+            attribs = {local_name_attr(k).lower(): v for k, v in el.attrib.items()}
+            prop = attribs.get("property", "")
+            name = attribs.get("name", "")
+
+            if "modified" in prop or "modified" in name:
+                if el.text:
+                    raw_date = el.text.strip()
+                    out["fecha_modificacion"] = parse_date(raw_date)
+                    logger.debug(
+                        f"Modified date found: {raw_date} -> {out['fecha_modificacion']}"
+                    )
+                    break
+
+    # Fecha publicación: dc:date
+    # Ejemplo: <dc:date>2020-07-02T00:00:00Z</dc:date>
+    for el in root.iter():
+        ln = local_name(el).lower()
+        if ln == "date":
+            # Verificar si es dc:date (aunque local_name ya lo filtra, aseguramos que sea fecha)
+            if el.text:
+                raw_date = el.text.strip()
+                # Si ya tenemos una fecha, solo sobrescribimos si el evento es 'publication'
+                attribs = {local_name_attr(k).lower(): v for k, v in el.attrib.items()}
+                event = attribs.get("event", "")
+
+                parsed = parse_date(raw_date)
+                if not out["fecha_publicacion"]:
+                    out["fecha_publicacion"] = parsed
+                    logger.debug(f"Publication date found: {raw_date} -> {parsed}")
+                elif event == "publication":
+                    out["fecha_publicacion"] = parsed
+                    logger.debug(
+                        f"Publication date (event=publication) found: {raw_date} -> {parsed}"
+                    )
+                    break
+
+    # Título volumen: primer <dc:title> o <title>
+    for el in root.iter():
+        if local_name(el).lower() == "title" and el.text:
+            out["titulo_volumen"] = el.text.strip()
+            break
+
+    # Título serie: <meta property="belongs-to-collection">
+    for el in root.iter():
+        if local_name(el).lower() == "meta":
+            prop = el.attrib.get("property", "") or el.attrib.get(
+                "{http://www.idpf.org/2007/opf}property", ""
+            )
+            if prop == "belongs-to-collection" and el.text:
+                out["titulo_serie"] = el.text.strip()
+                break
+
+    # Creators & contributors
+    contributors = []
+    id_to_name: Dict[str, str] = {}
+    for el in root.iter():
+        ln = local_name(el).lower()
+        if ln in ("creator", "dc:creator"):
+            text = (el.text or "").strip()
+            if text:
+                out["autores"].append(text)
+            cid = el.attrib.get("id")
+            if cid and text:
+                id_to_name[cid] = text
+        elif ln in ("contributor", "dc:contributor"):
+            text = (el.text or "").strip()
+            if text:
+                contributors.append(text)
+            cid = el.attrib.get("id")
+            if cid and text:
+                id_to_name[cid] = text
+
+    # Subjects => géneros y demografía
+    subjects = [
+        (el.text or "").strip()
+        for el in root.iter()
+        if local_name(el).lower() in ("subject", "dc:subject") and el.text
+    ]
+    dem_keys = {"seinen", "shounen", "shônen", "shoujo", "josei", "juvenil"}
+    for s in subjects:
+        if any(k in s.lower() for k in dem_keys):
+            out["demografia"].append(s)
+        else:
+            out["generos"].append(s)
+
+    # Sinopsis: dc:description, description o summary
+    for el in root.iter():
+        ln = local_name(el).lower()
+        if ln in ("description", "dc:description", "summary") and el.text:
+            out["sinopsis"] = limpiar_html_basico(el.text.strip())
+            break
+
+    # Categoría: dc:type
+    for el in root.iter():
+        if local_name(el).lower() in ("type", "dc:type") and el.text:
+            out["categoria"] = el.text.strip()
+            break
+
+    # Publisher
+    for el in root.iter():
+        if local_name(el).lower() in ("publisher", "dc:publisher") and el.text:
+            out["publisher"] = el.text.strip()
+            break
+
+    # Publisher URL: dc:identifier con http o urn:uri
+    for el in root.iter():
+        if local_name(el).lower() in ("identifier", "dc:identifier") and el.text:
+            txt = el.text.strip()
+            if txt.startswith("http") or txt.startswith("urn:uri:"):
+                if txt.startswith("urn:uri:"):
+                    parts = txt.split(":", 2)
+                    txt = parts[-1] if len(parts) == 3 else txt
+                out["publisher_url"] = txt
+                break
+
+    # Roles meta: map id->role
+    roles: Dict[str, str] = {}
+    for el in root.iter():
+        if local_name(el).lower() == "meta":
+            prop = el.attrib.get("property", "") or el.attrib.get(
+                "{http://www.idpf.org/2007/opf}property", ""
+            )
+            if prop.lower() == "role":
+                ref = el.attrib.get("refines", "") or el.attrib.get(
+                    "{http://www.idpf.org/2007/opf}refines", ""
+                )
+                if ref and el.text:
+                    roles[ref.lstrip("#")] = el.text.strip().lower()
+
+    # Asignar roles
+    maquet_roles = {"mrk", "dst", "mqt", "mkr"}
+    for rid, role in roles.items():
+        name = id_to_name.get(rid)
+        if not name:
+            continue
+        if role in maquet_roles:
+            out["maquetadores"].append(name)
+        elif role in ("trl", "translator"):
+            out["traductor"] = name
+        elif role in ("ill", "illustrator", "artist"):
+            out["ilustrador"] = name
+        elif role in ("aut", "author") and not out["autores"]:
+            out["autores"].append(name)
+
+    # Heurísticas si falta ilustrador o maquetadores
+    if not out["ilustrador"]:
+        for c in contributors:
+            if any(tok in c.lower() for tok in ("ill", "artist")):
+                out["ilustrador"] = c
+                break
+    if not out["maquetadores"]:
+        for c in contributors:
+            if any(tok in c.lower() for tok in ("saosora", "zeepub")):
+                out["maquetadores"].append(c)
+        if not out["maquetadores"]:
+            out["maquetadores"].extend(contributors)
+
+    # Dedupe maquetadores
+    seen = set()
+    mq = []
+    for m in out["maquetadores"]:
+        if m not in seen:
+            seen.add(m)
+            mq.append(m)
+    out["maquetadores"] = mq
+
+    return out
+
+
+# --- Benchmark ----------------------------------------------------------------
+
+
+def _time(fn, data: bytes, repeat: int) -> float:
+    # Mejor de 5 rondas para reducir el ruido del sistema
+    return min(timeit.repeat(lambda: fn(data), number=repeat, repeat=5)) / repeat
+
+
+def main(argv: List[str]) -> int:
+    corpus: Dict[str, bytes] = {}
+    repeat = int(argv[2]) if len(argv) > 2 else 50
+    if len(argv) > 1:
+        for dirpath, _dirs, files in os.walk(argv[1]):
+            for name in sorted(files):
+                if name.lower().endswith(".epub"):
+                    full = os.path.join(dirpath, name)
+                    try:
+                        opf = read_opf(full)
+                    except zipfile.BadZipFile:
+                        opf = None
+                    if opf:
+                        corpus[name] = opf
+    else:
+        corpus["<sintético>"] = SAMPLE_OPF.encode("utf-8")
+
+    if not corpus:
+        print("No se encontraron EPUBs")
+        return 1
+
+    total_old = total_new = 0.0
+    mismatches = 0
+    for name, opf in corpus.items():
+        if legacy_parse_opf(opf) != _parse_opf_metadata(opf):
+            mismatches += 1
+            print(f"!! resultado distinto: {name}")
+        old = _time(legacy_parse_opf, opf, repeat)
+        new = _time(_parse_opf_metadata, opf, repeat)
+        total_old += old
+        total_new += new
+        print(f"{old * 1e6:9.1f} µs -> {new * 1e6:9.1f} µs  {name}")
+
+    n = len(corpus)
+    print(
+        f"\n{n} libros, media por libro: {total_old / n * 1e6:.1f} µs -> "
+        f"{total_new / n * 1e6:.1f} µs (x{total_old / total_new:.2f}), "
+        f"{mismatches} diferencias"
+    )
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
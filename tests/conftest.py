@@ -8,3 +8,7 @@ from pathlib import Path
 # Add project root to Python path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
+
+# Algunos tests sustituyen paquetes (`services`, `utils`...) en sys.modules al
+# importarse; los módulos reales que usan otros tests se cargan antes.
+import services.user_service  # noqa: E402,F401
@@ -72,3 +72,160 @@ def test_search_books():
         assert response.status_code == 200
         data = response.json()
         assert data["title"] == "Search Results"
+
+def test_facebook_links_batch():
+    import types
+
+    calls = []
+
+    def fake_create_short_urls(items):
+        calls.append(items)
+        return [f"h{i}" for i in range(len(items))]
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("api.routes.config.FACEBOOK_PUBLISHERS", [42])
+        m.setattr("api.routes.config.DL_DOMAIN", "dl.example")
+        m.setattr("api.routes.config.SHORT_LINK_BATCH_MAX", 2)
+        m.setitem(
+            sys.modules,
+            "utils.url_cache",
+            types.SimpleNamespace(create_short_urls=fake_create_short_urls),
+        )
+
+        items = [{"url": "https://opds/a.epub", "title": "A"}, "https://opds/b.epub"]
+        response = client.post("/api/facebook/links?uid=42", json={"items": items})
+        assert response.status_code == 200
+        assert response.json()["links"] == [
+            {
+                "url": "https://opds/a.epub",
+                "hash": "h0",
+                "short_url": "https://dl.example/api/dl/h0",
+            },
+            {
+                "url": "https://opds/b.epub",
+                "hash": "h1",
+                "short_url": "https://dl.example/api/dl/h1",
+            },
+        ]
+        assert calls == [items]
+
+        forbidden = {"urls": ["https://x"]}
+        response = client.post("/api/facebook/links?uid=7", json=forbidden)
+        assert response.status_code == 403
+        bad = ({}, {"urls": []}, {"urls": ["ftp://x"]}, {"urls": ["https://x"] * 3})
+        for body in bad:
+            response = client.post("/api/facebook/links?uid=42", json=body)
+            assert response.status_code == 400
+        assert len(calls) == 1
+
+
+def test_public_download_revalidates_stale_copy(tmp_path):
+    from utils.epub_store import EpubStore
+
+    store = EpubStore(str(tmp_path), max_bytes=10_000, revalidate_after=0)
+    store.put("https://opds/stale.epub", b"EPUB" * 10, etag='"v1"')
+    sent = []
+
+    class _NotModified:
+        status = 304
+        headers = {}
+
+        def release(self):
+            pass
+
+    async def fake_open_store():
+        return store
+
+    async def fake_open_upstream(url, headers=None, **kwargs):
+        sent.append(headers)
+        return _NotModified()
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr("api.routes.open_epub_store", fake_open_store)
+        m.setattr("api.routes.open_upstream", fake_open_upstream)
+        response = client.get(
+            "/api/public/dl", params={"url": "https://opds/stale.epub"}
+        )
+
+    assert response.status_code == 200
+    assert response.content == b"EPUB" * 10
+    assert sent == [{"If-None-Match": '"v1"'}]
+
+
+def test_public_download_is_limited_per_origin():
+    from utils.rate_limiter import RateLimitManager
+    import api.routes as routes
+
+    with pytest.MonkeyPatch.context() as m:
+        manager = RateLimitManager()
+        m.setattr(routes, "get_rate_limit_manager", lambda: manager)
+        m.setattr(routes.config, "API_ORIGIN_RATE_LIMIT_PER_MINUTE", 2)
+        # La URL no es válida: solo interesa que el límite va antes
+        codes = [
+            client.get("/api/public/dl", params={"url": "ftp://x"}).status_code
+            for _ in range(2)
+        ]
+        limited = client.get("/api/public/dl", params={"url": "ftp://x"})
+
+    assert codes == [400, 400]
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+
+
+@pytest.mark.asyncio
+async def test_unconsumed_download_response_releases_the_upstream(tmp_path):
+    import importlib
+    import types
+    import api.routes as routes
+
+    # Otros tests sustituyen el paquete `utils` en sys.modules
+    streaming = importlib.import_module("utils.streaming")
+    EpubStore = importlib.import_module("utils.epub_store").EpubStore
+    get_host_limiter = importlib.import_module("utils.host_limiter").get_host_limiter
+
+    url = "http://never-consumed.test/book.epub"
+    released = []
+
+    class _Resp:
+        status = 200
+        headers = {"Content-Length": "4"}
+        content_length = 4
+
+        def release(self):
+            released.append(True)
+
+    class _Session:
+        async def get(self, url, **kwargs):
+            return _Resp()
+
+    store = EpubStore(str(tmp_path), max_bytes=10_000)
+
+    async def fake_open_store():
+        return store
+
+    async def fake_open_upstream(url, headers=None, **kwargs):
+        return await streaming.open_upstream(url, headers, session=_Session())
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr(routes, "open_epub_store", fake_open_store)
+        m.setattr(routes, "open_upstream", fake_open_upstream)
+        request = types.SimpleNamespace(headers={})
+        response = await routes.public_download(request, url=url, title="libro")
+
+    limiter = get_host_limiter(url)
+    assert limiter.inflight == 1
+    assert streaming.UpstreamFlight.get(url) is not None
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # El cliente se fue antes de recibir nada
+        raise OSError("connection reset")
+
+    # anyio lo envuelve en un ExceptionGroup
+    with pytest.raises(Exception):
+        await response({"type": "http"}, receive, send)
+
+    assert released and limiter.inflight == 0
+    assert streaming.UpstreamFlight.get(url) is None
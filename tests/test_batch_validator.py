@@ -0,0 +1,333 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+# Se recoge antes que los tests que sustituyen `utils` en sys.modules
+from utils import url_cache, url_validator
+
+
+@pytest.fixture
+def links_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(url_cache.config, "DATABASE_URL", "")
+    monkeypatch.setattr(url_cache, "DB_PATH", str(tmp_path / "url_cache.db"))
+    url_cache.init_db()
+    return url_cache.DB_PATH
+
+
+@asynccontextmanager
+async def _origin():
+    requests = []
+
+    async def handler(request):
+        requests.append((request.method, request.path))
+        if request.path == "/gone":
+            return web.Response(status=404)
+        if request.path == "/nohead" and request.method == "HEAD":
+            return web.Response(status=405)
+        return web.Response(status=206 if "Range" in request.headers else 200)
+
+    app = web.Application()
+    app.router.add_route("*", "/{name}", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}", requests
+    finally:
+        await runner.cleanup()
+
+
+def _row(db_path, url_hash):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT is_valid, failed_checks, last_checked FROM url_mappings "
+            "WHERE hash = ?",
+            (url_hash,),
+        ).fetchone()
+
+
+@pytest.mark.asyncio
+async def test_head_first_with_get_fallback_and_batched_write(links_db):
+    async with _origin() as (base, requests), aiohttp.ClientSession() as session:
+        links = {
+            name: url_cache.create_short_url(f"{base}/{name}")
+            for name in ("ok", "nohead", "gone")
+        }
+        candidates = [(h, f"{base}/{name}") for name, h in links.items()]
+        results = await url_validator.validate_urls(
+            candidates, concurrency=2, host_interval=0, session=session
+        )
+
+    assert results == {links["ok"]: True, links["nohead"]: True, links["gone"]: False}
+    # HEAD basta salvo cuando el origen no lo admite
+    assert requests.count(("GET", "/ok")) == 0
+    assert ("GET", "/nohead") in requests
+    assert requests.count(("GET", "/gone")) == 0
+
+    assert _row(links_db, links["ok"])[:2] == (1, 0)
+    assert _row(links_db, links["gone"])[:2] == (0, 1)
+    assert all(_row(links_db, h)[2] for h in links.values())
+
+
+def test_record_validation_results_counts_failures(links_db):
+    h = url_cache.create_short_url("https://example.com/flaky.epub")
+    url_cache.record_validation_results([(h, False)])
+    url_cache.record_validation_results([(h, False)])
+    assert _row(links_db, h)[:2] == (0, 2)
+    url_cache.record_validation_results([(h, True)])
+    assert _row(links_db, h)[:2] == (1, 0)
+    assert url_cache.record_validation_results([]) == 0
+
+
+def _next_check(db_path, url_hash):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(
+            "SELECT next_check, hits FROM url_mappings WHERE hash = ?", (url_hash,)
+        ).fetchone()
+
+
+def test_revalidation_schedule(monkeypatch):
+    monkeypatch.setattr(url_cache.config, "VALIDATOR_MAX_BACKOFF", 8 * 3600)
+    after = url_cache.revalidate_after
+    assert after(0, 0, 3600) == 3600
+    assert after(1, 0, 3600) == 1800
+    assert after(10**6, 0, 3600) == 450  # como mucho 8 veces más a menudo
+    assert [after(0, n, 3600) for n in (1, 2, 3, 4, 5)] == [
+        3600,
+        7200,
+        14400,
+        28800,
+        28800,
+    ]
+
+
+def test_failure_streak_backs_off(links_db):
+    dead = url_cache.create_short_url("https://example.com/dead.epub")
+    before = time.time()
+    for _ in range(3):
+        url_cache.record_validation_results([(dead, False)], interval=100)
+    next_check, _ = _next_check(links_db, dead)
+    assert _row(links_db, dead)[:2] == (0, 3)
+    assert before + 400 <= next_check <= time.time() + 400
+    # Programado en el futuro: ya no es candidato aunque esté roto
+    assert url_cache.get_candidates_for_validation(limit=10) == []
+
+
+def test_hits_pull_revalidation_forward(links_db):
+    hot = url_cache.create_short_url("https://example.com/hot.epub")
+    cold = url_cache.create_short_url("https://example.com/cold.epub")
+    url_cache.record_validation_results([(hot, True), (cold, True)], interval=3600)
+    cold_next = _next_check(links_db, cold)[0]
+
+    for _ in range(3):
+        url_cache.record_hit(hot)
+    assert url_cache.flush_hits(interval=3600) == 1
+    hot_next, hits = _next_check(links_db, hot)
+    assert hits == 3
+    assert hot_next <= cold_next - 1700  # un tercio del intervalo en vez de uno
+    assert url_cache.flush_hits() == 0
+
+    # Al revalidar, el tráfico acumulado se reduce a la mitad
+    url_cache.record_validation_results([(hot, True)], interval=3600)
+    assert _next_check(links_db, hot)[1] == 1
+
+
+def test_candidates_most_urgent_first(links_db, monkeypatch):
+    never = url_cache.create_short_url("https://example.com/never.epub")
+    soon = url_cache.create_short_url("https://example.com/soon.epub")
+    late = url_cache.create_short_url("https://example.com/late.epub")
+    url_cache.record_validation_results([(soon, True), (late, True)], interval=3600)
+    with sqlite3.connect(links_db) as conn:
+        conn.execute("UPDATE url_mappings SET next_check = 10 WHERE hash = ?", (soon,))
+        conn.execute("UPDATE url_mappings SET next_check = 20 WHERE hash = ?", (late,))
+
+    hashes = [h for h, _ in url_cache.get_candidates_for_validation(limit=10)]
+    assert hashes == [never, soon, late]
+
+
+def test_legacy_tables_get_new_columns(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "legacy.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE url_mappings (hash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "book_title TEXT, series_name TEXT, volume_number TEXT, "
+            "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_checked TIMESTAMP, "
+            "is_valid BOOLEAN DEFAULT 1, failed_checks INTEGER DEFAULT 0)"
+        )
+    monkeypatch.setattr(url_cache.config, "DATABASE_URL", "")
+    monkeypatch.setattr(url_cache, "DB_PATH", db_path)
+    url_cache.init_db()
+    url_cache.init_db()
+    with sqlite3.connect(db_path) as conn:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(url_mappings)")}
+    assert {"hits", "last_hit", "next_check"} <= columns
+
+
+def test_continuous_mode_spreads_checks_over_the_interval():
+    assert url_validator._per_tick(36000, 3600, 60) == 600
+    assert url_validator._per_tick(10, 3600, 60) == 1
+    assert url_validator._per_tick(0, 3600, 60) == 0
+
+
+@pytest.mark.asyncio
+async def test_validator_queries_run_off_the_event_loop(monkeypatch):
+    loop_thread = threading.get_ident()
+    threads = []
+
+    def fake_query(name, result):
+        def query(*args, **kwargs):
+            threads.append((name, threading.get_ident() != loop_thread))
+            return result
+
+        return query
+
+    monkeypatch.setattr(url_validator, "count_mappings", fake_query("count", 10))
+    monkeypatch.setattr(
+        url_validator, "get_candidates_for_validation", fake_query("candidates", [])
+    )
+    await url_validator._run_tick(3600, 60)
+    await url_validator._run_batch(3600, 50)
+    assert threads == [("count", True), ("candidates", True), ("candidates", True)]
+
+    # El bucle vuelca los clics antes de cada pasada
+    monkeypatch.setattr(url_validator, "flush_hits", fake_query("hits", 0))
+    loop = asyncio.ensure_future(url_validator._validator_loop(3600, mode="batch"))
+    await asyncio.sleep(0.05)
+    loop.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await loop
+    assert ("hits", True) in threads
+
+
+@pytest.mark.asyncio
+async def test_host_pacer_spaces_requests_per_host(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(round(delay, 2))
+
+    monkeypatch.setattr(url_validator.asyncio, "sleep", fake_sleep)
+    pacer = url_validator._HostPacer(0.5)
+    for url in ("http://a/1", "http://a/2", "http://b/1", "http://a/3"):
+        await pacer.wait(url)
+    assert sleeps == [0.5, 1.0]
+
+
+def test_short_link_cache_serves_repeat_lookups(links_db, monkeypatch):
+    monkeypatch.setattr(url_cache.config, "SHORT_LINK_CACHE_TTL", 60)
+    monkeypatch.setattr(url_cache.config, "SHORT_LINK_NEGATIVE_TTL", 60)
+    url_cache.invalidate_link_cache()
+    h = url_cache.create_short_url("https://example.com/libros/Mi%20Libro.epub")
+
+    lookups = []
+    real = url_cache.get_url_from_hash
+
+    def counting(url_hash):
+        lookups.append(url_hash)
+        return real(url_hash)
+
+    monkeypatch.setattr(url_cache, "get_url_from_hash", counting)
+    before = url_cache.get_link_cache_stats()
+    for _ in range(5):
+        assert url_cache.resolve_short_link(h) == (
+            "https://example.com/libros/Mi%20Libro.epub",
+            "Mi Libro",
+        )
+        assert url_cache.resolve_short_link("desconocido") is None
+    assert lookups == [h, "desconocido"]
+    stats = url_cache.get_link_cache_stats()
+    assert stats["hits"] - before["hits"] == 4
+    assert stats["negative_hits"] - before["negative_hits"] == 4
+    assert stats["hit_ratio"] > 0
+
+    # Un hash creado después de cachear su ausencia se resuelve al momento
+    new_url = "https://example.com/libros/Nuevo.epub"
+    expected = hashlib.sha256(new_url.encode()).hexdigest()[:12]
+    assert url_cache.resolve_short_link(expected) is None
+    assert url_cache.create_short_url(new_url) == expected
+    assert url_cache.resolve_short_link(expected)[1] == "Nuevo"
+
+    # El validador invalida los enlaces que encuentra rotos
+    url_cache.record_validation_results([(h, False)])
+    url_cache.resolve_short_link(h)
+    assert lookups.count(h) == 2
+
+
+def _bulk_scenario():
+    existing = url_cache.create_short_url("https://example.com/a.epub")
+    # Un enlace antiguo ocupa el prefijo de 12 caracteres de otra URL
+    clash = "https://example.com/clash.epub"
+    prefix = hashlib.sha256(clash.encode()).hexdigest()[:12]
+    return existing, clash, prefix
+
+
+def _assert_bulk(existing, clash, prefix):
+    hashes = url_cache.create_short_urls(
+        [
+            "https://example.com/b.epub",
+            {"url": "https://example.com/a.epub", "title": "A"},
+            ("https://example.com/b.epub", "B", "Serie", "2"),
+            clash,
+        ]
+    )
+    assert hashes[1] == existing
+    assert hashes[0] == hashes[2]
+    assert hashes[3] != prefix and hashes[3].startswith(prefix)
+    titles = {h: (url, title) for h, url, title, _ in url_cache.get_recent_links(10)}
+    assert titles[hashes[0]] == ("https://example.com/b.epub", "B")
+    assert titles[existing] == ("https://example.com/a.epub", "A")
+    assert titles[prefix] == ("https://example.com/old.epub", None)
+    # Los mismos enlaces que crearía create_short_url, uno a uno
+    assert url_cache.create_short_url(clash) == hashes[3]
+    assert url_cache.create_short_urls([clash, "https://example.com/b.epub"]) == [
+        hashes[3],
+        hashes[0],
+    ]
+    assert url_cache.create_short_urls([]) == []
+
+
+def test_create_short_urls_in_bulk(links_db):
+    existing, clash, prefix = _bulk_scenario()
+    with sqlite3.connect(links_db) as conn:
+        conn.execute(
+            "INSERT INTO url_mappings (hash, url) VALUES (?, ?)",
+            (prefix, "https://example.com/old.epub"),
+        )
+    _assert_bulk(existing, clash, prefix)
+
+
+def test_create_short_urls_in_bulk_sqlalchemy(tmp_path, monkeypatch):
+    if not url_cache._HAS_SQLALCHEMY:
+        pytest.skip("SQLAlchemy not installed")
+    db_url = f"sqlite:///{tmp_path / 'links.db'}"
+    monkeypatch.setattr(url_cache.config, "DATABASE_URL", db_url)
+    url_cache.init_db()
+    engine = url_cache._get_sa_engine()
+    try:
+        existing, clash, prefix = _bulk_scenario()
+        with engine.begin() as conn:
+            conn.execute(
+                url_cache.url_mappings.insert(),
+                {"hash": prefix, "url": "https://example.com/old.epub"},
+            )
+        _assert_bulk(existing, clash, prefix)
+    finally:
+        engine.dispose()
+
+
+def test_create_short_urls_invalidates_cached_misses(links_db):
+    url = "https://example.com/libros/Lote.epub"
+    expected = hashlib.sha256(url.encode()).hexdigest()[:12]
+    url_cache.invalidate_link_cache()
+    assert url_cache.resolve_short_link(expected) is None
+    assert url_cache.create_short_urls([url]) == [expected]
+    assert url_cache.resolve_short_link(expected) == (url, "Lote")
@@ -0,0 +1,111 @@
+import importlib
+
+# Otros tests sustituyen el paquete `core` en sys.modules
+sm = importlib.import_module("core.state_manager")
+
+
+def test_idle_states_are_evicted_with_their_temp_file(tmp_path, monkeypatch):
+    manager = sm.StateManager(idle_ttl=60)
+    clock = [1000.0]
+    monkeypatch.setattr(sm.time, "monotonic", lambda: clock[0])
+
+    tmp = tmp_path / "pending.epub"
+    tmp.write_bytes(b"epub")
+    manager.get_user_state(1)["epub_buffer"] = str(tmp)
+    clock[0] += 30
+    manager.get_user_state(2)
+
+    clock[0] += 40  # el usuario 1 lleva 70 s inactivo, el 2 solo 40
+    assert manager.sweep() == 1
+    assert list(manager.user_state) == [2]
+    assert not tmp.exists()
+    assert manager.stats()["evicted_idle"] == 1
+
+    # Volver a entrar crea un estado nuevo
+    assert "epub_buffer" not in manager.get_user_state(1)
+
+
+def test_budget_evicts_least_recently_used():
+    manager = sm.StateManager(max_bytes=3 * 1024 * 1024 + 512 * 1024)
+    for uid in (1, 2, 3):
+        manager.get_user_state(uid)["epub_buffer"] = b"x" * (1024 * 1024)
+    manager.get_user_state(1)  # 1 pasa a ser el más reciente
+
+    manager.get_user_state(4)["epub_buffer"] = b"x" * (1024 * 1024)
+    assert manager.sweep() == 1
+    assert list(manager.user_state) == [3, 1, 4]
+
+    stats = manager.stats()
+    assert stats["users"] == 3
+    assert stats["bytes"] <= manager.max_bytes
+    assert stats["evicted_budget"] == 1
+
+
+def _shared_backend(tmp_path):
+    backends = importlib.import_module("core.state_backends")
+    return backends.SQLiteStateBackend(
+        str(tmp_path / "state.db"), str(tmp_path / "blobs")
+    )
+
+
+def test_sqlite_backend_shares_state_between_replicas(tmp_path):
+    backend = _shared_backend(tmp_path)
+    a = sm.StateManager(backend=backend)
+    b = sm.StateManager(backend=backend)
+
+    st = a.get_user_state(7)
+    st["url"] = "https://opds/feed"
+    st["volume_id"] = ("12", "3")
+    st["epub_buffer"] = b"PK epub bytes"
+    a.persist(7)
+
+    other = b.get_user_state(7)
+    assert other["url"] == "https://opds/feed"
+    assert other["volume_id"] == ["12", "3"]
+    # El blob se guarda aparte y llega como ruta, igual que un temporal
+    blob = other["epub_buffer"]
+    assert blob.startswith(str(tmp_path / "blobs"))
+    with open(blob, "rb") as f:
+        assert f.read() == b"PK epub bytes"
+
+    # b escribe después: a descarta su copia local y recarga
+    other["url"] = "https://opds/otra"
+    b.persist(7)
+    a.refresh(7)
+    assert a.get_user_state(7)["url"] == "https://opds/otra"
+
+    a.evict(7)
+    assert backend.load(7) is None
+    assert list((tmp_path / "blobs" / "7").iterdir()) == []
+
+
+def test_sqlite_backend_budget_offloads_instead_of_deleting(tmp_path):
+    backend = _shared_backend(tmp_path)
+    manager = sm.StateManager(max_bytes=1, backend=backend)
+    manager.get_user_state(1)["url"] = "a"
+    manager.get_user_state(2)["url"] = "b"
+    assert manager.sweep() == 1
+    assert list(manager.user_state) == [2]
+    # El estado expulsado sigue en el backend
+    assert manager.get_user_state(1)["url"] == "a"
+
+
+def test_sqlite_backend_keeps_int_keys(tmp_path, caplog):
+    backend = _shared_backend(tmp_path)
+    a = sm.StateManager(backend=backend)
+    b = sm.StateManager(backend=backend)
+
+    st = a.get_user_state(3)
+    # opds_service guarda las colecciones por índice int
+    st["colecciones"] = {0: {"titulo": "Saga", "libros": {1: "x"}}}
+    st["libros"] = {"uuid-1": {"titulo": "Libro"}}
+    st["lock"] = object()
+    with caplog.at_level("WARNING"):
+        a.persist(3)
+    assert "'lock'" in caplog.text
+
+    other = b.get_user_state(3)
+    assert other["colecciones"].get(0)["titulo"] == "Saga"
+    assert other["colecciones"][0]["libros"] == {1: "x"}
+    assert other["libros"] == {"uuid-1": {"titulo": "Libro"}}
+    assert "lock" not in other
@@ -0,0 +1,77 @@
+import importlib
+
+import pytest
+from aiohttp import web
+
+# Otros tests sustituyen `core.session_manager` en sys.modules al importarse:
+# este fichero se recoge antes que ellos
+session_module = importlib.import_module("core.session_manager")
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    cfg = session_module.config
+    monkeypatch.setattr(cfg, "HTTP_POOL_LIMIT", 7)
+    monkeypatch.setattr(cfg, "HTTP_POOL_LIMIT_PER_HOST", 3)
+    monkeypatch.setattr(cfg, "HTTP_DNS_TTL", 120)
+    monkeypatch.setattr(cfg, "HTTP_CONNECT_TIMEOUT", 4)
+    monkeypatch.setattr(cfg, "HTTP_READ_TIMEOUT", 20)
+    monkeypatch.setattr(cfg, "HTTP_ACCEPT_ENCODING", "gzip")
+    return session_module.SessionManager()
+
+
+@pytest.mark.asyncio
+async def test_session_uses_configured_pool(manager):
+    session = manager.get_session()
+    try:
+        connector = session.connector
+        assert connector.limit == 7
+        assert connector.limit_per_host == 3
+        assert connector.use_dns_cache
+        assert session.timeout.total is None
+        assert session.timeout.connect == 4
+        assert session.timeout.sock_read == 20
+        assert session.headers["Accept-Encoding"] == "gzip"
+        assert manager.get_session() is session
+    finally:
+        await manager.aclose()
+    assert session.closed
+    # Tras cerrar se crea una sesión nueva
+    again = manager.get_session()
+    assert again is not session
+    await manager.aclose()
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused(manager):
+    app = web.Application()
+    app.router.add_get("/", lambda request: web.Response(text="ok"))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        session = manager.get_session()
+        for _ in range(3):
+            async with session.get(f"http://127.0.0.1:{port}/") as resp:
+                assert await resp.text() == "ok"
+        stats = manager.stats()
+        assert stats["in_use"] == 0
+        # Las tres peticiones comparten una única conexión keep-alive
+        assert stats["idle"] == 1
+    finally:
+        await manager.aclose()
+        await runner.cleanup()
+    assert manager.stats()["idle"] == 0
+
+
+@pytest.mark.asyncio
+async def test_http_client_is_shared_and_closed(manager):
+    client = manager.get_http_client()
+    assert manager.get_http_client() is client
+    assert client.headers["Accept-Encoding"] == "gzip"
+    assert manager.stats()["httpx"]
+    await manager.aclose()
+    assert client.is_closed
+    assert not manager.stats()["httpx"]
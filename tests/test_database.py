@@ -0,0 +1,76 @@
+import importlib
+
+import pytest
+
+sa = pytest.importorskip("sqlalchemy")
+
+# Otros tests sustituyen el paquete `utils` en sys.modules
+database = importlib.import_module("utils.database")
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    yield url
+    database.dispose_engines()
+
+
+def test_engine_is_shared_per_url(db_url, tmp_path):
+    engine = database.get_engine(db_url)
+    assert database.get_engine(db_url) is engine
+    other = database.get_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    assert other is not engine
+
+
+def test_ensure_tables_creates_once(db_url, monkeypatch):
+    engine = database.get_engine(db_url)
+    calls = []
+    create_all = database.metadata.create_all
+
+    def spy(bind, tables=None, **kw):
+        calls.append([t.name for t in tables])
+        return create_all(bind, tables=tables, **kw)
+
+    monkeypatch.setattr(database.metadata, "create_all", spy)
+    database.ensure_tables(engine, database.url_mappings)
+    database.ensure_tables(engine, database.url_mappings, database.bot_settings)
+    database.ensure_tables(engine, database.bot_settings)
+    assert calls == [["url_mappings"], ["bot_settings"]]
+
+    table = database.url_mappings
+    with engine.begin() as conn:
+        conn.execute(table.insert().values(hash="abc", url="https://x/a.epub"))
+        row = conn.execute(table.select()).first()
+    assert row.url == "https://x/a.epub"
+    assert row.failed_checks == 0
+
+
+def test_ensure_tables_adds_indexes_to_existing_tables(db_url):
+    engine = database.get_engine(db_url)
+    with engine.begin() as conn:
+        # Tabla creada por una versión anterior, sin índices
+        conn.execute(
+            sa.text(
+                "CREATE TABLE published_books (id INTEGER PRIMARY KEY, "
+                "channel_id BIGINT, title TEXT, date_published DATETIME)"
+            )
+        )
+    database.ensure_tables(engine, database.published_books)
+    names = {ix["name"] for ix in sa.inspect(engine).get_indexes("published_books")}
+    assert {"ix_published_books_date", "ix_published_books_channel_date"} <= names
+
+
+def test_unique_url_index_is_skipped_with_duplicates(db_url):
+    engine = database.get_engine(db_url)
+    database.ensure_tables(engine, database.url_mappings)
+    database.ensure_indexes(engine, database.url_mappings)
+    with engine.begin() as conn:
+        conn.execute(sa.text("DROP INDEX ux_url_mappings_url"))
+        for h in ("a", "b"):
+            conn.execute(
+                database.url_mappings.insert().values(hash=h, url="https://x/dup.epub")
+            )
+    database.ensure_indexes(engine, database.url_mappings)
+    names = {ix["name"] for ix in sa.inspect(engine).get_indexes("url_mappings")}
+    assert "ux_url_mappings_url" not in names
+    assert {"ix_url_mappings_url", "ix_url_mappings_validation"} <= names
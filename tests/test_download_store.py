@@ -0,0 +1,71 @@
+import importlib
+
+import pytest
+
+# Otros tests sustituyen el paquete `utils` en sys.modules
+download_store = importlib.import_module("utils.download_store")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "downloads.db")
+    yield path
+    download_store.get_pool(path).close()
+
+
+def _rows(path):
+    with download_store.get_pool(path).read() as conn:
+        return conn.execute(
+            "SELECT telegram_id, used, day FROM daily_downloads ORDER BY telegram_id"
+        ).fetchall()
+
+
+def test_increments_are_written_through(db_path):
+    store = download_store.DownloadCounterStore(db_path)
+    assert [store.increment(1) for _ in range(3)] == [1, 2, 3]
+    store.increment(2)
+    store.set(3, 7)
+    assert store.increment(3) == 8
+
+    today = download_store._today()
+    assert _rows(db_path) == [(1, 3, today), (2, 1, today), (3, 8, today)]
+
+    # Un nuevo proceso recupera los contadores del día
+    reloaded = download_store.DownloadCounterStore(db_path)
+    assert reloaded.load() == 3
+    assert reloaded.get(1) == 3 and reloaded.get(3) == 8
+
+
+def test_replicas_share_the_counters(db_path):
+    a = download_store.DownloadCounterStore(db_path)
+    b = download_store.DownloadCounterStore(db_path)
+    assert a.increment(1) == 1
+    # La otra réplica ve el incremento sin recargar y suma sobre él
+    assert b.get(1) == 1
+    assert b.increment(1) == 2
+    assert a.get(1) == 2
+
+
+def test_counters_from_another_day_are_ignored(db_path, monkeypatch):
+    store = download_store.DownloadCounterStore(db_path)
+    monkeypatch.setattr(download_store, "_today", lambda: "2026-01-01")
+    store.increment(1)
+    store.increment(1)
+
+    monkeypatch.setattr(download_store, "_today", lambda: "2026-01-02")
+    assert store.get(1) == 0
+    reloaded = download_store.DownloadCounterStore(db_path)
+    assert reloaded.load() == 0
+
+    # La fila de ayer se sobrescribe, no se acumula
+    assert store.increment(1) == 1
+    assert _rows(db_path) == [(1, 1, "2026-01-02")]
+
+
+def test_reset_all(db_path):
+    store = download_store.DownloadCounterStore(db_path)
+    store.increment(1)
+    store.increment(2)
+    store.reset_all()
+    assert store.get(1) == 0 and store.get(2) == 0
+    assert _rows(db_path) == []
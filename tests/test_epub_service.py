@@ -0,0 +1,191 @@
+import importlib
+import io
+import zipfile
+
+import pytest
+
+# Otros tests sustituyen el paquete `services` en sys.modules
+epub_service = importlib.import_module("services.epub_service")
+epub_meta_cache = importlib.import_module("services.epub_meta_cache")
+importlib.import_module("services.file_id_service")
+epub_store = importlib.import_module("utils.epub_store")
+config = importlib.import_module("config.config_settings").config
+
+
+@pytest.fixture(autouse=True)
+def meta_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DATABASE_URL", None)
+    monkeypatch.setattr(epub_meta_cache, "config", config)
+    monkeypatch.setattr(epub_meta_cache, "DB_PATH", str(tmp_path / "meta.db"))
+    monkeypatch.setattr(
+        epub_store, "_store", epub_store.EpubStore(str(tmp_path / "store"), 0)
+    )
+    epub_meta_cache.init_epub_meta_db()
+    return epub_meta_cache
+
+
+OPF = """<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier>urn:uuid:1234</dc:identifier>
+    <dc:identifier>urn:uri:https://editorial.example/libro</dc:identifier>
+    <dc:title>Volumen 1</dc:title>
+    <dc:title>Subtítulo ignorado</dc:title>
+    <dc:creator id="c1">Autora</dc:creator>
+    <dc:contributor id="c2">Ilustradora</dc:contributor>
+    <dc:contributor id="c3">ZeePub</dc:contributor>
+    <dc:contributor id="c4">Traductor</dc:contributor>
+    <meta refines="#c2" property="role">ill</meta>
+    <meta refines="#c3" property="role">mrk</meta>
+    <meta refines="#c4" property="role">trl</meta>
+    <dc:subject>Fantasía</dc:subject>
+    <dc:subject>Seinen</dc:subject>
+    <dc:description>Una sinopsis</dc:description>
+    <dc:type>Novela ligera</dc:type>
+    <dc:publisher>Editorial</dc:publisher>
+    <dc:date>2019-01-01</dc:date>
+    <dc:date opf:event="publication" xmlns:opf="http://www.idpf.org/2007/opf">2020-07-02T00:00:00Z</dc:date>
+    <meta property="dcterms:modified">2022-07-03T10:28:12Z</meta>
+    <meta property="belongs-to-collection">Serie</meta>
+  </metadata>
+  <manifest>
+    <item id="cover" href="cover.jpg" media-type="image/jpeg"/>
+  </manifest>
+</package>
+"""
+
+
+def _epub(opf: str, extra=None) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        for name, content in (extra or {}).items():
+            z.writestr(name, content)
+        z.writestr("mimetype", "application/epub+zip")
+        z.writestr(
+            "META-INF/container.xml",
+            '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles></container>',
+        )
+        z.writestr("OEBPS/content.opf", opf)
+    return buf.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_parse_opf_from_epub_fields():
+    meta = await epub_service.parse_opf_from_epub(_epub(OPF))
+
+    assert meta["epub_version"] == "3.0"
+    assert meta["titulo_volumen"] == "Volumen 1"
+    assert meta["titulo_serie"] == "Serie"
+    assert meta["autores"] == ["Autora"]
+    assert meta["ilustrador"] == "Ilustradora"
+    assert meta["maquetadores"] == ["ZeePub"]
+    assert meta["traductor"] == "Traductor"
+    assert meta["generos"] == ["Fantasía"]
+    assert meta["demografia"] == ["Seinen"]
+    assert meta["sinopsis"] == "Una sinopsis"
+    assert meta["categoria"] == "Novela ligera"
+    assert meta["publisher"] == "Editorial"
+    assert meta["publisher_url"] == "https://editorial.example/libro"
+    assert meta["fecha_publicacion"] == "02-07-2020"
+    assert meta["fecha_modificacion"] == "03-07-2022"
+
+
+def test_parser_stops_after_metadata():
+    # Un manifest roto tras <metadata> no impide leer los metadatos
+    broken = OPF.replace("</manifest>", "<item></manifest>")
+    meta = epub_service._parse_opf_metadata(broken.encode("utf-8"))
+    assert meta["titulo_volumen"] == "Volumen 1"
+
+
+@pytest.mark.asyncio
+async def test_inspect_epub_opens_archive_once(monkeypatch):
+    data = _epub(
+        OPF,
+        {
+            "OEBPS/cover.jpg": b"JPEGDATA",
+            "OEBPS/Text/titulo.xhtml": '<h1 epub:type="fulltitle">'
+            '<span epub:type="title">Mi libro</span>'
+            '<span epub:type="subtitle">Parte uno</span></h1>'
+            '<p class="salto1"><b>Página Web</b><br/>'
+            '<a href="https://traductor.example">web</a></p>',
+        },
+    )
+    expected_meta = await epub_service.parse_opf_from_epub(data)
+
+    opened = []
+    real_zipfile = zipfile.ZipFile
+
+    def counting_zipfile(*args, **kwargs):
+        opened.append(args)
+        return real_zipfile(*args, **kwargs)
+
+    monkeypatch.setattr(epub_service.zipfile, "ZipFile", counting_zipfile)
+    meta, cover = await epub_service.inspect_epub(
+        data, "http://opds/Mi%20libro.epub", {"titulo": "x"}
+    )
+
+    assert len(opened) == 1
+    assert cover == b"JPEGDATA"
+    assert meta["internal_title"] == "Mi libro: Parte uno"
+    assert meta["publisher_url"] == "https://traductor.example"
+    assert meta["filename_title"] == "Mi libro"
+    assert meta["titulo_volumen"] == expected_meta["titulo_volumen"]
+    assert meta["titulo"] == "x"
+
+
+@pytest.mark.asyncio
+async def test_inspect_epub_with_invalid_data():
+    meta, cover = await epub_service.inspect_epub(b"not a zip", "http://opds/a.epub")
+    assert cover is None
+    assert meta["filename_title"] == "a"
+
+
+@pytest.mark.asyncio
+async def test_inspect_epub_reuses_cached_metadata(monkeypatch):
+    data = _epub(OPF, {"OEBPS/cover.jpg": b"JPEGDATA"})
+    url = "http://opds/libro.epub"
+    meta, cover = await epub_service.inspect_epub(data, url, {"titulo": "x"})
+
+    def fail(*args, **kwargs):
+        raise AssertionError("no debería volver a parsear el EPUB")
+
+    monkeypatch.setattr(epub_service, "_enrich_metadata", fail)
+    again, cover_again = await epub_service.inspect_epub(data, url, {"titulo": "y"})
+
+    assert cover_again == cover == b"JPEGDATA"
+    assert again["titulo_volumen"] == meta["titulo_volumen"] == "Volumen 1"
+    assert again["titulo"] == "y"
+
+    # Sin almacén que lo confirme, la URL sola sirve mientras no caduque
+    cached = await epub_meta_cache.lookup_epub_meta(url)
+    assert cached.size == len(data)
+    assert cached.cover_path == "OEBPS/cover.jpg"
+    assert cached.meta["fecha_modificacion"] == "03-07-2022"
+    monkeypatch.setattr(config, "EPUB_META_CACHE_TTL", 0)
+    assert await epub_meta_cache.lookup_epub_meta(url) is None
+
+
+def test_meta_cache_replaces_old_versions_of_url():
+    url = "http://opds/libro.epub"
+    epub_meta_cache.save_epub_meta("old", url, {"fecha_modificacion": "01-01-2020"})
+    epub_meta_cache.save_epub_meta("new", url, {"fecha_modificacion": "02-01-2020"})
+
+    assert epub_meta_cache.get_epub_meta("old", url) is None
+    assert epub_meta_cache.get_epub_meta_by_url(url).content_hash == "new"
+
+
+@pytest.mark.asyncio
+async def test_meta_cache_follows_store_content(tmp_path, monkeypatch):
+    store = epub_store.EpubStore(str(tmp_path / "objects"), 10 * 1024 * 1024)
+    monkeypatch.setattr(epub_store, "_store", store)
+    url = "http://opds/libro.epub"
+    data = _epub(OPF)
+    path = store.put(url, data, etag='"v1"')
+
+    await epub_service.inspect_epub(path, url)
+    assert (await epub_meta_cache.lookup_epub_meta(url)).etag == '"v1"'
+
+    # El origen publica otra versión: la entrada deja de ser válida
+    store.put(url, _epub(OPF.replace("Volumen 1", "Volumen 1b")), etag='"v2"')
+    assert await epub_meta_cache.lookup_epub_meta(url) is None
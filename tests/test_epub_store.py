@@ -0,0 +1,69 @@
+import os
+import time
+
+import pytest
+
+from utils import epub_store
+from utils.epub_store import EpubStore
+
+
+def test_put_lookup_and_rescan(tmp_path):
+    store = EpubStore(str(tmp_path), max_bytes=10_000)
+    path = store.put("http://opds/a.epub", b"A" * 100, etag='"e1"')
+    assert path and os.path.exists(path)
+
+    hit = store.lookup("http://opds/a.epub")
+    assert hit.path == path and hit.fresh and hit.etag == '"e1"'
+
+    # Un nuevo proceso reconstruye el índice desde disco
+    reloaded = EpubStore(str(tmp_path), max_bytes=10_000)
+    reloaded.scan()
+    assert reloaded.lookup("http://opds/a.epub").path == path
+    assert reloaded.stats()["bytes"] == 100
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = EpubStore(str(tmp_path), max_bytes=10_000)
+    p1 = store.put("http://opds/a.epub", b"same")
+    p2 = store.put("http://mirror/a.epub", b"same")
+    assert p1 == p2
+    assert store.stats()["objects"] == 1
+    assert store.stats()["urls"] == 2
+
+
+def test_lru_eviction_over_budget(tmp_path):
+    store = EpubStore(str(tmp_path), max_bytes=250, min_age=0)
+    old = store.put("http://opds/old.epub", b"1" * 100)
+    time.sleep(0.01)
+    store.put("http://opds/mid.epub", b"2" * 100)
+    time.sleep(0.01)
+    store.put("http://opds/new.epub", b"3" * 100)
+
+    assert not os.path.exists(old)
+    assert store.lookup("http://opds/old.epub") is None
+    assert store.lookup("http://opds/new.epub") is not None
+    assert store.stats()["bytes"] <= 250
+
+
+@pytest.mark.asyncio
+async def test_fetch_epub_keeps_fetch_bytes_contract(tmp_path, monkeypatch):
+    store = EpubStore(str(tmp_path), max_bytes=10_000)
+    monkeypatch.setattr(epub_store, "_store", store)
+    monkeypatch.setattr(epub_store, "MAX_IN_MEMORY_BYTES", 150)
+    downloads = []
+
+    async def fake_fetch_bytes(url, **kwargs):
+        downloads.append(url)
+        return b"S" * 100 if "small" in url else str(tmp_path / "big.tmp")
+
+    (tmp_path / "big.tmp").write_bytes(b"B" * 200)
+    monkeypatch.setattr(epub_store, "fetch_bytes", fake_fetch_bytes)
+
+    # Pequeños: bytes, también cuando salen del almacén
+    assert await epub_store.fetch_epub("http://opds/small.epub") == b"S" * 100
+    assert await epub_store.fetch_epub("http://opds/small.epub") == b"S" * 100
+    # Grandes: la ruta del objeto almacenado
+    path = await epub_store.fetch_epub("http://opds/big.epub")
+    assert epub_store.is_store_path(path)
+    assert await epub_store.fetch_epub("http://opds/big.epub") == path
+    assert downloads == ["http://opds/small.epub", "http://opds/big.epub"]
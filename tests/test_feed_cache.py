@@ -0,0 +1,71 @@
+import pytest
+from unittest.mock import AsyncMock
+
+from utils import http_client
+from utils.feed_cache import FeedCache
+
+FEED_XML = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>Test Feed</title>
+  <entry><title>Book 1</title><id>1</id></entry>
+</feed>"""
+
+
+def test_feed_cache_evicts_lru_by_bytes():
+    cache = FeedCache(ttl=60, max_bytes=100)
+    cache.put("a", "feed-a", 40)
+    cache.put("b", "feed-b", 40)
+    # Usar "a" para que "b" pase a ser la menos reciente
+    assert cache.get_fresh("a") == "feed-a"
+    cache.put("c", "feed-c", 40)
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.stats()["bytes"] == 80
+
+
+def test_feed_cache_expired_entry_keeps_validators():
+    cache = FeedCache(ttl=60, max_bytes=1000)
+    cache.put("u", "feed", 10, etag='"v1"', last_modified="Mon, 01 Jan 2024")
+    # Forzar expiración sin esperar
+    cache.ttl = 1e-9
+
+    assert cache.get_fresh("u") is None
+    assert cache.conditional_headers("u") == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024",
+    }
+
+
+@pytest.mark.asyncio
+async def test_parse_feed_reuses_cached_feed_on_304(monkeypatch):
+    cache = FeedCache(ttl=60, max_bytes=1024 * 1024)
+    monkeypatch.setattr(http_client, "_feed_cache", cache)
+
+    async def first_fetch(url, timeout=15, headers=None, response_meta=None, **kw):
+        response_meta.update({"status": 200, "etag": '"abc"', "last_modified": None})
+        return FEED_XML
+
+    monkeypatch.setattr(http_client, "fetch_bytes", first_fetch)
+    feed = await http_client.parse_feed_from_url("http://opds/feed")
+    assert feed.feed.title == "Test Feed"
+
+    # Dentro del TTL no hay red
+    no_network = AsyncMock()
+    monkeypatch.setattr(http_client, "fetch_bytes", no_network)
+    assert await http_client.parse_feed_from_url("http://opds/feed") is feed
+    no_network.assert_not_called()
+
+    # Pasado el TTL se revalida y un 304 reutiliza el feed
+    cache.ttl = 1e-9
+    seen_headers = {}
+
+    async def not_modified(url, timeout=15, headers=None, response_meta=None, **kw):
+        seen_headers.update(headers or {})
+        response_meta["status"] = 304
+        return b""
+
+    monkeypatch.setattr(http_client, "fetch_bytes", not_modified)
+    assert await http_client.parse_feed_from_url("http://opds/feed") is feed
+    assert seen_headers.get("If-None-Match") == '"abc"'
+    assert cache.stats()["revalidated"] == 1
@@ -0,0 +1,92 @@
+import asyncio
+import importlib
+import os
+
+import pytest
+
+from utils import http_client
+
+host_limiter = importlib.import_module("utils.host_limiter")
+Priority = host_limiter.Priority
+
+
+@pytest.mark.asyncio
+async def test_concurrent_fetches_share_one_download(monkeypatch):
+    calls = []
+
+    async def fake_once(url, session, timeout, max_retries, headers, flight):
+        calls.append(url)
+        await asyncio.sleep(0.05)
+        flight.meta["status"] = 200
+        return b"epub-bytes"
+
+    monkeypatch.setattr(http_client, "_fetch_bytes_once", fake_once)
+
+    results = await asyncio.gather(
+        *(http_client.fetch_bytes("http://opds/book.epub") for _ in range(5))
+    )
+
+    assert calls == ["http://opds/book.epub"]
+    assert results == [b"epub-bytes"] * 5
+    assert not http_client._inflight
+
+
+@pytest.mark.asyncio
+async def test_shared_tmpfile_removed_after_last_cleanup(monkeypatch, tmp_path):
+    path = tmp_path / "shared.epub"
+    path.write_bytes(b"x" * 10)
+
+    async def fake_once(url, session, timeout, max_retries, headers, flight):
+        await asyncio.sleep(0.01)
+        return str(path)
+
+    monkeypatch.setattr(http_client, "_fetch_bytes_once", fake_once)
+
+    a, b = await asyncio.gather(
+        http_client.fetch_bytes("http://opds/big.epub"),
+        http_client.fetch_bytes("http://opds/big.epub"),
+    )
+    assert a == b == str(path)
+
+    http_client.cleanup_tmp(a)
+    assert os.path.exists(path)
+    http_client.cleanup_tmp(b)
+    assert not os.path.exists(path)
+    assert str(path) not in http_client._tmp_refs
+
+
+@pytest.mark.asyncio
+async def test_joining_caller_raises_the_flight_priority(monkeypatch):
+    limiter = host_limiter.HostLimiter("opds", initial=1, max_limit=1)
+    started = []
+
+    async def fake_once(url, session, timeout, max_retries, headers, flight):
+        slot = flight.slot = limiter.slot(flight.priority)
+        async with slot:
+            started.append((url, flight.priority))
+            slot.response(200)
+            return url.encode()
+
+    monkeypatch.setattr(http_client, "_fetch_bytes_once", fake_once)
+
+    async with limiter.slot(Priority.BULK):
+        # Con el host ocupado, una descarga BULK y otra BULK detrás
+        bulk = asyncio.ensure_future(
+            http_client.fetch_bytes("http://opds/a.epub", priority=Priority.BULK)
+        )
+        other = asyncio.ensure_future(
+            http_client.fetch_bytes("http://opds/b.epub", priority=Priority.BULK)
+        )
+        await asyncio.sleep(0)
+        # Un usuario espera ahora la segunda: adelanta a la primera
+        user = asyncio.ensure_future(
+            http_client.fetch_bytes("http://opds/b.epub", priority=Priority.INTERACTIVE)
+        )
+        await asyncio.sleep(0)
+
+    a, b, b_user = await asyncio.gather(bulk, other, user)
+    assert a == b"http://opds/a.epub" and b == b_user == b"http://opds/b.epub"
+    assert started == [
+        ("http://opds/b.epub", Priority.INTERACTIVE),
+        ("http://opds/a.epub", Priority.BULK),
+    ]
@@ -0,0 +1,131 @@
+import hashlib
+import importlib
+import os
+
+import pytest
+
+from config.config_settings import config
+
+# Otros tests sustituyen el paquete `services` en sys.modules
+telegram_service = importlib.import_module("services.telegram_service")
+
+
+def _load(tmp_path, monkeypatch):
+    config.URL_CACHE_DB_PATH = str(tmp_path / "file_ids.db")
+    monkeypatch.setattr(config, "DATABASE_URL", None)
+
+    from importlib.machinery import SourceFileLoader
+
+    loader = SourceFileLoader(
+        "file_id_service_test",
+        os.path.join(os.path.dirname(__file__), "..", "services", "file_id_service.py"),
+    )
+    svc = loader.load_module()
+    # Otros tests sustituyen config en sys.modules: fijar el modo SQLite aquí
+    monkeypatch.setattr(svc, "config", config)
+    monkeypatch.setattr(svc, "DB_PATH", str(tmp_path / "file_ids.db"))
+    svc.init_file_id_db()
+    return svc
+
+
+def test_remember_get_and_forget(tmp_path, monkeypatch):
+    svc = _load(tmp_path, monkeypatch)
+
+    assert svc.get_file_id("abc", "document") is None
+    svc.remember_file_id("abc", "document", "FILE1", "U1", "http://opds/a.epub")
+    assert svc.get_file_id("abc", "document") == "FILE1"
+    # El mismo contenido como foto es otra entrada
+    assert svc.get_file_id("abc", "photo") is None
+
+    # Persiste en la BD aunque se vacíe la memoria
+    svc._memo.clear()
+    assert svc.get_file_id("abc", "document") == "FILE1"
+
+    svc.forget_file_id("abc", "document")
+    svc._memo.clear()
+    assert svc.get_file_id("abc", "document") is None
+
+
+@pytest.mark.asyncio
+async def test_content_key_for_bytes_and_files(tmp_path, monkeypatch):
+    svc = _load(tmp_path, monkeypatch)
+    data = b"epub-content"
+    path = tmp_path / "book.epub"
+    path.write_bytes(data)
+
+    expected = hashlib.sha256(data).hexdigest()
+    assert await svc.content_key(data) == expected
+    assert await svc.content_key(str(path)) == expected
+    assert await svc.content_key(None) is None
+
+
+@pytest.mark.asyncio
+async def test_misses_are_not_memoised(tmp_path, monkeypatch):
+    svc = _load(tmp_path, monkeypatch)
+    assert await svc.lookup_file_id("xyz", "document") is None
+
+    # Otra réplica (o una BD restaurada) registra el file_id después
+    with svc._pool().write() as conn:
+        conn.execute(
+            "INSERT INTO telegram_file_ids (content_hash, kind, file_id) "
+            "VALUES ('xyz', 'document', 'FILE2')"
+        )
+    assert await svc.lookup_file_id("xyz", "document") == "FILE2"
+    assert ("xyz", "document") in svc._memo
+
+
+def test_memo_is_bounded(tmp_path, monkeypatch):
+    svc = _load(tmp_path, monkeypatch)
+    monkeypatch.setattr(svc, "_MEMO_MAX", 2)
+    for i in range(3):
+        svc.remember_file_id(f"h{i}", "photo", f"F{i}")
+    assert list(svc._memo) == [("h1", "photo"), ("h2", "photo")]
+    assert svc.get_file_id("h0", "photo") == "F0"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "error, reuploads",
+    [
+        ("Wrong file identifier/http url specified", True),
+        ("File reference expired", True),
+        ("Can't parse entities: unsupported start tag", False),
+        ("Chat not found", False),
+    ],
+)
+async def test_only_stale_file_ids_are_forgotten(monkeypatch, error, reuploads):
+    from telegram.error import BadRequest
+
+    forgotten, uploads = [], []
+
+    async def content_key(data):
+        return "k"
+
+    async def lookup_file_id(key, kind):
+        return "old-id"
+
+    async def send(**kwargs):
+        raise BadRequest(error)
+
+    async def upload(**kwargs):
+        uploads.append(kwargs)
+        return None
+
+    monkeypatch.setattr(telegram_service, "content_key", content_key)
+    monkeypatch.setattr(telegram_service, "lookup_file_id", lookup_file_id)
+    monkeypatch.setattr(
+        telegram_service, "forget_file_id", lambda *a: forgotten.append(a)
+    )
+    kwargs = dict(chat_id=1, caption="c", parse_mode="HTML", message_thread_id=None)
+
+    if reuploads:
+        await telegram_service._send_cached(
+            "document", send, "document", upload, b"x", None, **kwargs
+        )
+        assert forgotten == [("k", "document")] and len(uploads) == 1
+    else:
+        with pytest.raises(BadRequest):
+            await telegram_service._send_cached(
+                "document", send, "document", upload, b"x", None, **kwargs
+            )
+        assert forgotten == [] and uploads == []
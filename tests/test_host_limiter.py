@@ -0,0 +1,97 @@
+import asyncio
+import importlib
+
+import pytest
+
+# Otros tests sustituyen el paquete `utils` en sys.modules
+host_limiter = importlib.import_module("utils.host_limiter")
+Priority = host_limiter.Priority
+
+
+@pytest.mark.asyncio
+async def test_interactive_requests_jump_the_queue():
+    limiter = host_limiter.HostLimiter("opds", initial=1, max_limit=1)
+    order = []
+    release = asyncio.Event()
+
+    async def request(name, priority):
+        async with limiter.slot(priority) as slot:
+            order.append(name)
+            slot.response(200)
+            if name == "first":
+                await release.wait()
+
+    first = asyncio.create_task(request("first", Priority.BULK))
+    await asyncio.sleep(0)
+    waiting = [
+        asyncio.create_task(request("validate", Priority.BACKGROUND)),
+        asyncio.create_task(request("epub", Priority.BULK)),
+        asyncio.create_task(request("feed", Priority.INTERACTIVE)),
+    ]
+    await asyncio.sleep(0)
+    assert limiter.stats()["waiting"] == {
+        "interactive": 1,
+        "bulk": 1,
+        "background": 1,
+    }
+    release.set()
+    await asyncio.gather(first, *waiting)
+    assert order == ["first", "feed", "epub", "validate"]
+    assert limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_aimd_backs_off_on_overload_and_recovers():
+    limiter = host_limiter.HostLimiter("opds", initial=8, max_limit=16)
+
+    async with limiter.slot() as slot:
+        slot.response(503)
+    assert limiter.limit == 4
+    # Una ráfaga de errores dentro de la misma ventana no vuelve a dividir
+    async with limiter.slot() as slot:
+        slot.response(429)
+    assert limiter.limit == 4
+
+    # +1 por cada "ventana" de `limit` respuestas buenas
+    for _ in range(5):
+        async with limiter.slot() as slot:
+            slot.response(200)
+    assert int(limiter.limit) == 5
+
+    # Sin respuesta (timeout) también cuenta como saturación
+    limiter._last_decrease = 0
+    with pytest.raises(asyncio.TimeoutError):
+        async with limiter.slot():
+            raise asyncio.TimeoutError()
+    assert int(limiter.limit) == 2
+
+
+def test_backoff_honors_retry_after_and_jitters():
+    assert host_limiter.backoff_delay(0, "7") == 7
+    assert host_limiter.backoff_delay(0, "120", cap=30) == 30
+    delays = {host_limiter.backoff_delay(3, None, base=1.0) for _ in range(20)}
+    assert all(0 <= d <= 8 for d in delays)
+    assert len(delays) > 1
+    assert host_limiter.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+
+
+@pytest.mark.asyncio
+async def test_promoted_slot_moves_to_its_new_lane():
+    limiter = host_limiter.HostLimiter("opds", initial=1, max_limit=1)
+    order = []
+    slots = {}
+
+    async def request(name):
+        slot = slots[name] = limiter.slot(Priority.BACKGROUND)
+        async with slot:
+            order.append(name)
+
+    async with limiter.slot(Priority.BULK):
+        tasks = [asyncio.create_task(request(n)) for n in ("old", "new")]
+        await asyncio.sleep(0)
+        slots["new"].promote(Priority.INTERACTIVE)
+        assert limiter.stats()["waiting"]["interactive"] == 1
+    await asyncio.gather(*tasks)
+
+    assert order == ["new", "old"]
+    assert limiter.inflight == 0 and limiter._inflight_by[Priority.INTERACTIVE] == 0
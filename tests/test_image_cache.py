@@ -0,0 +1,216 @@
+import importlib
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from utils.image_cache import CachedImage, ImageCache, cache_key, make_etag
+
+# Otros tests sustituyen el paquete `utils` en sys.modules
+image_cache = importlib.import_module("utils.image_cache")
+host_limiter = importlib.import_module("utils.host_limiter")
+
+
+def _use_client(monkeypatch, handler):
+    """Sustituye el cliente httpx compartido de session_manager."""
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    manager = SimpleNamespace(get_http_client=lambda: client)
+    monkeypatch.setitem(
+        sys.modules,
+        "core.session_manager",
+        SimpleNamespace(session_manager=manager),
+    )
+    return client
+
+
+def _img(data, fetched_at=None):
+    return CachedImage(
+        data=data,
+        content_type="image/jpeg",
+        etag=make_etag(data),
+        fetched_at=fetched_at or time.time(),
+    )
+
+
+def test_memory_lru_and_disk_reload(tmp_path):
+    cache = ImageCache(str(tmp_path), memory_bytes=20, disk_bytes=1000)
+    cache.put("a" * 64, _img(b"x" * 10))
+    cache.put("b" * 64, _img(b"y" * 10))
+    cache.put("c" * 64, _img(b"z" * 10))
+
+    # "a" sale de memoria pero sigue en disco
+    assert cache.get_memory("a" * 64) is None
+    assert cache.load("a" * 64).data == b"x" * 10
+
+    reloaded = ImageCache(str(tmp_path), memory_bytes=20, disk_bytes=1000)
+    reloaded.scan()
+    assert reloaded.stats()["disk_entries"] == 3
+    assert reloaded.load("c" * 64).content_type == "image/jpeg"
+
+
+@pytest.mark.asyncio
+async def test_fetch_image_revalidates_with_304(tmp_path, monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers.get("if-none-match"))
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(
+            200, content=b"cover", headers={"content-type": "image/png", "etag": '"v1"'}
+        )
+
+    cache = ImageCache(str(tmp_path), ttl=60)
+    monkeypatch.setattr(image_cache, "_cache", cache)
+    _use_client(monkeypatch, handler)
+
+    first = await image_cache.fetch_image("http://opds/cover.jpg")
+    again = await image_cache.fetch_image("http://opds/cover.jpg")
+    assert first.data == again.data == b"cover"
+    assert calls == [None]  # la segunda sale de memoria
+
+    # Caducada: revalida con el ETag del origen y reutiliza la copia
+    first.fetched_at -= 120
+    third = await image_cache.fetch_image("http://opds/cover.jpg")
+    assert third.data == b"cover" and third.content_type == "image/png"
+    assert calls == [None, '"v1"']
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_cache_key_depends_on_params():
+    assert cache_key("u", {"a": "1"}) != cache_key("u", {"a": "2"})
+    assert cache_key("u", {"a": "1", "b": "2"}) == cache_key("u", {"b": "2", "a": "1"})
+
+
+@pytest.mark.asyncio
+async def test_variants_are_cached_per_original(tmp_path, monkeypatch):
+    thumbnails = importlib.import_module("utils.thumbnails")
+    renders = []
+
+    async def fake_render(data, width):
+        renders.append(width)
+        return data[:width]
+
+    def handler(request):
+        return httpx.Response(
+            200, content=b"C" * 500, headers={"content-type": "image/png"}
+        )
+
+    monkeypatch.setattr(thumbnails, "render_thumbnail", fake_render)
+    monkeypatch.setattr(image_cache, "_cache", ImageCache(str(tmp_path)))
+    _use_client(monkeypatch, handler)
+
+    small = await image_cache.fetch_image("http://opds/c.jpg", size=160)
+    again = await image_cache.fetch_image("http://opds/c.jpg", size=160)
+    original = await image_cache.fetch_image("http://opds/c.jpg")
+
+    assert small.data == b"C" * 160 and small.content_type == "image/jpeg"
+    assert again.etag == small.etag
+    assert small.source_etag == original.etag
+    assert original.size == 500
+    assert renders == [160]
+
+
+@pytest.mark.asyncio
+async def test_unshrinkable_variant_is_remembered(tmp_path, monkeypatch):
+    thumbnails = importlib.import_module("utils.thumbnails")
+    renders = []
+
+    async def fake_render(data, width):
+        renders.append(width)
+        return None  # ya es más estrecha que `width`
+
+    def handler(request):
+        return httpx.Response(
+            200, content=b"tiny", headers={"content-type": "image/png"}
+        )
+
+    monkeypatch.setattr(thumbnails, "render_thumbnail", fake_render)
+    monkeypatch.setattr(image_cache, "_cache", ImageCache(str(tmp_path)))
+    _use_client(monkeypatch, handler)
+
+    for params in (None, {"v": "1"}, {"v": "2"}):
+        image = await image_cache.fetch_image("http://opds/t.png", params, size=320)
+        assert image.data == b"tiny" and image.content_type == "image/png"
+    # Una sola decodificación, y la variante no depende de los parámetros
+    assert renders == [320]
+
+
+def test_make_thumbnail_downscales():
+    import io
+
+    from PIL import Image
+
+    from utils.thumbnails import make_thumbnail
+
+    buf = io.BytesIO()
+    Image.effect_noise((800, 1200), 64).convert("RGB").save(buf, format="PNG")
+    thumb = make_thumbnail(buf.getvalue(), 160)
+    assert thumb is not None
+    with Image.open(io.BytesIO(thumb)) as img:
+        assert img.size == (160, 240)
+
+
+@pytest.mark.asyncio
+async def test_first_use_scans_the_disk_cache_off_the_loop(tmp_path, monkeypatch):
+    loop_thread = threading.get_ident()
+    scanned = []
+    monkeypatch.setattr(image_cache, "_cache", None)
+    monkeypatch.setattr(
+        image_cache,
+        "config",
+        SimpleNamespace(
+            IMAGE_CACHE_DIR=str(tmp_path),
+            IMAGE_CACHE_MEMORY_BYTES=1024,
+            IMAGE_CACHE_MAX_BYTES=1024,
+            IMAGE_CACHE_TTL=60,
+        ),
+    )
+    monkeypatch.setattr(
+        image_cache.ImageCache,
+        "scan",
+        lambda self: scanned.append(threading.get_ident()),
+    )
+
+    cache = await image_cache.open_image_cache()
+    assert await image_cache.open_image_cache() is cache
+    assert len(scanned) == 1 and scanned[0] != loop_thread
+
+
+@pytest.mark.asyncio
+async def test_fetch_uses_shared_client_and_interactive_host_slot(
+    tmp_path, monkeypatch
+):
+    slots = []
+
+    class FakeSlot:
+        def __init__(self, priority):
+            self.priority = priority
+            self.status = None
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return None
+
+        def response(self, status):
+            self.status = status
+
+    class FakeLimiter:
+        def slot(self, priority):
+            slots.append(FakeSlot(priority))
+            return slots[-1]
+
+    monkeypatch.setattr(host_limiter, "get_host_limiter", lambda url: FakeLimiter())
+    monkeypatch.setattr(image_cache, "_cache", ImageCache(str(tmp_path)))
+    _use_client(monkeypatch, lambda request: httpx.Response(200, content=b"img"))
+
+    image = await image_cache.fetch_image("http://opds/shared.jpg")
+    assert image.data == b"img"
+    assert [(s.priority, s.status) for s in slots] == [
+        (host_limiter.Priority.INTERACTIVE, 200)
+    ]
@@ -187,7 +187,16 @@ async def test_start_publisher_does_not_show_collections_immediately(monkeypatch
     monkeypatch.setattr(ch, "mostrar_colecciones", mc)
 
     # config: user is publisher
-    monkeypatch.setattr(ch, "config", MagicMock(FACEBOOK_PUBLISHERS={uid}, ADMIN_USERS=set(), OPDS_ROOT_START="/opds-start"))
+    monkeypatch.setattr(
+        ch,
+        "config",
+        MagicMock(
+            FACEBOOK_PUBLISHERS={uid},
+            ADMIN_USERS=set(),
+            OPDS_ROOT_START="/opds-start",
+            RATE_LIMIT_SEARCH_PER_MINUTE=0,
+        ),
+    )
 
     # update/context
     update = MagicMock()
@@ -0,0 +1,95 @@
+import importlib
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+# Otros tests sustituyen el paquete `utils` en sys.modules
+rate_limiter = importlib.import_module("utils.rate_limiter")
+decorators = importlib.import_module("utils.decorators")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_refills_over_time(clock):
+    manager = rate_limiter.RateLimitManager()
+    manager.add_limit(1, rate_limiter.RateLimitType.SEARCH, 2, 10)
+
+    assert manager.acquire(1, "search") == 0
+    assert manager.acquire(1, "search") == 0
+    assert manager.get_remaining(1, "search") == 0
+    assert manager.acquire(1, "search") == pytest.approx(5.0)
+
+    clock[0] += 5  # medio intervalo: un token nuevo
+    assert manager.is_allowed(1, rate_limiter.RateLimitType.SEARCH)
+    manager.record_request(1, rate_limiter.RateLimitType.SEARCH)
+    assert not manager.is_allowed(1, rate_limiter.RateLimitType.SEARCH)
+    # Sin límite configurado no se limita
+    assert manager.get_remaining(2, "search") == float("inf")
+
+
+def test_global_limit_is_shared_and_idle_buckets_are_freed(clock):
+    manager = rate_limiter.RateLimitManager(sweep_interval=60)
+    manager.set_default_limit("command", 5, 60)
+    manager.add_global_limit("route:x", 2, 60)
+
+    assert manager.acquire(1, "command", "route:x") == 0
+    assert manager.acquire(2, "command", "route:x") == 0
+    # El tercer usuario tiene cupo propio pero no global
+    assert manager.acquire(3, "command", "route:x") > 0
+    assert manager.stats()["users"] == 3
+
+    clock[0] += 120
+    assert manager.sweep() == 3
+    assert manager.stats() == {"users": 0, "buckets": 0, "global": 1}
+
+
+@pytest.mark.asyncio
+async def test_decorator_rejects_over_limit(clock, monkeypatch):
+    manager = rate_limiter.RateLimitManager()
+    monkeypatch.setattr(decorators, "get_rate_limit_manager", lambda: manager)
+    calls = []
+
+    async def handler(update, context):
+        calls.append(update)
+        return "ok"
+
+    limited = decorators.rate_limit("search", max_requests=1, window_seconds=30)(
+        handler
+    )
+
+    update = MagicMock()
+    update.effective_user.id = 99
+    update.callback_query = None
+    update.effective_message.reply_text = AsyncMock()
+
+    assert await limited(update, None) == "ok"
+    assert await limited(update, None) is None
+    assert len(calls) == 1
+    update.effective_message.reply_text.assert_awaited_once()
+
+
+def test_decorated_handlers_do_not_share_buckets(clock, monkeypatch):
+    manager = rate_limiter.RateLimitManager()
+    monkeypatch.setattr(decorators, "get_rate_limit_manager", lambda: manager)
+
+    async def search(update, context):
+        return "search"
+
+    async def browse(update, context):
+        return "browse"
+
+    decorators.rate_limit("command", max_requests=1)(search)
+    decorators.rate_limit("command", max_requests=5)(browse)
+    # Cada handler conserva su propio límite aunque compartan tipo
+    assert sorted(v for v in manager.defaults.values()) == [(1, 60), (5, 60)]
+
+    # Con un `key` común comparten bucket y deben declarar el mismo límite
+    decorators.rate_limit("search", max_requests=3, key="search")(search)
+    decorators.rate_limit("search", max_requests=3, key="search")(browse)
+    with pytest.raises(ValueError):
+        decorators.rate_limit("search", max_requests=4, key="search")(browse)
@@ -0,0 +1,184 @@
+import importlib
+import os
+import sqlite3
+import threading
+
+import pytest
+
+# Otros tests sustituyen el paquete `utils` en sys.modules
+sqlite_pool = importlib.import_module("utils.sqlite_pool")
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = sqlite_pool.SQLitePool(str(tmp_path / "pool.db"), readers=2)
+    with pool.write() as conn:
+        conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT)")
+    yield pool
+    pool.close()
+
+
+def test_connections_are_reused(pool):
+    with pool.read() as first:
+        pass
+    with pool.read() as second:
+        assert second is first
+    with pool.write() as w1:
+        pass
+    with pool.write() as w2:
+        assert w2 is w1
+    assert pool.stats() == {"readers": 1, "idle_readers": 1, "writer": 1}
+
+
+def test_write_commits_or_rolls_back(pool):
+    with pool.write() as conn:
+        conn.execute("INSERT INTO kv VALUES ('a', '1')")
+    with pytest.raises(RuntimeError):
+        with pool.write() as conn:
+            conn.execute("INSERT INTO kv VALUES ('b', '2')")
+            raise RuntimeError("boom")
+
+    with pool.read() as conn:
+        rows = conn.execute("SELECT k FROM kv ORDER BY k").fetchall()
+        assert rows == [("a",)]
+        # Los lectores no pueden escribir
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO kv VALUES ('c', '3')")
+
+
+def test_readers_are_bounded(pool):
+    seen = set()
+    barrier = threading.Barrier(4)
+
+    def worker():
+        barrier.wait()
+        for _ in range(20):
+            with pool.read() as conn:
+                seen.add(id(conn))
+                conn.execute("SELECT COUNT(*) FROM kv").fetchone()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(seen) <= 2
+
+
+def test_get_pool_shares_instance_per_path(tmp_path):
+    path = str(tmp_path / "shared.db")
+    try:
+        assert sqlite_pool.get_pool(path) is sqlite_pool.get_pool(path)
+    finally:
+        sqlite_pool.get_pool(path).close()
+
+
+def test_replace_database_with_open_wal_connections(tmp_path):
+    path = str(tmp_path / "live.db")
+    with sqlite_pool.get_pool(path).write() as conn:
+        conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT)")
+        conn.execute("INSERT INTO kv VALUES ('who', 'old')")
+    with sqlite_pool.get_pool(path).read() as conn:
+        assert conn.execute("SELECT v FROM kv").fetchone() == ("old",)
+
+    # La copia de seguridad incluye lo que sigue en el -wal
+    sqlite_pool.backup_database(path, str(tmp_path / "live.db.bak"))
+    with sqlite3.connect(str(tmp_path / "live.db.bak")) as conn:
+        assert conn.execute("SELECT v FROM kv").fetchone() == ("old",)
+
+    restored = str(tmp_path / "restored.db")
+    with sqlite3.connect(restored) as conn:
+        conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT)")
+        conn.execute("INSERT INTO kv VALUES ('who', 'new')")
+    conn.close()
+
+    sqlite_pool.replace_database(path, restored)
+    assert not os.path.exists(restored)
+    try:
+        with sqlite_pool.get_pool(path).read() as conn:
+            assert conn.execute("SELECT v FROM kv").fetchone() == ("new",)
+        with sqlite_pool.get_pool(path).write() as conn:
+            conn.execute("INSERT INTO kv VALUES ('after', 'restore')")
+        with sqlite3.connect(path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM kv").fetchone() == (2,)
+    finally:
+        sqlite_pool.get_pool(path).close()
+
+
+def test_replace_database_waits_for_reads_in_progress(tmp_path):
+    path = str(tmp_path / "busy.db")
+    pool = sqlite_pool.get_pool(path)
+    with pool.write() as conn:
+        conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT)")
+        conn.execute("INSERT INTO kv VALUES ('who', 'old')")
+
+    restored = str(tmp_path / "restored.db")
+    with sqlite3.connect(restored) as conn:
+        conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT)")
+        conn.execute("INSERT INTO kv VALUES ('who', 'new')")
+    conn.close()
+
+    reading = threading.Event()
+    finish = threading.Event()
+    seen = []
+
+    def slow_reader():
+        with pool.read() as conn:
+            reading.set()
+            finish.wait(5)
+            # La restauración no ha cerrado la conexión a mitad de consulta
+            seen.append(conn.execute("SELECT v FROM kv").fetchone())
+
+    def late_reader():
+        with pool.read() as conn:
+            seen.append(conn.execute("SELECT v FROM kv").fetchone())
+
+    reader = threading.Thread(target=slow_reader)
+    reader.start()
+    assert reading.wait(5)
+    restore = threading.Thread(
+        target=sqlite_pool.replace_database, args=(path, restored)
+    )
+    restore.start()
+    restore.join(0.2)
+    # Espera a la lectura en curso y no deja empezar otras
+    assert restore.is_alive() and os.path.exists(restored)
+    late = threading.Thread(target=late_reader)
+    late.start()
+    late.join(0.2)
+    assert late.is_alive()
+
+    finish.set()
+    for t in (reader, restore, late):
+        t.join(5)
+    try:
+        assert seen == [("old",), ("new",)]
+        assert not os.path.exists(restored)
+    finally:
+        pool.close()
+
+
+def test_pause_times_out_and_keeps_the_pool_usable(tmp_path):
+    pool = sqlite_pool.SQLitePool(str(tmp_path / "stuck.db"), timeout=0.1)
+    holding = threading.Event()
+    release = threading.Event()
+
+    def holder():
+        with pool.read():
+            holding.set()
+            release.wait(5)
+
+    t = threading.Thread(target=holder)
+    t.start()
+    assert holding.wait(5)
+    try:
+        with pytest.raises(TimeoutError):
+            with pool.paused():
+                pass
+        # El pool sigue prestando conexiones tras el intento fallido
+        with pool.read() as conn:
+            assert conn.execute("SELECT 1").fetchone() == (1,)
+    finally:
+        release.set()
+        t.join(5)
+        pool.close()
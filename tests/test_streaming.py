@@ -0,0 +1,186 @@
+import asyncio
+import importlib
+import os
+
+import pytest
+
+from utils.host_limiter import get_host_limiter
+from utils.streaming import RangeNotSatisfiable, iter_file, iter_upstream, parse_range
+
+# `utils` puede estar sustituido en sys.modules por otros tests
+streaming = importlib.import_module("utils.streaming")
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    # Multi-rango o sintaxis desconocida: se sirve completo
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("items=0-1", 100) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=100-", 100)
+
+
+@pytest.mark.asyncio
+async def test_iter_file_range(tmp_path):
+    path = tmp_path / "book.epub"
+    path.write_bytes(bytes(range(256)) * 4)
+    chunks = [c async for c in iter_file(str(path), 10, 300, chunk_size=64)]
+    assert b"".join(chunks) == (bytes(range(256)) * 4)[10:301]
+
+
+class _FakeContent:
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    async def iter_chunked(self, size):
+        for c in self._chunks:
+            yield c
+
+
+class _FakeResponse:
+    def __init__(self, chunks, length=None, status=200):
+        self.status = status
+        self.content = _FakeContent(chunks)
+        self.content_length = length
+        self.headers = {}
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+@pytest.mark.asyncio
+async def test_iter_upstream_tees_complete_download(tmp_path):
+    stored = []
+
+    async def on_complete(path):
+        with open(path, "rb") as f:
+            stored.append(f.read())
+
+    resp = _FakeResponse([b"ab", b"cd"], length=4)
+    out = [
+        c
+        async for c in iter_upstream(
+            resp, tee_dir=str(tmp_path), on_complete=on_complete
+        )
+    ]
+
+    assert out == [b"ab", b"cd"]
+    assert stored == [b"abcd"]
+    assert resp.released
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_iter_upstream_discards_partial_copy(tmp_path):
+    stored = []
+
+    async def on_complete(path):
+        stored.append(path)
+
+    resp = _FakeResponse([b"ab", b"cd"], length=4)
+    gen = iter_upstream(resp, tee_dir=str(tmp_path), on_complete=on_complete)
+    assert await gen.__anext__() == b"ab"
+    await gen.aclose()  # el cliente corta la descarga
+
+    assert stored == []
+    assert resp.released
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_upstream_holds_a_host_limiter_slot_until_released():
+    class _Session:
+        async def get(self, url, **kwargs):
+            return _FakeResponse([b"ab"], length=2)
+
+    url = "http://streaming-limiter.test/book.epub"
+    limiter = get_host_limiter(url)
+    upstream = await streaming.open_upstream(url, session=_Session())
+    assert upstream.status == 200 and limiter.inflight == 1
+    assert [c async for c in iter_upstream(upstream)] == [b"ab"]
+    assert limiter.inflight == 0
+    upstream.release()  # liberar dos veces no devuelve dos plazas
+    assert limiter.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_flight_publishes_the_stored_copy(tmp_path):
+    async def on_complete(path):
+        return "/store/objects/ab/abcd.epub"
+
+    flight = streaming.UpstreamFlight("http://opds/shared.epub")
+    assert streaming.UpstreamFlight.get("http://opds/shared.epub") is flight
+    resp = _FakeResponse([b"ab", b"cd"], length=4)
+    gen = iter_upstream(
+        resp, tee_dir=str(tmp_path), on_complete=on_complete, flight=flight
+    )
+    assert [c async for c in gen] == [b"ab", b"cd"]
+
+    assert await flight.wait() == "/store/objects/ab/abcd.epub"
+    assert streaming.UpstreamFlight.get("http://opds/shared.epub") is None
+
+
+@pytest.mark.asyncio
+async def test_unstarted_flight_expires(monkeypatch):
+    monkeypatch.setattr(streaming, "FLIGHT_START_GRACE", 0)
+    flight = streaming.UpstreamFlight("http://opds/abandoned.epub")
+    assert await flight.wait() is None
+    assert streaming.UpstreamFlight.get("http://opds/abandoned.epub") is None
+
+
+class _GatedContent:
+    """Cuerpo del origen que entrega cada trozo cuando el test lo permite."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.gates = [asyncio.Event() for _ in chunks]
+
+    async def iter_chunked(self, size):
+        for gate, chunk in zip(self.gates, self._chunks):
+            await gate.wait()
+            yield chunk
+
+
+@pytest.mark.asyncio
+async def test_joiner_reads_the_copy_while_it_grows(tmp_path):
+    async def on_complete(path):
+        return None
+
+    url = "http://opds/growing.epub"
+    flight = streaming.UpstreamFlight(url)
+    resp = _FakeResponse([], length=4)
+    resp.content = _GatedContent([b"ab", b"cd"])
+    leader = iter_upstream(
+        resp, tee_dir=str(tmp_path), on_complete=on_complete, flight=flight
+    )
+    resp.content.gates[0].set()
+    assert await leader.__anext__() == b"ab"
+
+    part = await streaming.UpstreamFlight.get(url).join()
+    tail = flight.tail(part)
+    # El primer trozo llega sin esperar al resto de la descarga
+    assert await tail.__anext__() == b"ab"
+
+    resp.content.gates[1].set()
+    assert [c async for c in leader] == [b"cd"]
+    assert [c async for c in tail] == [b"cd"]
+    assert await flight.wait() is None and part.closed
+
+
+@pytest.mark.asyncio
+async def test_joiner_fails_when_the_shared_download_breaks(tmp_path):
+    flight = streaming.UpstreamFlight("http://opds/broken.epub")
+    resp = _FakeResponse([b"ab", b"cd"], length=4)
+    leader = iter_upstream(resp, tee_dir=str(tmp_path), flight=flight)
+    assert await leader.__anext__() == b"ab"
+    tail = flight.tail(await flight.join())
+    assert await tail.__anext__() == b"ab"
+
+    await leader.aclose()  # el cliente que descargaba se fue
+    with pytest.raises(ConnectionError):
+        await tail.__anext__()
@@ -0,0 +1,75 @@
+import importlib
+from datetime import datetime, timedelta
+
+import pytest
+
+# Otros tests sustituyen el paquete `services` en sys.modules
+user_service = importlib.import_module("services.user_service")
+
+
+@pytest.fixture
+def users_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_service.config, "DATABASE_URL", "")
+    monkeypatch.setattr(user_service.config, "USER_ROLE_CACHE_TTL", 60)
+    monkeypatch.setattr(user_service, "DB_PATH", str(tmp_path / "users.db"))
+    user_service.init_user_db()
+    user_service.invalidate_user_cache()
+    yield
+    user_service.invalidate_user_cache()
+
+
+@pytest.fixture
+def db_reads(monkeypatch):
+    calls = []
+    real = user_service.get_user_info
+
+    def counting(uid):
+        calls.append(uid)
+        return real(uid)
+
+    monkeypatch.setattr(user_service, "get_user_info", counting)
+    return calls
+
+
+def test_role_is_cached_until_invalidated(users_db, db_reads):
+    uid = 424242
+    user_service.upsert_user(uid, "vip")
+    before = user_service.get_user_cache_stats()
+
+    for _ in range(3):
+        assert user_service.get_effective_user(uid)["role"] == "vip"
+    assert db_reads == [uid]
+    stats = user_service.get_user_cache_stats()
+    assert stats["hits"] - before["hits"] == 2
+    assert stats["misses"] - before["misses"] == 1
+
+    # Escribir invalida la entrada: la siguiente consulta va a la DB
+    user_service.upsert_user(uid, "premium")
+    assert user_service.get_effective_user(uid)["role"] == "premium"
+    user_service.remove_user(uid)
+    assert user_service.get_effective_user(uid)["role"] == "free"
+    assert db_reads == [uid, uid, uid]
+
+
+def test_unknown_users_are_cached_too(users_db, db_reads):
+    for _ in range(2):
+        assert user_service.get_effective_user(777)["role"] == "free"
+    assert db_reads == [777]
+
+
+def test_expiry_is_checked_without_db(users_db, db_reads, monkeypatch):
+    uid = 515151
+    user_service.upsert_user(uid, "vip", duration_months=1)
+    assert user_service.get_effective_user(uid)["role"] == "vip"
+
+    class _Later(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime.utcnow() + timedelta(days=60)
+
+    # El rol vence mientras la entrada sigue en caché
+    monkeypatch.setattr(user_service, "datetime", _Later)
+    user_data = user_service.get_effective_user(uid)
+    assert user_data["role"] == "free"
+    assert user_data["status_label"] == "Expirado"
+    assert db_reads == [uid]
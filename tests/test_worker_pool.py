@@ -0,0 +1,71 @@
+import asyncio
+import importlib
+import time
+
+import pytest
+
+worker_pool = importlib.import_module("utils.worker_pool")
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _boom():
+    raise RuntimeError("boom")
+
+
+@pytest.mark.asyncio
+async def test_pool_bounds_concurrency_and_tracks_queue_wait():
+    pool = worker_pool.WorkerPool("test", workers=1, timeout=5)
+    try:
+        results = await asyncio.gather(pool.run(_sleep, 0.1), pool.run(_sleep, 0.1))
+        assert results == [0.1, 0.1]
+        stats = pool.stats()
+        assert stats["completed"] == 2
+        assert stats["waiting"] == 0 and stats["running"] == 0
+        # Con un solo trabajador la segunda tarea esperó a la primera
+        assert stats["queue_wait_max"] >= 0.05
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pool_timeout_and_errors():
+    pool = worker_pool.WorkerPool("test", workers=2, timeout=5)
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(_sleep, 0.5, timeout=0.05)
+        with pytest.raises(RuntimeError):
+            await pool.run(_boom)
+        stats = pool.stats()
+        assert stats["timeouts"] == 1
+        assert stats["failed"] == 1
+        # La tarea vencida ocupa su plaza hasta que el hilo termina
+        assert stats["running"] == 1
+        await asyncio.sleep(0.6)
+        assert pool.stats()["running"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_invalid_mode():
+    with pytest.raises(ValueError):
+        worker_pool.WorkerPool("test", mode="fiber")
+
+
+@pytest.mark.asyncio
+async def test_timed_out_task_keeps_its_slot_until_it_finishes():
+    pool = worker_pool.WorkerPool("test", workers=1, timeout=5)
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.run(_sleep, 0.3, timeout=0.05)
+        # El hilo sigue trabajando: la plaza no se ha devuelto todavía
+        assert pool.stats()["running"] == 1
+        assert await pool.run(_sleep, 0.01) == 0.01
+        stats = pool.stats()
+        assert stats["running"] == 0
+        assert stats["queue_wait_max"] >= 0.2
+    finally:
+        pool.shutdown()
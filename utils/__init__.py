@@ -4,6 +4,7 @@ from .rate_limiter import (
     RateLimitManager,
     RateLimitType,
     create_rate_limit_manager_from_config,
+    get_rate_limit_manager,
 )  # noqa: F401
 from .download_limiter import (
     downloads_left,
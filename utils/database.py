@@ -0,0 +1,225 @@
+"""
+Engines y tablas SQLAlchemy compartidos por todo el proceso.
+
+Cada servicio creaba su propio engine en cada llamada y reflejaba la tabla
+(`Table(..., autoload_with=engine)`) antes de cada consulta, lo que en
+PostgreSQL supone abrir conexiones nuevas y consultar el catálogo en cada
+petición. Aquí hay un engine por URL (con pool de conexiones configurable) y
+las tablas están declaradas una sola vez; `ensure_tables` las crea en la
+primera llamada por engine y después no vuelve a tocar la base de datos.
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Set, Tuple
+from config.config_settings import config
+
+# Optional SQLAlchemy support
+_HAS_SQLALCHEMY = False
+try:
+    import sqlalchemy as sa
+    from sqlalchemy import (
+        Table,
+        Column,
+        String,
+        Text,
+        Integer,
+        BigInteger,
+        Boolean,
+        Float,
+        DateTime,
+        Index,
+        MetaData,
+    )
+
+    _HAS_SQLALCHEMY = True
+except Exception:
+    sa = None
+
+logger = logging.getLogger(__name__)
+
+_engines: Dict[str, "sa.engine.Engine"] = {}
+_created: Set[Tuple[str, str]] = set()
+_lock = threading.Lock()
+
+metadata = None
+url_mappings = bot_settings = users = published_books = None
+telegram_file_ids = epub_metadata = None
+
+if _HAS_SQLALCHEMY:
+    metadata = MetaData()
+
+    url_mappings = Table(
+        "url_mappings",
+        metadata,
+        Column("hash", String(128), primary_key=True),
+        Column("url", Text, nullable=False),
+        Column("book_title", Text),
+        Column("series_name", Text),
+        Column("volume_number", Text),
+        Column("created_at", DateTime, server_default=sa.text("CURRENT_TIMESTAMP")),
+        Column("last_checked", DateTime),
+        Column("is_valid", Boolean, server_default=sa.true()),
+        Column("failed_checks", Integer, server_default="0"),
+        # Tráfico y próxima revalidación (ver url_cache.record_hit)
+        Column("hits", Integer, server_default="0"),
+        Column("last_hit", DateTime),
+        Column("next_check", Float),
+    )
+    # create_short_url deduplica por URL; el validador recorre los enlaces
+    # por orden de próxima comprobación (ver url_cache)
+    Index("ux_url_mappings_url", url_mappings.c.url, unique=True)
+    Index(
+        "ix_url_mappings_validation",
+        url_mappings.c.next_check,
+        url_mappings.c.last_checked,
+    )
+
+    bot_settings = Table(
+        "bot_settings",
+        metadata,
+        Column("key", String(128), primary_key=True),
+        Column("value", Text),
+    )
+
+    users = Table(
+        "users",
+        metadata,
+        Column("telegram_id", BigInteger, primary_key=True),
+        Column(
+            "role", String(50), nullable=False
+        ),  # 'white', 'vip', 'premium', 'staff'
+        Column("added_at", DateTime, default=datetime.utcnow),
+        Column("expires_at", DateTime, nullable=True),
+        Column("custom_status", String(100), nullable=True),
+        Column("created_by", BigInteger, nullable=True),
+    )
+
+    published_books = Table(
+        "published_books",
+        metadata,
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        Column("message_id", Integer, nullable=True),
+        Column("channel_id", BigInteger, nullable=True),
+        Column("title", Text, nullable=True),
+        Column("author", Text, nullable=True),
+        Column("series", Text, nullable=True),
+        Column("volume", Text, nullable=True),
+        Column("slug", Text, nullable=True),
+        Column("file_size", Integer, nullable=True),
+        Column("file_unique_id", Text, nullable=True),
+        Column("date_published", DateTime, default=datetime.utcnow),
+        Column("maquetado_por", Text, nullable=True),
+        Column("demografia", Text, nullable=True),
+        Column("generos", Text, nullable=True),
+        Column("ilustrador", Text, nullable=True),
+        Column("traduccion", Text, nullable=True),
+    )
+    # get_latest_books: últimos publicados, en general o de un canal
+    Index("ix_published_books_date", published_books.c.date_published.desc())
+    Index(
+        "ix_published_books_channel_date",
+        published_books.c.channel_id,
+        published_books.c.date_published.desc(),
+    )
+
+    telegram_file_ids = Table(
+        "telegram_file_ids",
+        metadata,
+        Column("content_hash", String(64), primary_key=True),
+        Column("kind", String(16), primary_key=True),
+        Column("file_id", Text, nullable=False),
+        Column("file_unique_id", Text),
+        Column("source_url", Text),
+        Column("updated_at", DateTime, default=datetime.utcnow),
+    )
+
+    epub_metadata = Table(
+        "epub_metadata",
+        metadata,
+        Column("content_hash", String(64), primary_key=True),
+        Column("source_url", String(1024), primary_key=True, index=True),
+        Column("etag", Text),
+        Column("size", Integer, default=0),
+        Column("cover_path", Text),
+        Column("meta_json", Text, nullable=False),
+        Column("updated_at", Float, nullable=False),
+    )
+
+
+def get_engine(url: str) -> "sa.engine.Engine":
+    """Engine compartido para `url`; se crea en la primera llamada."""
+    if not _HAS_SQLALCHEMY:
+        raise RuntimeError("SQLAlchemy not installed")
+    if not url:
+        raise RuntimeError("DATABASE_URL not configured")
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            kwargs = {"future": True, "pool_pre_ping": True}
+            if not url.startswith("sqlite"):
+                # SQLite usa su propio pool; estos parámetros son para servidores
+                kwargs.update(
+                    pool_size=config.DB_POOL_SIZE,
+                    max_overflow=config.DB_MAX_OVERFLOW,
+                    pool_timeout=config.DB_POOL_TIMEOUT,
+                    pool_recycle=config.DB_POOL_RECYCLE,
+                )
+            engine = sa.create_engine(url, **kwargs)
+            _engines[url] = engine
+    return engine
+
+
+def ensure_tables(engine, *tables) -> None:
+    """Crea las tablas que falten, una sola vez por engine y tabla."""
+    key = str(engine.url)
+    missing = [t for t in tables if (key, t.name) not in _created]
+    if not missing:
+        return
+    metadata.create_all(engine, tables=missing)
+    # create_all no toca las tablas que ya existían: añadirles los índices
+    for table in missing:
+        ensure_indexes(engine, table)
+    with _lock:
+        _created.update((key, t.name) for t in missing)
+
+
+def ensure_indexes(engine, table) -> None:
+    """
+    Crea los índices declarados de `table` que falten. Un índice que no se
+    puede crear (p. ej. sobre una columna que aún no se ha añadido) se
+    registra y se omite: las consultas siguen funcionando. Si falla uno
+    único `ux_*` (URLs duplicadas de versiones antiguas) se crea en su lugar
+    el normal `ix_*`, igual que url_cache.init_db y la migración 0003.
+    """
+    for index in table.indexes:
+        try:
+            index.create(engine, checkfirst=True)
+        except Exception as e:
+            logger.warning(f"No se pudo crear el índice {index.name}: {e}")
+            if index.unique and index.name.startswith("ux_"):
+                name = "ix_" + index.name[3:]
+                columns = ", ".join(c.name for c in index.columns)
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(
+                            sa.text(
+                                f"CREATE INDEX IF NOT EXISTS {name} "
+                                f"ON {table.name} ({columns})"
+                            )
+                        )
+                except Exception as e2:
+                    logger.warning(f"No se pudo crear el índice {name}: {e2}")
+
+
+def dispose_engines() -> None:
+    """Cierra las conexiones de todos los engines (al apagar o tras un fork)."""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _created.clear()
@@ -1,8 +1,10 @@
 import logging
 import functools
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 from config.config_settings import config
+from utils.rate_limiter import get_rate_limit_manager
 
 logger = logging.getLogger(__name__)
 
@@ -39,13 +41,66 @@ def log_user_action(action_name: str):
     return decorator
 
 
-def rate_limit(limit_type: str, max_requests: int = 10, window_seconds: int = 60):
+def rate_limit(
+    limit_type: str,
+    max_requests: int = 10,
+    window_seconds: int = 60,
+    global_max_requests: int = 0,
+    chat_max_requests: int = 0,
+    key: Optional[str] = None,
+):
+    """
+    Limita el handler con token buckets (utils.rate_limiter):
+    `max_requests` por usuario cada `window_seconds`, y opcionalmente un
+    límite compartido para todo el handler (`global_max_requests`) y otro
+    por chat (`chat_max_requests`). Los admins no tienen límite.
+
+    El bucket de cada usuario es propio del handler; para que varios
+    handlers compartan cupo se les da el mismo `key`, y entonces deben
+    declarar el mismo límite (si no, ValueError al decorar).
+    Con max_requests <= 0 el handler no se limita.
+    """
+
     def decorator(func):
+        if max_requests <= 0:
+            return func
+        route_key = f"route:{func.__module__}.{func.__qualname__}"
+        bucket_key = (limit_type, key or route_key)
+        manager = get_rate_limit_manager()
+        manager.set_default_limit(
+            bucket_key, max_requests, window_seconds, exclusive=True
+        )
+        if global_max_requests:
+            manager.add_global_limit(route_key, global_max_requests, window_seconds)
+
         @functools.wraps(func)
         async def wrapper(
             update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs
         ):
-            # Aquí podrías implementar lógica de rate limiting
+            user = update.effective_user
+            if user is None or user.id in config.ADMIN_USERS:
+                return await func(update, context, *args, **kwargs)
+
+            keys = [route_key] if global_max_requests else []
+            chat = update.effective_chat
+            if chat_max_requests and chat is not None:
+                chat_key = (route_key, chat.id)
+                manager.add_global_limit(
+                    chat_key, chat_max_requests, window_seconds, pinned=False
+                )
+                keys.append(chat_key)
+
+            wait = manager.acquire(user.id, bucket_key, *keys)
+            if wait > 0:
+                logger.info(
+                    f"Rate limit '{limit_type}' para {user.id}: reintentar en {wait:.1f}s"
+                )
+                text = f"⏳ Demasiadas solicitudes. Inténtalo de nuevo en {int(wait) + 1} s."
+                if update.callback_query:
+                    await update.callback_query.answer(text, show_alert=False)
+                elif update.effective_message:
+                    await update.effective_message.reply_text(text)
+                return
             return await func(update, context, *args, **kwargs)
 
         return wrapper
@@ -3,92 +3,86 @@
 import json
 import os
 import logging
-from typing import Union, Dict
+from typing import Optional, Union
 from config.config_settings import config
-from services.user_service import get_effective_user
-# from core.state_manager import state_manager (Moved to local scope)
+from utils.download_store import DownloadCounterStore
+# from services.user_service import get_effective_user (Moved to local scope)
 
 logger = logging.getLogger(__name__)
 
-# Archivo para persistencia de descargas diarias
+# Contadores de descargas diarias (SQLite, compartible entre réplicas)
+DAILY_DOWNLOADS_DB = config.DOWNLOADS_DB_PATH
+# Formato anterior: se importa una vez al arrancar y se renombra
 DAILY_DOWNLOADS_FILE = os.path.join("data", "daily_downloads.json")
 
+_store: Optional[DownloadCounterStore] = None
 
-def load_downloads() -> None:
-    """
-    Carga los contadores de descarga desde el archivo JSON al iniciar el bot.
-    """
+
+def get_download_store() -> DownloadCounterStore:
+    global _store
+    if _store is None:
+        _store = DownloadCounterStore(DAILY_DOWNLOADS_DB)
+    return _store
+
+
+def _import_legacy_json(store: DownloadCounterStore) -> None:
     if not os.path.exists(DAILY_DOWNLOADS_FILE):
         return
-
     try:
         with open(DAILY_DOWNLOADS_FILE, "r") as f:
             data = json.load(f)
-
-        count = 0
+        # El JSON se borraba a medianoche: lo que contenga es del día en curso
+        counts = {}
         for uid_str, downloads in data.items():
             try:
-                uid = int(uid_str)
-                from core.state_manager import state_manager
-                st = state_manager.get_user_state(uid)
-                st["downloads_used"] = downloads
-                count += 1
-            except ValueError:
+                counts[int(uid_str)] = int(downloads)
+            except (TypeError, ValueError):
                 continue
+        store.set_many(counts)
+        os.replace(DAILY_DOWNLOADS_FILE, f"{DAILY_DOWNLOADS_FILE}.migrated")
+        logger.info(f"Importados {len(data)} contadores desde daily_downloads.json.")
+    except Exception as e:
+        logger.error(f"Error importando daily_downloads.json: {e}")
 
+
+def load_downloads() -> None:
+    """
+    Carga los contadores de descarga del día al iniciar el bot.
+    """
+    store = get_download_store()
+    try:
+        _import_legacy_json(store)
+        count = store.load()
         logger.info(f"Cargados contadores de descarga para {count} usuarios.")
     except Exception as e:
-        logger.error(f"Error cargando daily_downloads.json: {e}")
+        logger.error(f"Error cargando contadores de descarga: {e}")
 
 
 def save_download(uid: int, count: int) -> None:
     """
-    Guarda el contador de descargas de un usuario específico en el JSON.
+    Fija el contador de descargas de un usuario.
     """
     try:
-        # Cargar datos existentes
-        data = {}
-        if os.path.exists(DAILY_DOWNLOADS_FILE):
-            try:
-                with open(DAILY_DOWNLOADS_FILE, "r") as f:
-                    data = json.load(f)
-            except json.JSONDecodeError:
-                pass  # Si está corrupto, empezamos de nuevo
-
-        # Actualizar usuario
-        data[str(uid)] = count
-
-        # Guardar (asegurando que el directorio data existe)
-        os.makedirs(os.path.dirname(DAILY_DOWNLOADS_FILE), exist_ok=True)
-        with open(DAILY_DOWNLOADS_FILE, "w") as f:
-            json.dump(data, f)
-
+        get_download_store().set(uid, count)
     except Exception as e:
         logger.error(f"Error guardando descarga para {uid}: {e}")
 
 
+def downloads_used(uid: int) -> int:
+    """Descargas registradas hoy por el usuario."""
+    return get_download_store().get(uid)
+
+
 def reset_all_downloads() -> None:
     """
-    Resetea todos los contadores de descarga en memoria y elimina el archivo de persistencia.
+    Resetea todos los contadores de descarga en memoria y en disco.
     Se llama diariamente a las 00:00.
     """
-    # 1. Resetear en memoria (state_manager)
-    # Nota: state_manager.user_state es un dict {uid: {state...}}
-    # Iteramos sobre todos los usuarios cargados en memoria
-    from core.state_manager import state_manager
-    for uid, state in state_manager.user_state.items():
-        if "downloads_used" in state:
-            state["downloads_used"] = 0
-
-    # 2. Eliminar archivo de persistencia
-    if os.path.exists(DAILY_DOWNLOADS_FILE):
-        try:
-            os.remove(DAILY_DOWNLOADS_FILE)
-            logger.info("Archivo de descargas diarias eliminado (reset diario).")
-        except Exception as e:
-            logger.error(f"Error eliminando daily_downloads.json: {e}")
-    else:
-        logger.info("No había archivo de descargas diarias para eliminar.")
+    try:
+        get_download_store().reset_all()
+        logger.info("Contadores de descargas diarias reseteados.")
+    except Exception as e:
+        logger.error(f"Error reseteando contadores de descarga: {e}")
 
 
 def downloads_left(uid: int) -> Union[int, str]:
@@ -100,9 +94,8 @@ def downloads_left(uid: int) -> Union[int, str]:
     - WhiteList (Patrocinador): 10 descargas diarias
     - Resto: MAX_DOWNLOADS_PER_DAY por defecto (p.ej. 5)
     """
-    from core.state_manager import state_manager
-    st = state_manager.get_user_state(uid)
-    used = st.get("downloads_used", 0)
+    from services.user_service import get_effective_user
+    used = downloads_used(uid)
 
     user_data = get_effective_user(uid)
     role = user_data.get("role", "free")
@@ -135,13 +128,7 @@ def can_download(uid: int) -> bool:
 
 def record_download(uid: int) -> None:
     """
-    Incrementa el contador de descargas usadas en el estado del usuario
-    y lo persiste en disco.
+    Incrementa el contador de descargas usadas del usuario (UPSERT atómico
+    en la DB compartida).
     """
-    from core.state_manager import state_manager
-    st = state_manager.get_user_state(uid)
-    new_count = st.get("downloads_used", 0) + 1
-    st["downloads_used"] = new_count
-
-    # Persistir cambio
-    save_download(uid, new_count)
+    get_download_store().increment(uid)
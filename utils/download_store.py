@@ -0,0 +1,103 @@
+"""
+Contadores de descargas diarias persistidos en SQLite.
+
+Sustituye a `data/daily_downloads.json`, que se leía y reescribía entero en
+cada descarga. La tabla es la única fuente de verdad: cada lectura consulta
+la fila del usuario y cada descarga se registra con un UPSERT atómico que
+devuelve el nuevo total (`RETURNING used`), así que varias réplicas que
+compartan el fichero (DOWNLOADS_DB_PATH) ven y respetan el mismo límite.
+
+Cada fila guarda el día al que pertenece: si el bot estaba parado a
+medianoche, los contadores de ayer se ignoran al leer y se sobrescriben
+al volver a escribir.
+"""
+
+import logging
+from datetime import date
+from utils.sqlite_pool import get_pool
+
+logger = logging.getLogger(__name__)
+
+
+def _today() -> str:
+    return date.today().isoformat()
+
+
+class DownloadCounterStore:
+    """Contadores por usuario del día en curso, leídos y escritos en la DB."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._initialized = False
+
+    def _pool(self):
+        return get_pool(self.path)
+
+    def _ensure_table(self) -> None:
+        if self._initialized:
+            return
+        with self._pool().write() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS daily_downloads (
+                    telegram_id INTEGER PRIMARY KEY,
+                    used INTEGER NOT NULL DEFAULT 0,
+                    day TEXT NOT NULL
+                )
+                """
+            )
+        self._initialized = True
+
+    def load(self) -> int:
+        """Prepara la tabla. Devuelve cuántos usuarios tienen descargas hoy."""
+        self._ensure_table()
+        with self._pool().read() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM daily_downloads WHERE day = ?", (_today(),)
+            ).fetchone()
+        return row[0]
+
+    def get(self, uid: int) -> int:
+        self._ensure_table()
+        with self._pool().read() as conn:
+            row = conn.execute(
+                "SELECT used FROM daily_downloads WHERE telegram_id = ? AND day = ?",
+                (uid, _today()),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def increment(self, uid: int, n: int = 1) -> int:
+        """Suma `n` descargas al usuario y devuelve el nuevo total."""
+        self._ensure_table()
+        with self._pool().write() as conn:
+            row = conn.execute(
+                "INSERT INTO daily_downloads (telegram_id, used, day) "
+                "VALUES (?, ?, ?) ON CONFLICT(telegram_id) DO UPDATE SET "
+                "used = CASE WHEN day = excluded.day "
+                "THEN used + excluded.used ELSE excluded.used END, "
+                "day = excluded.day RETURNING used",
+                (uid, n, _today()),
+            ).fetchone()
+        return row[0]
+
+    def set(self, uid: int, count: int) -> None:
+        """Fija el contador de un usuario (p. ej. /reset)."""
+        self.set_many({uid: count})
+
+    def set_many(self, counts: dict) -> None:
+        """Fija varios contadores en una sola transacción."""
+        self._ensure_table()
+        day = _today()
+        with self._pool().write() as conn:
+            conn.executemany(
+                "INSERT INTO daily_downloads (telegram_id, used, day) "
+                "VALUES (?, ?, ?) ON CONFLICT(telegram_id) DO UPDATE SET "
+                "used = excluded.used, day = excluded.day",
+                [(uid, n, day) for uid, n in counts.items()],
+            )
+
+    def reset_all(self) -> None:
+        """Pone a cero todos los contadores (reset de medianoche)."""
+        self._ensure_table()
+        with self._pool().write() as conn:
+            conn.execute("DELETE FROM daily_downloads")
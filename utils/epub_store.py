@@ -0,0 +1,409 @@
+"""
+Almacén persistente de EPUBs direccionado por contenido.
+
+Cada EPUB se guarda una sola vez bajo `<root>/objects/<sha[:2]>/<sha>.epub`,
+con un fichero `<sha>.json` al lado que recuerda las URLs de origen que
+apuntan a él (y su ETag/Last-Modified). El índice en memoria se reconstruye
+escaneando el directorio al arrancar, las escrituras son atómicas
+(fichero temporal + os.replace) y, cuando se supera el presupuesto de bytes,
+se desalojan los objetos usados hace más tiempo (LRU por mtime).
+"""
+
+import os
+import json
+import time
+import hashlib
+import asyncio
+import logging
+import tempfile
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Union
+from config.config_settings import config
+from utils.http_client import fetch_bytes, cleanup_tmp, MAX_IN_MEMORY_BYTES
+from utils.host_limiter import Priority
+
+logger = logging.getLogger(__name__)
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+
+
+@dataclass
+class StoreObject:
+    sha: str
+    path: str
+    size: int
+    last_access: float
+    urls: Dict[str, dict] = field(default_factory=dict)
+
+
+@dataclass
+class StoreHit:
+    path: str
+    fresh: bool
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    sha: Optional[str] = None
+
+
+class EpubStore:
+    """Caché en disco de EPUBs con presupuesto de bytes y desalojo LRU."""
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        revalidate_after: int = 21600,
+        min_age: int = 900,
+    ):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, "objects")
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        # Objetos usados hace menos de `min_age` segundos no se desalojan:
+        # puede haber un envío pendiente que todavía apunta a su ruta.
+        self.min_age = min_age
+        self._objects: Dict[str, StoreObject] = {}
+        self._by_url: Dict[str, str] = {}
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    # --- Índice -----------------------------------------------------------
+
+    def _object_path(self, sha: str) -> str:
+        return os.path.join(self.objects_dir, sha[:2], f"{sha}.epub")
+
+    def _sidecar_path(self, sha: str) -> str:
+        return os.path.join(self.objects_dir, sha[:2], f"{sha}.json")
+
+    def scan(self) -> None:
+        """Reconstruye el índice en memoria a partir del contenido del disco."""
+        with self._lock:
+            self._objects.clear()
+            self._by_url.clear()
+            self._bytes = 0
+            os.makedirs(self.objects_dir, exist_ok=True)
+            for dirpath, _dirs, files in os.walk(self.objects_dir):
+                for name in files:
+                    full = os.path.join(dirpath, name)
+                    if name.endswith(".part"):
+                        # Escritura interrumpida en una ejecución anterior
+                        self._unlink(full)
+                        continue
+                    if not name.endswith(".epub"):
+                        continue
+                    sha = name[: -len(".epub")]
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue
+                    urls = {}
+                    try:
+                        with open(self._sidecar_path(sha), "r") as f:
+                            urls = json.load(f).get("urls", {})
+                    except (OSError, ValueError):
+                        pass
+                    obj = StoreObject(sha, full, st.st_size, st.st_mtime, urls)
+                    self._objects[sha] = obj
+                    self._bytes += st.st_size
+                    for url in urls:
+                        self._by_url[url] = sha
+            logger.info(
+                "EpubStore: %d objetos (%d bytes) en %s",
+                len(self._objects),
+                self._bytes,
+                self.root,
+            )
+            self._evict()
+
+    def _write_sidecar(self, obj: StoreObject) -> None:
+        path = self._sidecar_path(obj.sha)
+        tmp = f"{path}.part"
+        with open(tmp, "w") as f:
+            json.dump({"urls": obj.urls}, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    # --- Consultas --------------------------------------------------------
+
+    def owns(self, path: str) -> bool:
+        return os.path.abspath(path).startswith(self.objects_dir + os.sep)
+
+    def lookup(self, url: str) -> Optional[StoreHit]:
+        with self._lock:
+            sha = self._by_url.get(url)
+            obj = self._objects.get(sha) if sha else None
+            if obj is None or not os.path.exists(obj.path):
+                if obj is not None:
+                    self._drop(obj)
+                self.misses += 1
+                return None
+            info = obj.urls.get(url, {})
+            checked_at = info.get("checked_at", 0)
+            fresh = (time.time() - checked_at) < self.revalidate_after
+            self._touch(obj)
+            self.hits += 1
+            return StoreHit(
+                path=obj.path,
+                fresh=fresh,
+                etag=info.get("etag"),
+                last_modified=info.get("last_modified"),
+                sha=obj.sha,
+            )
+
+    def peek(self, url: str) -> Optional[StoreHit]:
+        """Como lookup() pero sin contar acierto ni renovar el acceso LRU."""
+        with self._lock:
+            sha = self._by_url.get(url)
+            obj = self._objects.get(sha) if sha else None
+            if obj is None:
+                return None
+            info = obj.urls.get(url, {})
+            fresh = (time.time() - info.get("checked_at", 0)) < self.revalidate_after
+            return StoreHit(
+                path=obj.path,
+                fresh=fresh,
+                etag=info.get("etag"),
+                last_modified=info.get("last_modified"),
+                sha=obj.sha,
+            )
+
+    def _touch(self, obj: StoreObject) -> None:
+        obj.last_access = time.time()
+        try:
+            os.utime(obj.path, None)
+        except OSError:
+            pass
+
+    def mark_checked(self, url: str) -> None:
+        """Registra una revalidación correcta (304) de `url`."""
+        with self._lock:
+            sha = self._by_url.get(url)
+            obj = self._objects.get(sha) if sha else None
+            if obj is None or url not in obj.urls:
+                return
+            obj.urls[url]["checked_at"] = time.time()
+            try:
+                self._write_sidecar(obj)
+            except OSError as e:
+                logger.debug("EpubStore: no se pudo actualizar sidecar %s: %s", sha, e)
+
+    # --- Escritura --------------------------------------------------------
+
+    def put(
+        self,
+        url: str,
+        data_or_path: Union[bytes, str],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Guarda el EPUB (bytes o ruta a fichero) y lo asocia a `url`.
+        Retorna la ruta del objeto almacenado, o None si no se pudo guardar.
+        Operación bloqueante: llamar desde un hilo (asyncio.to_thread).
+        """
+        if not self.enabled:
+            return None
+        os.makedirs(self.objects_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.objects_dir, suffix=".part")
+        try:
+            h = hashlib.sha256()
+            with os.fdopen(fd, "wb") as out:
+                if isinstance(data_or_path, (bytes, bytearray)):
+                    h.update(data_or_path)
+                    out.write(data_or_path)
+                else:
+                    with open(data_or_path, "rb") as src:
+                        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                            h.update(chunk)
+                            out.write(chunk)
+            sha = h.hexdigest()
+            size = os.path.getsize(tmp)
+            if size > self.max_bytes:
+                self._unlink(tmp)
+                return None
+
+            with self._lock:
+                obj = self._objects.get(sha)
+                if obj is None or not os.path.exists(obj.path):
+                    final = self._object_path(sha)
+                    os.makedirs(os.path.dirname(final), exist_ok=True)
+                    os.replace(tmp, final)
+                    obj = StoreObject(sha, final, size, time.time())
+                    self._objects[sha] = obj
+                    self._bytes += size
+                else:
+                    # Contenido ya presente (otra URL o misma versión)
+                    self._unlink(tmp)
+                    self._touch(obj)
+
+                previous = self._by_url.get(url)
+                if previous and previous != sha and previous in self._objects:
+                    old = self._objects[previous]
+                    old.urls.pop(url, None)
+                    self._write_sidecar(old)
+
+                obj.urls[url] = {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "checked_at": time.time(),
+                }
+                self._by_url[url] = sha
+                self._write_sidecar(obj)
+                self._evict()
+                return obj.path if sha in self._objects else None
+        except Exception as e:
+            logger.error("EpubStore: error guardando %s: %s", url, e)
+            self._unlink(tmp)
+            return None
+
+    def _drop(self, obj: StoreObject) -> None:
+        self._objects.pop(obj.sha, None)
+        self._bytes -= obj.size
+        for url in obj.urls:
+            if self._by_url.get(url) == obj.sha:
+                self._by_url.pop(url, None)
+        self._unlink(obj.path)
+        self._unlink(self._sidecar_path(obj.sha))
+
+    def _evict(self) -> None:
+        if self._bytes <= self.max_bytes:
+            return
+        now = time.time()
+        for obj in sorted(self._objects.values(), key=lambda o: o.last_access):
+            if self._bytes <= self.max_bytes:
+                break
+            if now - obj.last_access < self.min_age:
+                continue
+            logger.debug("EpubStore: desalojando %s (%d bytes)", obj.sha, obj.size)
+            self._drop(obj)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "objects": len(self._objects),
+            "urls": len(self._by_url),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_store: Optional[EpubStore] = None
+_store_lock = threading.Lock()
+
+
+def get_epub_store() -> EpubStore:
+    """
+    Devuelve el almacén global, creándolo y escaneándolo en el primer uso.
+    El escaneo recorre el disco: desde código async usar open_epub_store().
+    """
+    global _store
+    if _store is not None:
+        return _store
+    with _store_lock:
+        if _store is not None:
+            return _store
+        root = config.EPUB_STORE_DIR
+        if not os.path.isabs(root):
+            root = os.path.join(_ROOT_DIR, root)
+        store = EpubStore(
+            root,
+            max_bytes=config.EPUB_STORE_MAX_BYTES,
+            revalidate_after=config.EPUB_STORE_REVALIDATE,
+        )
+        if store.enabled:
+            try:
+                store.scan()
+            except Exception as e:
+                logger.error("EpubStore: error escaneando %s: %s", root, e)
+        _store = store
+    return _store
+
+
+async def open_epub_store() -> EpubStore:
+    """get_epub_store sin bloquear el event loop (el escaneo va en un hilo)."""
+    if _store is not None:
+        return _store
+    return await asyncio.to_thread(get_epub_store)
+
+
+def _load_small(path: str) -> Union[bytes, str]:
+    """Contenido de `path` si cabe en memoria; si no, la propia ruta."""
+    try:
+        if os.path.getsize(path) <= MAX_IN_MEMORY_BYTES:
+            with open(path, "rb") as f:
+                return f.read()
+    except OSError:
+        pass
+    return path
+
+
+def is_store_path(path: str) -> bool:
+    """True si `path` pertenece al almacén (no debe borrarse como temporal)."""
+    return _store is not None and _store.owns(path)
+
+
+async def fetch_epub(url: str, timeout: int = 120) -> Union[bytes, str, None]:
+    """
+    Igual que fetch_bytes pero sirviendo desde el almacén local cuando es posible.
+
+    Una copia fresca se devuelve sin tocar la red; una copia antigua se revalida
+    con If-None-Match/If-Modified-Since. Si el origen falla y hay copia local,
+    se sirve la copia local. Mismo contrato que fetch_bytes: bytes hasta
+    MAX_IN_MEMORY_BYTES y, por encima, una ruta (aquí la del objeto
+    almacenado, que cleanup_tmp no borra); None si no hay EPUB.
+    """
+    store = await open_epub_store()
+    if not store.enabled:
+        return await fetch_bytes(url, timeout=timeout, priority=Priority.BULK)
+
+    hit = await asyncio.to_thread(store.lookup, url)
+    if hit and hit.fresh:
+        logger.debug("fetch_epub: servido desde almacén local %s", url)
+        return await asyncio.to_thread(_load_small, hit.path)
+
+    headers = {}
+    if hit and hit.etag:
+        headers["If-None-Match"] = hit.etag
+    if hit and hit.last_modified:
+        headers["If-Modified-Since"] = hit.last_modified
+
+    meta: dict = {}
+    data = await fetch_bytes(
+        url,
+        timeout=timeout,
+        headers=headers or None,
+        response_meta=meta,
+        priority=Priority.BULK,
+    )
+    if hit and meta.get("status") == 304:
+        await asyncio.to_thread(store.mark_checked, url)
+        return await asyncio.to_thread(_load_small, hit.path)
+    if not data:
+        if hit:
+            logger.warning(
+                "fetch_epub: origen no disponible, usando copia local %s", url
+            )
+            return await asyncio.to_thread(_load_small, hit.path)
+        return None
+
+    path = await asyncio.to_thread(
+        store.put, url, data, meta.get("etag"), meta.get("last_modified")
+    )
+    if path and not isinstance(data, (bytes, bytearray)):
+        cleanup_tmp(data)
+        return path
+    return data
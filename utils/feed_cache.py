@@ -0,0 +1,137 @@
+"""
+Caché en memoria de feeds OPDS ya parseados.
+
+Las entradas se indexan por URL, expiran tras un TTL configurable y se
+desalojan en orden LRU cuando el tamaño total (bytes del XML original)
+supera el presupuesto. Cada entrada guarda ETag/Last-Modified para poder
+revalidar con un GET condicional y reutilizar el feed ante un 304.
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeedCacheEntry:
+    feed: Any
+    size: int
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def is_fresh(self, ttl: float, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        return (now - self.fetched_at) < ttl
+
+    def has_validators(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+
+class FeedCache:
+    """LRU por bytes con TTL para feeds parseados."""
+
+    def __init__(self, ttl: float = 300, max_bytes: int = 32 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, FeedCacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get(self, url: str) -> Optional[FeedCacheEntry]:
+        """Devuelve la entrada (fresca o no) y la marca como usada recientemente."""
+        entry = self._entries.get(url)
+        if entry is not None:
+            self._entries.move_to_end(url)
+        return entry
+
+    def get_fresh(self, url: str) -> Optional[Any]:
+        """Devuelve el feed si la entrada sigue dentro del TTL; None en otro caso."""
+        entry = self.get(url)
+        if entry is not None and entry.is_fresh(self.ttl):
+            self.hits += 1
+            return entry.feed
+        self.misses += 1
+        return None
+
+    def put(
+        self,
+        url: str,
+        feed: Any,
+        size: int,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        if not self.enabled or size > self.max_bytes:
+            return
+        self.discard(url)
+        self._entries[url] = FeedCacheEntry(
+            feed=feed,
+            size=size,
+            fetched_at=time.monotonic(),
+            etag=etag,
+            last_modified=last_modified,
+        )
+        self._bytes += size
+        self._evict()
+
+    def touch(self, url: str) -> Optional[Any]:
+        """Renueva el TTL de una entrada tras un 304 y devuelve su feed."""
+        entry = self.get(url)
+        if entry is None:
+            return None
+        entry.fetched_at = time.monotonic()
+        self.revalidated += 1
+        return entry.feed
+
+    def discard(self, url: str) -> None:
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            url, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            logger.debug("FeedCache: desalojado %s (%d bytes)", url, entry.size)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Cabeceras If-None-Match / If-Modified-Since para revalidar `url`."""
+        entry = self._entries.get(url)
+        headers: Dict[str, str] = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._entries
@@ -0,0 +1,295 @@
+"""
+Límite adaptativo de peticiones simultáneas por host de origen.
+
+Cada host tiene un límite de concurrencia que se ajusta con AIMD: sube
+despacio (+1 por "ventana" de respuestas rápidas y correctas) y se reduce a
+la mitad cuando el origen da señales de saturación (403/429/503, timeouts,
+errores de conexión) o la latencia hasta las cabeceras supera el objetivo.
+Las peticiones que no caben esperan en tres colas con prioridad estricta:
+la navegación interactiva pasa antes que las descargas de EPUB, y estas
+antes que la validación en segundo plano, que además nunca ocupa más de la
+mitad del límite.
+
+    async with get_host_limiter(url).slot(Priority.BULK) as slot:
+        async with session.get(url) as resp:
+            slot.response(resp.status)
+            ...
+
+`backoff_delay` calcula las esperas entre reintentos: exponencial con
+jitter completo, o lo que indique Retry-After si el origen lo envía.
+"""
+
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Deque, Dict, Optional
+from urllib.parse import urlsplit
+from config.config_settings import config
+
+logger = logging.getLogger(__name__)
+
+# Estados con los que el origen (o Cloudflare delante) pide que bajemos el ritmo
+OVERLOAD_STATUSES = {403, 429, 502, 503, 504}
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # feeds y portadas que el usuario está esperando
+    BULK = 1  # descargas de EPUB
+    BACKGROUND = 2  # validación periódica de enlaces
+
+
+class _Slot:
+    """Plaza concedida por el limitador; mide latencia y resultado."""
+
+    def __init__(self, limiter: "HostLimiter", priority: Priority):
+        self._limiter = limiter
+        self._priority = priority
+        self._start = 0.0
+        self._latency: Optional[float] = None
+        self._status: Optional[int] = None
+        self._released = False
+        # Futuro en cola mientras se espera plaza (ver `promote`)
+        self._waiting: Optional[asyncio.Future] = None
+        self._granted = False
+
+    def response(self, status: int) -> None:
+        """Registrar las cabeceras recibidas (fin de la latencia medida)."""
+        self._latency = time.monotonic() - self._start
+        self._status = status
+
+    def promote(self, priority: Priority) -> None:
+        """
+        Subir la prioridad de una plaza que aún no se ha concedido (p. ej. un
+        usuario espera ahora una descarga que empezó en segundo plano).
+        """
+        if self._granted or priority >= self._priority:
+            return
+        if self._waiting is not None and not self._limiter._promote(
+            self._waiting, self._priority, priority
+        ):
+            return
+        self._priority = priority
+
+    async def __aenter__(self) -> "_Slot":
+        await self._limiter._acquire(self)
+        self._start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        # Sin respuesta: timeout o error de conexión cuentan como saturación;
+        # una cancelación del llamador no dice nada del origen
+        self.release(
+            failed=exc_type is not None
+            and not issubclass(exc_type, asyncio.CancelledError)
+        )
+
+    def release(self, failed: bool = False) -> None:
+        """
+        Devolver la plaza. Lo hace `async with`; llamarlo a mano solo cuando
+        la plaza vive más que un bloque (p. ej. una descarga en streaming).
+        """
+        if self._released:
+            return
+        self._released = True
+        if self._status is not None:
+            overloaded = self._status in OVERLOAD_STATUSES
+        else:
+            overloaded = failed
+        self._limiter._release(self._priority, self._latency, overloaded)
+
+
+class HostLimiter:
+    """Límite AIMD de concurrencia con colas por prioridad para un host."""
+
+    def __init__(
+        self,
+        host: str,
+        initial: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        latency_target: float = 5.0,
+    ):
+        self.host = host
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_target = latency_target
+        self.inflight = 0
+        self._inflight_by: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._lanes: Dict[Priority, Deque[asyncio.Future]] = {
+            p: deque() for p in Priority
+        }
+        self._last_decrease = 0.0
+        self.stats_counters = {"ok": 0, "overloaded": 0, "slow": 0, "decreases": 0}
+
+    def slot(self, priority: Priority = Priority.INTERACTIVE) -> _Slot:
+        return _Slot(self, priority)
+
+    def _capacity(self, priority: Priority) -> int:
+        cap = int(self.limit)
+        if priority == Priority.BACKGROUND:
+            cap = max(1, cap // 2)
+        return cap
+
+    def _can_start(self, priority: Priority) -> bool:
+        if self.inflight >= int(self.limit):
+            return False
+        if priority == Priority.BACKGROUND:
+            return self._inflight_by[priority] < self._capacity(priority)
+        return True
+
+    async def _acquire(self, slot: _Slot) -> None:
+        priority = slot._priority
+        waiting_ahead = any(self._lanes[p] for p in Priority if p <= priority)
+        if not waiting_ahead and self._can_start(priority):
+            self._take(priority)
+            slot._granted = True
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._lanes[priority].append(fut)
+        slot._waiting = fut
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Se nos concedió la plaza justo al cancelar: devolverla
+                self._release(slot._priority, None, False)
+            else:
+                try:
+                    self._lanes[slot._priority].remove(fut)
+                except ValueError:
+                    pass
+            raise
+        finally:
+            slot._waiting = None
+        slot._granted = True
+
+    def _promote(self, fut: asyncio.Future, old: Priority, new: Priority) -> bool:
+        # Pasar la espera a la cola de `new`; False si ya se concedió
+        try:
+            self._lanes[old].remove(fut)
+        except ValueError:
+            return False
+        self._lanes[new].append(fut)
+        self._wake()
+        return True
+
+    def _take(self, priority: Priority) -> None:
+        self.inflight += 1
+        self._inflight_by[priority] += 1
+
+    def _release(
+        self, priority: Priority, latency: Optional[float], overloaded: bool
+    ) -> None:
+        self.inflight -= 1
+        self._inflight_by[priority] -= 1
+        now = time.monotonic()
+        if overloaded:
+            self.stats_counters["overloaded"] += 1
+            self._decrease(now, 0.5)
+        elif latency is not None and latency > self.latency_target:
+            self.stats_counters["slow"] += 1
+            self._decrease(now, 0.75)
+        elif latency is not None:
+            self.stats_counters["ok"] += 1
+            # Incremento aditivo: +1 tras `limit` respuestas buenas
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def _decrease(self, now: float, factor: float) -> None:
+        # Un fallo por ventana: una ráfaga de errores de las peticiones que ya
+        # estaban en vuelo no debe hundir el límite hasta el mínimo
+        if now - self._last_decrease < self.latency_target:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self.stats_counters["decreases"] += 1
+        logger.info(
+            f"HostLimiter {self.host}: límite reducido a {int(self.limit)} "
+            f"({self.inflight} en curso)"
+        )
+
+    def _wake(self) -> None:
+        for priority in Priority:
+            lane = self._lanes[priority]
+            while lane and self._can_start(priority):
+                fut = lane.popleft()
+                if fut.done():
+                    continue
+                self._take(priority)
+                fut.set_result(None)
+            if lane:
+                # Prioridad estricta: no adelantar a quien espera en esta cola
+                return
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "host": self.host,
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "waiting": {p.name.lower(): len(q) for p, q in self._lanes.items()},
+            **self.stats_counters,
+        }
+
+
+_limiters: Dict[str, HostLimiter] = {}
+
+
+def get_host_limiter(url: str) -> HostLimiter:
+    """Limitador compartido para el host de `url`."""
+    host = urlsplit(url).netloc.lower()
+    limiter = _limiters.get(host)
+    if limiter is None:
+        limiter = HostLimiter(
+            host,
+            initial=config.HOST_CONCURRENCY_INITIAL,
+            min_limit=config.HOST_CONCURRENCY_MIN,
+            max_limit=config.HOST_CONCURRENCY_MAX,
+            latency_target=config.HOST_LATENCY_TARGET,
+        )
+        _limiters[host] = limiter
+    return limiter
+
+
+def get_host_limiter_stats() -> Dict[str, Dict[str, object]]:
+    return {host: limiter.stats() for host, limiter in _limiters.items()}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Segundos indicados por una cabecera Retry-After (número o fecha HTTP)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after: Optional[str] = None,
+    base: float = 1.0,
+    cap: float = 30.0,
+) -> float:
+    """
+    Espera antes del reintento `attempt` (0 = primer reintento): la que pida
+    el origen con Retry-After (hasta `cap`) o un valor aleatorio entre 0 y
+    base * 2**attempt ("full jitter"), para que los reintentos no lleguen
+    todos a la vez.
+    """
+    requested = parse_retry_after(retry_after)
+    if requested is not None:
+        return min(requested, cap)
+    return random.uniform(0, min(cap, base * (2**attempt)))
@@ -5,9 +5,14 @@ import asyncio
 import aiohttp
 import feedparser
 import tempfile
-from typing import Union
-from typing import Union
+from typing import Dict, Optional, Tuple, Union
 # from core.session_manager import session_manager (Moved to local scope)
+from utils.host_limiter import (
+    OVERLOAD_STATUSES,
+    Priority,
+    backoff_delay,
+    get_host_limiter,
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,39 +20,178 @@ logger = logging.getLogger(__name__)
 MAX_IN_MEMORY_BYTES = 10 * 1024 * 1024  # 10MB
 
 
+# Descargas en curso indexadas por (url, cabeceras) para coalescer peticiones
+_inflight: Dict[Tuple[str, tuple], "_Flight"] = {}
+# Referencias pendientes a ficheros temporales compartidos entre llamadores
+_tmp_refs: Dict[str, int] = {}
+_fetch_stats = {"started": 0, "joined": 0}
+
+
+class _Flight:
+    """Descarga compartida por todos los llamadores de la misma URL."""
+
+    def __init__(self, priority: Priority):
+        self.task: Optional[asyncio.Task] = None
+        self.meta: dict = {}
+        self.priority = priority
+        # Plaza del limitador del intento en curso
+        self.slot = None
+        self.waiters = 0
+
+    def promote(self, priority: Priority) -> None:
+        """Un llamador más urgente se une: la descarga pasa a su prioridad."""
+        if priority < self.priority:
+            self.priority = priority
+            if self.slot is not None:
+                self.slot.promote(priority)
+
+
 def cleanup_tmp(path):
-    """Elimina archivo temporal si existe."""
-    if isinstance(path, str) and os.path.exists(path):
+    """Elimina archivo temporal si existe.
+
+    Si el fichero lo comparten varios llamadores de `fetch_bytes`, solo se
+    borra cuando el último de ellos lo libera. Las rutas del almacén de
+    EPUBs (utils/epub_store.py) nunca se borran aquí.
+    """
+    if not isinstance(path, str):
+        return
+    from utils.epub_store import is_store_path
+
+    if is_store_path(path):
+        # Objeto del almacén persistente de EPUBs, no es un temporal
+        return
+    refs = _tmp_refs.get(path)
+    if refs is not None:
+        if refs > 1:
+            _tmp_refs[path] = refs - 1
+            return
+        _tmp_refs.pop(path, None)
+    if os.path.exists(path):
         try:
             os.unlink(path)
         except Exception:
             pass
 
 
+def get_fetch_stats() -> Dict[str, int]:
+    """Contadores de descargas iniciadas y de llamadores que se unieron a una en curso."""
+    return {**_fetch_stats, "inflight": len(_inflight)}
+
+
+def _finish_flight(key: Tuple[str, tuple], flight: _Flight) -> None:
+    # Se ejecuta al completar la tarea, antes de que se reanude ningún llamador,
+    # así el contador de referencias ya está fijado cuando alguno haga cleanup_tmp.
+    if _inflight.get(key) is flight:
+        _inflight.pop(key, None)
+    if flight.task.cancelled() or flight.task.exception() is not None:
+        return
+    result = flight.task.result()
+    if isinstance(result, str):
+        if flight.waiters > 0:
+            _tmp_refs[result] = flight.waiters
+        else:
+            cleanup_tmp(result)
+
+
 async def fetch_bytes(
-    url: str, session: aiohttp.ClientSession = None, timeout: int = 15, max_retries: int = 3
+    url: str,
+    session: aiohttp.ClientSession = None,
+    timeout: int = 15,
+    max_retries: int = 3,
+    headers: Optional[dict] = None,
+    response_meta: Optional[dict] = None,
+    priority: Priority = Priority.INTERACTIVE,
 ) -> Union[bytes, str, None]:
     """
     Descarga el contenido de `url`. Si supera MAX_IN_MEMORY_BYTES escribe a fichero temporal.
     Retorna bytes o ruta al fichero temporal, o None en error.
     Incluye lógica de reintento para manejar problemas temporales como Cloudflare.
+
+    `headers` se envía tal cual (p.ej. If-None-Match). Si se pasa `response_meta`
+    se rellena con status, etag y last_modified de la respuesta; ante un 304
+    se devuelve b"" y el llamador decide qué hacer con su copia en caché.
+
+    Las llamadas concurrentes a la misma URL comparten una única descarga
+    (single-flight). Si el resultado es un fichero temporal, cada llamador
+    debe liberarlo con cleanup_tmp() como hasta ahora. Quien se une a una
+    descarga en curso comparte la sesión y el timeout de quien la empezó,
+    pero si trae más prioridad la descarga sube a la suya.
+
+    Las peticiones pasan por el limitador adaptativo del host
+    (utils/host_limiter.py) con la prioridad indicada: INTERACTIVE para lo
+    que el usuario espera, BULK para descargas de EPUB.
     """
-    retry_delays = [2, 5, 10]  # Delays in seconds for retries
+    key = (url, tuple(sorted((headers or {}).items())))
+    flight = _inflight.get(key)
+    if flight is None:
+        flight = _Flight(priority)
+        flight.task = asyncio.ensure_future(
+            _fetch_bytes_once(url, session, timeout, max_retries, headers, flight)
+        )
+        _inflight[key] = flight
+        flight.task.add_done_callback(lambda _t, k=key, f=flight: _finish_flight(k, f))
+        _fetch_stats["started"] += 1
+    else:
+        flight.promote(priority)
+        _fetch_stats["joined"] += 1
+        logger.debug("fetch_bytes: uniendo descarga en curso para %s", url)
+
+    flight.waiters += 1
+    try:
+        result = await asyncio.shield(flight.task)
+    except asyncio.CancelledError:
+        if flight.task.done() and not flight.task.cancelled():
+            # Ya teníamos una referencia asignada al fichero: liberarla
+            cleanup_tmp(flight.task.result())
+        else:
+            flight.waiters -= 1
+        raise
+
+    if response_meta is not None:
+        response_meta.update(flight.meta)
+    return result
+
+
+async def _fetch_bytes_once(
+    url: str,
+    session: Optional[aiohttp.ClientSession],
+    timeout: int,
+    max_retries: int,
+    headers: Optional[dict],
+    flight: _Flight,
+) -> Union[bytes, str, None]:
+    """Descarga real (con reintentos) usada por fetch_bytes."""
+    limiter = get_host_limiter(url)
+    response_meta = flight.meta
 
     for attempt in range(max_retries):
+        retry_after = None
         try:
             from core.session_manager import session_manager
             sess = session or session_manager.get_session()
             logger.debug(f"Iniciando descarga de URL OPDS (intento {attempt + 1}/{max_retries}): {url}")
-            async with sess.get(url, timeout=timeout) as resp:
+            # Cada intento pide plaza con la prioridad actual de la descarga
+            slot = flight.slot = limiter.slot(flight.priority)
+            async with slot, sess.get(url, timeout=timeout, headers=headers) as resp:
+                slot.response(resp.status)
                 # Log response status and headers for debugging
                 logger.debug(f"Response status: {resp.status}, headers: {dict(resp.headers)}")
 
+                response_meta["status"] = resp.status
+                response_meta["etag"] = resp.headers.get("ETag")
+                response_meta["last_modified"] = resp.headers.get("Last-Modified")
+
+                if resp.status == 304:
+                    logger.debug("fetch_bytes: 304 Not Modified para %s", url)
+                    return b""
+
                 # Check for Cloudflare errors
                 if resp.status == 403:
                     logger.warning(f"Cloudflare/403 error detected for URL: {url}")
                 elif resp.status == 503:
                     logger.warning(f"Service unavailable (503) for URL: {url}")
+                if resp.status in OVERLOAD_STATUSES:
+                    retry_after = resp.headers.get("Retry-After")
 
                 resp.raise_for_status()
 
@@ -115,10 +259,17 @@ async def fetch_bytes(
         except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.warning(f"Error fetch_bytes (intento {attempt + 1}/{max_retries}) para {url}: {e}")
 
+            status = getattr(e, "status", None)
+            if status and 400 <= status < 500 and status not in OVERLOAD_STATUSES:
+                # 404, 410...: reintentar no va a cambiar la respuesta
+                logger.error(f"Error fetch_bytes {status} para {url}: {e}")
+                return None
+
             # If this is not the last attempt, wait before retrying
             if attempt < max_retries - 1:
-                delay = retry_delays[attempt] if attempt < len(retry_delays) else retry_delays[-1]
-                logger.info(f"Reintentando en {delay} segundos...")
+                # Exponencial con jitter, o lo que pida el origen (Retry-After)
+                delay = backoff_delay(attempt, retry_after, base=2.0)
+                logger.info(f"Reintentando en {delay:.1f} segundos...")
                 await asyncio.sleep(delay)
             else:
                 logger.error(f"Error fetch_bytes después de {max_retries} intentos para {url}: {e}")
@@ -130,18 +281,59 @@ async def fetch_bytes(
     return None
 
 
+_feed_cache = None
+
+
+def _get_feed_cache():
+    """Devuelve la caché global de feeds, creándola según config."""
+    global _feed_cache
+    if _feed_cache is None:
+        from config.config_settings import config
+        from utils.feed_cache import FeedCache
+
+        _feed_cache = FeedCache(
+            ttl=config.FEED_CACHE_TTL, max_bytes=config.FEED_CACHE_MAX_BYTES
+        )
+    return _feed_cache
+
+
 async def parse_feed_from_url(url: str):
     """
     Descarga y parsea un feed OPDS con feedparser.
     Retorna objeto feedparser.FeedParserDict o None en error.
+
+    Los feeds se cachean por URL (ver utils/feed_cache.py): dentro del TTL se
+    devuelve el feed ya parseado sin tocar la red; pasado el TTL se revalida
+    con ETag/Last-Modified y un 304 reutiliza el feed existente.
     """
-    data = await fetch_bytes(url, timeout=20)
+    cache = _get_feed_cache()
+    if cache.enabled:
+        cached = cache.get_fresh(url)
+        if cached is not None:
+            logger.debug("parse_feed_from_url: cache hit para %s", url)
+            return cached
+
+    meta = {}
+    data = await fetch_bytes(
+        url,
+        timeout=20,
+        headers=cache.conditional_headers(url) if cache.enabled else None,
+        response_meta=meta,
+    )
+    if meta.get("status") == 304:
+        feed = cache.touch(url)
+        if feed is not None:
+            logger.debug("parse_feed_from_url: 304, reutilizando feed para %s", url)
+            return feed
+        # La entrada fue desalojada entre medias: pedir el feed completo
+        meta = {}
+        data = await fetch_bytes(url, timeout=20, response_meta=meta)
     if not data:
         logger.error("parse_feed_from_url: fetch_bytes devolvió None para %s", url)
         return None
     try:
         if isinstance(data, (bytes, bytearray)):
-            feed = await asyncio.to_thread(feedparser.parse, data)
+            content = data
         elif isinstance(data, str) and os.path.exists(data):
             try:
                 with open(data, "rb") as f:
@@ -151,12 +343,20 @@ async def parse_feed_from_url(url: str):
                     "parse_feed_from_url: error leyendo tmpfile %s: %s", data, e
                 )
                 return None
-            feed = await asyncio.to_thread(feedparser.parse, content)
         else:
-            feed = await asyncio.to_thread(feedparser.parse, data)
+            content = data
+        feed = await asyncio.to_thread(feedparser.parse, content)
         if getattr(feed, "bozo", False):
             logger.error("parse_feed_from_url: bozo flag true para %s", url)
             return None
+        if cache.enabled and isinstance(content, (bytes, bytearray)):
+            cache.put(
+                url,
+                feed,
+                len(content),
+                etag=meta.get("etag"),
+                last_modified=meta.get("last_modified"),
+            )
         return feed
     finally:
         cleanup_tmp(data)
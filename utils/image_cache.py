@@ -0,0 +1,379 @@
+"""
+Caché de portadas para el proxy de imágenes de la Mini App.
+
+Dos niveles: un LRU en memoria acotado por bytes y un directorio en disco
+(`<root>/<key[:2]>/<key>.img` + `<key>.json` con los metadatos) que
+sobrevive a reinicios. Las peticiones al origen usan el `httpx.AsyncClient`
+compartido de session_manager, pasan por el limitador por host con prioridad
+interactiva y se revalidan con ETag/Last-Modified cuando la copia supera el
+TTL. Hacia el navegador cada imagen lleva un ETag propio (hash del contenido)
+para poder contestar 304.
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+import httpx
+from config.config_settings import config
+
+logger = logging.getLogger(__name__)
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+
+# Variante que no mejora a la original: se guarda solo este marcador
+_USE_ORIGINAL = "application/x-use-original"
+
+
+@dataclass
+class CachedImage:
+    data: bytes
+    content_type: str
+    etag: str
+    fetched_at: float
+    upstream_etag: Optional[str] = None
+    upstream_last_modified: Optional[str] = None
+    # En miniaturas: ETag de la imagen original a partir de la que se generó
+    source_etag: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+def make_etag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+
+def cache_key(
+    url: str, params: Optional[Dict[str, str]] = None, variant: str = ""
+) -> str:
+    """Clave estable para una URL de origen (+ parámetros y variante)."""
+    raw = url
+    if params:
+        raw += "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+    if variant:
+        raw += "#" + variant
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ImageCache:
+    """LRU en memoria delante de un directorio en disco, ambos acotados por bytes."""
+
+    def __init__(
+        self,
+        root: str,
+        memory_bytes: int = 16 * 1024 * 1024,
+        disk_bytes: int = 256 * 1024 * 1024,
+        ttl: float = 86400,
+    ):
+        self.root = os.path.abspath(root)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl = ttl
+        self._mem: "OrderedDict[str, CachedImage]" = OrderedDict()
+        self._mem_size = 0
+        # key -> (bytes en disco, último acceso)
+        self._disk: Dict[str, list] = {}
+        self._disk_size = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def is_fresh(self, image: CachedImage, now: Optional[float] = None) -> bool:
+        return ((now or time.time()) - image.fetched_at) < self.ttl
+
+    # --- Disco ------------------------------------------------------------
+
+    def _paths(self, key: str):
+        base = os.path.join(self.root, key[:2], key)
+        return f"{base}.img", f"{base}.json"
+
+    def scan(self) -> None:
+        """Reconstruye el índice de disco (tamaños y mtime) al arrancar."""
+        with self._lock:
+            self._disk.clear()
+            self._disk_size = 0
+            os.makedirs(self.root, exist_ok=True)
+            for dirpath, _dirs, files in os.walk(self.root):
+                for name in files:
+                    full = os.path.join(dirpath, name)
+                    if name.endswith(".part"):
+                        self._unlink(full)
+                        continue
+                    if not name.endswith(".img"):
+                        continue
+                    try:
+                        st = os.stat(full)
+                    except OSError:
+                        continue
+                    key = name[: -len(".img")]
+                    self._disk[key] = [st.st_size, st.st_mtime]
+                    self._disk_size += st.st_size
+            self._evict_disk()
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def _write_atomic(self, path: str, payload: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except Exception:
+            self._unlink(tmp)
+            raise
+
+    def load(self, key: str) -> Optional[CachedImage]:
+        """Carga desde disco (bloqueante) y promociona a memoria."""
+        img_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            with open(img_path, "rb") as f:
+                data = f.read()
+            image = CachedImage(data=data, **meta)
+        except (OSError, ValueError, TypeError):
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk[key][1] = time.time()
+            self._remember(key, image)
+        return image
+
+    def _evict_disk(self) -> None:
+        if self._disk_size <= self.disk_bytes:
+            return
+        for key, (size, _atime) in sorted(self._disk.items(), key=lambda kv: kv[1][1]):
+            if self._disk_size <= self.disk_bytes:
+                break
+            for path in self._paths(key):
+                self._unlink(path)
+            self._disk.pop(key, None)
+            self._disk_size -= size
+
+    # --- Memoria ----------------------------------------------------------
+
+    def get_memory(self, key: str) -> Optional[CachedImage]:
+        with self._lock:
+            image = self._mem.get(key)
+            if image is not None:
+                self._mem.move_to_end(key)
+            return image
+
+    def _remember(self, key: str, image: CachedImage) -> None:
+        if image.size > self.memory_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_size -= old.size
+        self._mem[key] = image
+        self._mem_size += image.size
+        while self._mem_size > self.memory_bytes and self._mem:
+            _, dropped = self._mem.popitem(last=False)
+            self._mem_size -= dropped.size
+
+    # --- API --------------------------------------------------------------
+
+    def put(self, key: str, image: CachedImage) -> None:
+        """Guarda en memoria y en disco (bloqueante: llamar desde un hilo)."""
+        with self._lock:
+            self._remember(key, image)
+        if self.disk_bytes <= 0 or image.size > self.disk_bytes:
+            return
+        img_path, meta_path = self._paths(key)
+        meta = asdict(image)
+        meta.pop("data")
+        try:
+            os.makedirs(os.path.dirname(img_path), exist_ok=True)
+            self._write_atomic(img_path, image.data)
+            self._write_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+        except OSError as e:
+            logger.debug("ImageCache: no se pudo guardar %s: %s", key, e)
+            return
+        with self._lock:
+            previous = self._disk.get(key)
+            if previous:
+                self._disk_size -= previous[0]
+            self._disk[key] = [image.size, time.time()]
+            self._disk_size += image.size
+            self._evict_disk()
+
+    def touch(self, key: str, image: CachedImage) -> None:
+        """Renueva el TTL tras un 304 del origen."""
+        image.fetched_at = time.time()
+        self.revalidated += 1
+        self.put(key, image)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_entries": len(self._mem),
+            "memory_bytes": self._mem_size,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+        }
+
+
+_cache: Optional[ImageCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """
+    Devuelve la caché global, creándola y escaneando el disco en el primer uso.
+    El escaneo recorre el disco: desde código async usar open_image_cache().
+    """
+    global _cache
+    if _cache is not None:
+        return _cache
+    with _cache_lock:
+        if _cache is not None:
+            return _cache
+        root = config.IMAGE_CACHE_DIR
+        if not os.path.isabs(root):
+            root = os.path.join(_ROOT_DIR, root)
+        cache = ImageCache(
+            root,
+            memory_bytes=config.IMAGE_CACHE_MEMORY_BYTES,
+            disk_bytes=config.IMAGE_CACHE_MAX_BYTES,
+            ttl=config.IMAGE_CACHE_TTL,
+        )
+        if cache.disk_bytes > 0:
+            try:
+                cache.scan()
+            except Exception as e:
+                logger.error("ImageCache: error escaneando %s: %s", root, e)
+        _cache = cache
+    return _cache
+
+
+async def open_image_cache() -> ImageCache:
+    """get_image_cache sin bloquear el event loop (el escaneo va en un hilo)."""
+    if _cache is not None:
+        return _cache
+    return await asyncio.to_thread(get_image_cache)
+
+
+async def fetch_image(
+    url: str, params: Optional[Dict[str, str]] = None, size: Optional[int] = None
+) -> Optional[CachedImage]:
+    """
+    Devuelve la imagen desde la caché o el origen. Una copia fresca no toca la
+    red; una caducada se revalida con If-None-Match/If-Modified-Since y, si el
+    origen falla, se sirve la copia antigua. Con `size` se devuelve la variante
+    de ese ancho (o la original si no se puede generar). Retorna None si no hay
+    imagen.
+    """
+    original = await _fetch_original(url, params)
+    if original is None or not size:
+        return original
+    return await _get_variant(url, params, size, original)
+
+
+async def _get_variant(
+    url: str, params: Optional[Dict[str, str]], size: int, original: CachedImage
+) -> CachedImage:
+    from utils.thumbnails import render_thumbnail
+
+    cache = await open_image_cache()
+    # Solo (url, ancho): los parámetros del cliente no multiplican las variantes;
+    # source_etag detecta que la original ha cambiado
+    key = cache_key(url, variant=f"w{size}")
+    variant = cache.get_memory(key)
+    if variant is None and cache.disk_bytes > 0:
+        variant = await asyncio.to_thread(cache.load, key)
+    if variant is not None and variant.source_etag == original.etag:
+        if variant.content_type == _USE_ORIGINAL:
+            return original
+        return variant
+
+    data = await render_thumbnail(original.data, size)
+    if data:
+        variant = CachedImage(
+            data=data,
+            content_type="image/jpeg",
+            etag=make_etag(data),
+            fetched_at=original.fetched_at,
+            source_etag=original.etag,
+        )
+    else:
+        # Imagen ya pequeña o formato no soportado: recordar que la variante es
+        # la original para no volver a decodificarla en cada petición
+        variant = CachedImage(
+            data=b"",
+            content_type=_USE_ORIGINAL,
+            etag=original.etag,
+            fetched_at=original.fetched_at,
+            source_etag=original.etag,
+        )
+    await asyncio.to_thread(cache.put, key, variant)
+    return variant if data else original
+
+
+async def _fetch_original(
+    url: str, params: Optional[Dict[str, str]] = None
+) -> Optional[CachedImage]:
+    cache = await open_image_cache()
+    key = cache_key(url, params)
+    cached = cache.get_memory(key)
+    if cached is None and cache.disk_bytes > 0:
+        cached = await asyncio.to_thread(cache.load, key)
+    if cached is not None and cache.is_fresh(cached):
+        cache.hits += 1
+        return cached
+    cache.misses += 1
+
+    headers = {}
+    if cached is not None:
+        if cached.upstream_etag:
+            headers["If-None-Match"] = cached.upstream_etag
+        if cached.upstream_last_modified:
+            headers["If-Modified-Since"] = cached.upstream_last_modified
+
+    from core.session_manager import session_manager
+    from utils.host_limiter import Priority, get_host_limiter
+
+    client = session_manager.get_http_client()
+    try:
+        # El usuario está esperando la portada: cola interactiva del host
+        async with get_host_limiter(url).slot(Priority.INTERACTIVE) as slot:
+            resp = await client.get(url, params=params, headers=headers)
+            slot.response(resp.status_code)
+    except httpx.HTTPError as e:
+        logger.warning("fetch_image: error contactando %s: %s", url, e)
+        return cached
+
+    if resp.status_code == 304 and cached is not None:
+        await asyncio.to_thread(cache.touch, key, cached)
+        return cached
+    if resp.status_code >= 400:
+        logger.debug("fetch_image: %s devolvió %s", url, resp.status_code)
+        return cached
+
+    data = resp.content
+    image = CachedImage(
+        data=data,
+        content_type=resp.headers.get("content-type", "image/jpeg"),
+        etag=make_etag(data),
+        fetched_at=time.time(),
+        upstream_etag=resp.headers.get("etag"),
+        upstream_last_modified=resp.headers.get("last-modified"),
+    )
+    await asyncio.to_thread(cache.put, key, image)
+    return image
@@ -1,6 +1,7 @@
 import time
+import threading
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, Hashable, Optional, Tuple, Union
 from dataclasses import dataclass
 
 
@@ -10,66 +11,262 @@ class RateLimitType(Enum):
     SEARCH = "search"
 
 
+LimitKey = Union[RateLimitType, str]
+
+
 @dataclass
 class RateLimit:
+    """
+    Token bucket: admite ráfagas de hasta `max_requests` y se rellena a razón
+    de max_requests / window_seconds tokens por segundo. Memoria y coste O(1)
+    por usuario, sin listas de marcas de tiempo.
+    """
+
     max_requests: int
-    window_seconds: int
-    requests: List[float]
+    window_seconds: float
+    tokens: float = -1.0
+    updated: float = 0.0
+
+    def __post_init__(self):
+        if self.tokens < 0:
+            self.tokens = float(self.max_requests)
+
+    @property
+    def rate(self) -> float:
+        return self.max_requests / self.window_seconds if self.window_seconds else 0.0
+
+    def refill(self, now: float) -> None:
+        if self.updated and now > self.updated:
+            self.tokens = min(
+                float(self.max_requests),
+                self.tokens + (now - self.updated) * self.rate,
+            )
+        self.updated = now
+
+    def retry_after(self) -> float:
+        """Segundos hasta que haya un token (tras `refill`)."""
+        if self.tokens >= 1 or not self.rate:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_idle(self, now: float) -> bool:
+        # Un bucket que ya estaría lleno equivale a no tener bucket
+        return self.tokens + (now - self.updated) * self.rate >= self.max_requests
+
+
+def _normalize(limit_type: LimitKey) -> LimitKey:
+    if isinstance(limit_type, str):
+        try:
+            return RateLimitType(limit_type)
+        except ValueError:
+            return limit_type
+    return limit_type
 
 
 class RateLimitManager:
-    def __init__(self):
-        self.limits: Dict[int, Dict[RateLimitType, RateLimit]] = {}
+    """
+    Límites por usuario y límites globales compartidos (por ruta, por chat...).
+
+    Los límites por defecto (`set_default_limit`) se aplican a cualquier
+    usuario sin límite propio. Los buckets que vuelven a estar llenos se
+    liberan en un barrido cada `sweep_interval` segundos, así que la memoria
+    depende de los usuarios activos y no de todos los que pasaron.
+    """
+
+    def __init__(self, sweep_interval: float = 300):
+        self.limits: Dict[int, Dict[LimitKey, RateLimit]] = {}
+        self.global_limits: Dict[Hashable, RateLimit] = {}
+        self.defaults: Dict[LimitKey, Tuple[int, float]] = {}
+        # Límites configurados explícitamente con add_limit: no se liberan
+        self._pinned: Dict[int, set] = {}
+        self._pinned_global: set = set()
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
 
     def _ensure_user(self, user_id: int):
         if user_id not in self.limits:
             self.limits[user_id] = {}
 
-    def _cleanup_old_requests(self, rate_limit: RateLimit):
-        now = time.time()
-        rate_limit.requests = [
-            req_time
-            for req_time in rate_limit.requests
-            if now - req_time < rate_limit.window_seconds
-        ]
+    def _bucket(self, user_id: int, limit_type: LimitKey) -> Optional[RateLimit]:
+        limit_type = _normalize(limit_type)
+        user_limits = self.limits.get(user_id)
+        bucket = user_limits.get(limit_type) if user_limits else None
+        if bucket is None and limit_type in self.defaults:
+            max_requests, window_seconds = self.defaults[limit_type]
+            bucket = RateLimit(max_requests, window_seconds)
+            self._ensure_user(user_id)
+            self.limits[user_id][limit_type] = bucket
+        return bucket
+
+    def _maybe_sweep(self, now: float) -> None:
+        if now - self._last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Libera los buckets llenos (usuarios inactivos). Devuelve cuántos."""
+        now = time.monotonic() if now is None else now
+        freed = 0
+        with self._lock:
+            self._last_sweep = now
+            for user_id in list(self.limits):
+                pinned = self._pinned.get(user_id, ())
+                user_limits = self.limits[user_id]
+                for key in [
+                    k
+                    for k, b in user_limits.items()
+                    if k not in pinned and b.is_idle(now)
+                ]:
+                    del user_limits[key]
+                    freed += 1
+                if not user_limits:
+                    del self.limits[user_id]
+            for key in [
+                k
+                for k, b in self.global_limits.items()
+                if k not in self._pinned_global and b.is_idle(now)
+            ]:
+                del self.global_limits[key]
+                freed += 1
+        return freed
 
     def add_limit(
         self,
         user_id: int,
-        limit_type: RateLimitType,
+        limit_type: LimitKey,
         max_requests: int,
-        window_seconds: int,
+        window_seconds: float,
     ):
+        limit_type = _normalize(limit_type)
         self._ensure_user(user_id)
         self.limits[user_id][limit_type] = RateLimit(
-            max_requests=max_requests, window_seconds=window_seconds, requests=[]
+            max_requests=max_requests, window_seconds=window_seconds
         )
+        self._pinned.setdefault(user_id, set()).add(limit_type)
 
-    def is_allowed(self, user_id: int, limit_type: RateLimitType) -> bool:
-        self._ensure_user(user_id)
-        if limit_type not in self.limits[user_id]:
-            return True
-        rate_limit = self.limits[user_id][limit_type]
-        self._cleanup_old_requests(rate_limit)
-        return len(rate_limit.requests) < rate_limit.max_requests
+    def set_default_limit(
+        self,
+        limit_type: Hashable,
+        max_requests: int,
+        window_seconds: float,
+        exclusive: bool = False,
+    ):
+        """
+        Límite que reciben los usuarios sin uno propio. Con exclusive=True
+        falla si `limit_type` ya tenía otro límite distinto, en vez de
+        sustituirlo (los buckets existentes se crearon con el anterior).
+        """
+        limit_type = _normalize(limit_type)
+        current = self.defaults.get(limit_type)
+        if exclusive and current not in (None, (max_requests, window_seconds)):
+            raise ValueError(
+                f"Límite '{limit_type}' ya definido como {current[0]} "
+                f"cada {current[1]}s"
+            )
+        self.defaults[limit_type] = (max_requests, window_seconds)
 
-    def record_request(self, user_id: int, limit_type: RateLimitType):
-        self._ensure_user(user_id)
-        if limit_type not in self.limits[user_id]:
-            return
-        rate_limit = self.limits[user_id][limit_type]
-        rate_limit.requests.append(time.time())
+    def add_global_limit(
+        self,
+        key: Hashable,
+        max_requests: int,
+        window_seconds: float,
+        pinned: bool = True,
+    ):
+        """
+        Límite compartido por todos los usuarios (p. ej. "route:search" o
+        ("chat", chat_id)). Con pinned=False el bucket se libera cuando queda
+        inactivo y se vuelve a crear en la siguiente llamada.
+        """
+        with self._lock:
+            if key not in self.global_limits:
+                self.global_limits[key] = RateLimit(max_requests, window_seconds)
+            if pinned:
+                self._pinned_global.add(key)
 
-    def get_remaining(self, user_id: int, limit_type: RateLimitType) -> int:
-        self._ensure_user(user_id)
-        if limit_type not in self.limits[user_id]:
-            return float("inf")
-        rate_limit = self.limits[user_id][limit_type]
-        self._cleanup_old_requests(rate_limit)
-        return max(0, rate_limit.max_requests - len(rate_limit.requests))
+    def is_allowed(self, user_id: int, limit_type: LimitKey) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(user_id, limit_type)
+            if bucket is None:
+                return True
+            bucket.refill(now)
+            return bucket.tokens >= 1
+
+    def record_request(self, user_id: int, limit_type: LimitKey):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(user_id, limit_type)
+            if bucket is None:
+                return
+            bucket.refill(now)
+            bucket.tokens = max(0.0, bucket.tokens - 1)
+        self._maybe_sweep(now)
+
+    def acquire(
+        self, user_id: int, limit_type: LimitKey, *global_keys: Hashable
+    ) -> float:
+        """
+        Comprueba y consume en un paso el límite del usuario y los globales
+        indicados. Devuelve 0 si se permite o los segundos que hay que esperar.
+        """
+        return self._acquire(user_id, limit_type, global_keys)
+
+    def acquire_global(self, *global_keys: Hashable) -> float:
+        """Como `acquire`, solo con límites globales (p. ej. por origen)."""
+        return self._acquire(None, None, global_keys)
+
+    def _acquire(
+        self,
+        user_id: Optional[int],
+        limit_type: Optional[LimitKey],
+        global_keys: Tuple[Hashable, ...],
+    ) -> float:
+        now = time.monotonic()
+        with self._lock:
+            buckets = [] if user_id is None else [self._bucket(user_id, limit_type)]
+            buckets += [self.global_limits.get(key) for key in global_keys]
+            buckets = [b for b in buckets if b is not None]
+            wait = 0.0
+            for bucket in buckets:
+                bucket.refill(now)
+                wait = max(wait, bucket.retry_after())
+            if wait == 0.0:
+                for bucket in buckets:
+                    bucket.tokens -= 1
+        self._maybe_sweep(now)
+        return wait
+
+    def get_remaining(self, user_id: int, limit_type: LimitKey) -> int:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(user_id, limit_type)
+            if bucket is None:
+                return float("inf")
+            bucket.refill(now)
+            return int(bucket.tokens)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self.limits),
+            "buckets": sum(len(v) for v in self.limits.values()),
+            "global": len(self.global_limits),
+        }
 
 
 def create_rate_limit_manager_from_config(config):
     manager = RateLimitManager()
     # Inicializar límites basados en config si es necesario
     return manager
+
+
+_manager: Optional[RateLimitManager] = None
+
+
+def get_rate_limit_manager() -> RateLimitManager:
+    """Gestor compartido que usa el decorador `rate_limit`."""
+    global _manager
+    if _manager is None:
+        from config.config_settings import config
+
+        _manager = create_rate_limit_manager_from_config(config)
+    return _manager
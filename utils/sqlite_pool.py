@@ -0,0 +1,286 @@
+"""
+Pool de conexiones SQLite compartido por url_cache, settings y users.
+
+Abrir una conexión por consulta obliga a repetir los PRAGMA y a tirar la
+caché de sentencias preparadas de sqlite3. Aquí cada fichero de base de
+datos tiene un escritor (serializado con un lock, igual que hace SQLite) y
+varios lectores que se configuran una sola vez y se reutilizan:
+
+    with get_pool(DB_PATH).read() as conn:
+        conn.execute("SELECT ...")
+
+    with get_pool(DB_PATH).write() as conn:   # commit al salir, rollback si falla
+        conn.execute("UPDATE ...")
+"""
+
+import os
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional
+from config.config_settings import config
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePool:
+    """Un escritor y hasta `readers` lectores para un fichero SQLite."""
+
+    def __init__(
+        self,
+        path: str,
+        readers: int = 4,
+        timeout: float = 30,
+        cached_statements: int = 256,
+    ):
+        self.path = path
+        self.readers = max(1, readers)
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        self._created = 0
+        self._writer: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.RLock()
+        self._lock = threading.Lock()
+        # Conexiones prestadas y pausas en curso (ver paused())
+        self._gate = threading.Condition()
+        self._checked_out = 0
+        self._paused = 0
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA foreign_keys=ON;")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)};")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON;")
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def _check_fork(self) -> None:
+        # Las conexiones no sobreviven a un fork: empezar de cero en el hijo
+        if self._pid != os.getpid():
+            with self._lock:
+                self._pid = os.getpid()
+                self._idle = queue.LifoQueue()
+                self._all = []
+                self._created = 0
+                self._writer = None
+                self._write_lock = threading.RLock()
+                self._gate = threading.Condition()
+                self._checked_out = 0
+                self._paused = 0
+                self._local = threading.local()
+
+    def _enter(self) -> None:
+        # Un hilo que ya tiene una conexión no espera: pause() lo está esperando
+        depth = getattr(self._local, "depth", 0)
+        with self._gate:
+            if depth == 0:
+                while self._paused:
+                    self._gate.wait()
+            self._checked_out += 1
+        self._local.depth = depth + 1
+
+    def _leave(self) -> None:
+        self._local.depth -= 1
+        with self._gate:
+            self._checked_out -= 1
+            if not self._checked_out:
+                self._gate.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Conexión de solo lectura (en autocommit: ve lo último confirmado)."""
+        self._check_fork()
+        self._enter()
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._leave()
+
+    def _checkout(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.readers:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if not create:
+            return self._idle.get(timeout=self.timeout)
+        try:
+            return self._connect(readonly=True)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Conexión de escritura exclusiva: commit al salir, rollback si hay error."""
+        self._check_fork()
+        self._enter()
+        try:
+            with self._write_lock:
+                if self._writer is None:
+                    self._writer = self._connect()
+                conn = self._writer
+                try:
+                    yield conn
+                except BaseException:
+                    conn.rollback()
+                    raise
+                else:
+                    conn.commit()
+        finally:
+            self._leave()
+
+    @contextmanager
+    def paused(self) -> Iterator[None]:
+        """
+        Cierra el pool sin cortar consultas en curso: bloquea los préstamos
+        nuevos, espera (hasta `timeout` segundos) a que vuelvan las conexiones
+        prestadas y las cierra todas. Dentro del bloque nadie puede abrir el
+        fichero a través del pool; al salir se vuelven a abrir bajo demanda.
+        """
+        self._check_fork()
+        if getattr(self._local, "depth", 0):
+            raise RuntimeError("SQLitePool.paused() con una conexión del pool en uso")
+        with self._gate:
+            self._paused += 1
+            try:
+                drained = self._gate.wait_for(
+                    lambda: not self._checked_out, timeout=self.timeout
+                )
+            finally:
+                if not drained:
+                    self._paused -= 1
+                    self._gate.notify_all()
+        if not drained:
+            raise TimeoutError(f"SQLite: conexiones de {self.path} sin devolver")
+        try:
+            self._close_connections()
+            yield
+        finally:
+            with self._gate:
+                self._paused -= 1
+                self._gate.notify_all()
+
+    def close(self) -> None:
+        """Cierra las conexiones después de esperar a las que están en uso."""
+        with self.paused():
+            pass
+
+    def _close_connections(self) -> None:
+        with self._write_lock, self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._all = []
+            self._idle = queue.LifoQueue()
+            self._created = 0
+            self._writer = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "readers": self._created,
+            "idle_readers": self._idle.qsize(),
+            "writer": int(self._writer is not None),
+        }
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str) -> SQLitePool:
+    """Pool compartido para el fichero `path` (uno por ruta absoluta)."""
+    key = os.path.abspath(path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = SQLitePool(
+                    key,
+                    readers=config.SQLITE_POOL_READERS,
+                    cached_statements=config.SQLITE_STATEMENT_CACHE,
+                )
+                _pools[key] = pool
+    return pool
+
+
+def close_all_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            try:
+                pool.close()
+            except Exception as e:
+                logger.warning("SQLite: no se pudo cerrar %s: %s", pool.path, e)
+        _pools.clear()
+
+
+def backup_database(path: str, dest: str) -> None:
+    """
+    Copia consistente de `path` en `dest` con la API de backup de SQLite
+    (incluye lo que aún esté en el -wal, que una copia del fichero perdería).
+    """
+    src = sqlite3.connect(path)
+    try:
+        out = sqlite3.connect(dest)
+        try:
+            src.backup(out)
+        finally:
+            out.close()
+    finally:
+        src.close()
+
+
+def replace_database(path: str, new_file: str) -> None:
+    """
+    Sustituye el fichero SQLite `path` por `new_file` (p. ej. al restaurar
+    un backup). Con conexiones WAL abiertas sobrescribirlo en su sitio deja
+    lectores con páginas antiguas y el -wal viejo puede reaplicarse sobre la
+    base nueva; aquí se pausa el pool del fichero (las consultas en curso
+    terminan, las nuevas esperan), se mueve el fichero con os.replace y se
+    borran el -wal/-shm antiguos. Al terminar el pool abre conexiones a la
+    base nueva. Operación bloqueante; si alguna conexión no vuelve a tiempo
+    lanza TimeoutError sin tocar el fichero.
+    """
+    key = os.path.abspath(path)
+    # Con el lock tomado nadie crea un pool nuevo para esta ruta a medias
+    with _pools_lock:
+        pool = _pools.get(key)
+        with pool.paused() if pool else nullcontext():
+            os.replace(new_file, key)
+            for suffix in ("-wal", "-shm"):
+                try:
+                    os.unlink(key + suffix)
+                except FileNotFoundError:
+                    pass
+    logger.info("SQLite: base de datos %s reemplazada", key)
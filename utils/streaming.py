@@ -0,0 +1,333 @@
+"""
+Utilidades para servir descargas en streaming con soporte de HTTP Range.
+
+- `parse_range`: interpreta una cabecera `Range: bytes=...` (un solo rango).
+- `iter_file`: lee un fichero local por trozos entre dos offsets.
+- `open_upstream` / `iter_upstream`: abren la descarga en el origen (con una
+  plaza del limitador del host) y reenvían los trozos según llegan,
+  opcionalmente copiándolos a un fichero `.part` que se entrega al almacén
+  de EPUBs al terminar.
+- `UpstreamFlight`: la copia al almacén en curso de una URL; el resto de
+  peticiones de esa URL leen el `.part` según crece en lugar de descargarla
+  otra vez.
+"""
+
+import os
+import asyncio
+import logging
+import tempfile
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+import aiohttp
+from utils.host_limiter import Priority, get_host_limiter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Si la respuesta en streaming no empieza a iterarse en este tiempo (el
+# cliente se fue antes), la descarga compartida se da por abandonada
+FLIGHT_START_GRACE = 30.0
+
+# Cabeceras del origen que se reenvían tal cual al cliente
+PASSTHROUGH_HEADERS = (
+    "Content-Length",
+    "Content-Range",
+    "Accept-Ranges",
+    "ETag",
+    "Last-Modified",
+)
+
+
+class RangeNotSatisfiable(ValueError):
+    """El rango pedido queda fuera del fichero (HTTP 416)."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Convierte `bytes=start-end` en offsets inclusivos (start, end).
+    Retorna None si no hay cabecera o no es interpretable (se sirve completo);
+    lanza RangeNotSatisfiable si el rango no cabe en `size`.
+    Solo se admite un rango: las peticiones multi-rango se sirven completas.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    spec = header[len("bytes=") :].strip()
+    start_s, sep, end_s = spec.partition("-")
+    if not sep:
+        return None
+    try:
+        if start_s == "":
+            # Sufijo: los últimos N bytes
+            length = int(end_s)
+            if length <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(size - length, 0), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+async def iter_file(
+    path: str,
+    start: int = 0,
+    end: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """Itera el fichero entre `start` y `end` (inclusivo) sin cargarlo entero."""
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            n = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await asyncio.to_thread(f.read, n)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+class UpstreamFlight:
+    """
+    Descarga completa de `url` hacia el almacén, compartida por URL.
+
+    Quien la abre copia los trozos a un `.part` (`begin`/`advance`); el resto
+    de peticiones de la URL leen ese fichero según crece (`join` + `tail`)
+    en vez de abrir otra descarga al origen o esperar a que termine.
+    """
+
+    _flights: Dict[str, "UpstreamFlight"] = {}
+
+    def __init__(self, url: str):
+        loop = asyncio.get_running_loop()
+        self.url = url
+        self.future: "asyncio.Future[Optional[str]]" = loop.create_future()
+        self.started = False
+        # Cabeceras de la respuesta del origen que reciben también los demás
+        self.headers: Dict[str, str] = {}
+        self.part_path: Optional[str] = None
+        self.written = 0
+        self.complete = False
+        self._changed = asyncio.Event()
+        self._timer = loop.call_later(FLIGHT_START_GRACE, self._expire)
+        self._flights[url] = self
+
+    @classmethod
+    def get(cls, url: str) -> Optional["UpstreamFlight"]:
+        return cls._flights.get(url)
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _expire(self) -> None:
+        if not self.started:
+            self.finish(None)
+
+    def begin(self, part_path: str) -> None:
+        """La descarga empieza a copiarse en `part_path`."""
+        self.started = True
+        self.part_path = part_path
+        self._notify()
+
+    def advance(self, n: int) -> None:
+        """`n` bytes más escritos en el `.part`."""
+        self.written += n
+        self._notify()
+
+    def mark_complete(self) -> None:
+        """El `.part` contiene la respuesta entera."""
+        self.complete = True
+        self._notify()
+
+    def finish(self, path: Optional[str]) -> None:
+        """Publica la ruta del objeto almacenado (o None si no se completó)."""
+        self._timer.cancel()
+        if self._flights.get(self.url) is self:
+            del self._flights[self.url]
+        if not self.future.done():
+            self.future.set_result(path)
+        self._notify()
+
+    async def wait(self) -> Optional[str]:
+        return await asyncio.shield(self.future)
+
+    async def join(self):
+        """
+        Abre el `.part` para leerlo mientras crece. Espera a que la descarga
+        empiece (como mucho FLIGHT_START_GRACE); devuelve None si no llegó a
+        empezar o ya no se puede seguir (usar entonces `wait` o el origen).
+        """
+        while not self.started and not self.future.done():
+            await self._changed.wait()
+        if self.future.done() or self.part_path is None:
+            return None
+        try:
+            return await asyncio.to_thread(open, self.part_path, "rb")
+        except OSError:
+            return None
+
+    async def tail(self, f, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """
+        Itera el `.part` abierto con `join` hasta el final de la descarga.
+        Si la descarga se corta, lanza ConnectionError (el cliente recibe una
+        respuesta truncada, como si el origen se hubiera cortado).
+        """
+        pos = 0
+        try:
+            while True:
+                if pos < self.written:
+                    n = min(chunk_size, self.written - pos)
+                    chunk = await asyncio.to_thread(f.read, n)
+                    if not chunk:
+                        raise ConnectionError(f"{self.url}: copia local truncada")
+                    pos += len(chunk)
+                    yield chunk
+                elif self.complete:
+                    return
+                elif self.future.done():
+                    raise ConnectionError(f"{self.url}: descarga interrumpida")
+                else:
+                    await self._changed.wait()
+        finally:
+            f.close()
+
+
+class Upstream:
+    """Respuesta del origen junto con su plaza en el limitador del host."""
+
+    def __init__(self, resp: aiohttp.ClientResponse, slot):
+        self._resp = resp
+        self._slot = slot
+
+    def __getattr__(self, name):
+        return getattr(self._resp, name)
+
+    def release(self) -> None:
+        # Idempotente: la llaman iter_upstream y la respuesta HTTP al cerrarse
+        self._resp.release()
+        self._slot.release()
+
+
+async def open_upstream(
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    session: Optional[aiohttp.ClientSession] = None,
+    connect_timeout: int = 15,
+    read_timeout: int = 60,
+    priority: Priority = Priority.BULK,
+) -> Upstream:
+    """
+    Abre la petición al origen y devuelve la respuesta sin leer el cuerpo.
+    Ocupa una plaza del limitador adaptativo del host, como fetch_bytes,
+    hasta que se libera la respuesta; el llamador es responsable de
+    liberarla (`iter_upstream` lo hace al terminar).
+    """
+    from core.session_manager import session_manager
+
+    sess = session or session_manager.get_session()
+    slot = get_host_limiter(url).slot(priority)
+    await slot.__aenter__()
+    try:
+        resp = await sess.get(
+            url,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(
+                total=None, sock_connect=connect_timeout, sock_read=read_timeout
+            ),
+        )
+    except BaseException as e:
+        slot.release(failed=not isinstance(e, asyncio.CancelledError))
+        raise
+    slot.response(resp.status)
+    return Upstream(resp, slot)
+
+
+def _write_through(f, chunk: bytes) -> None:
+    # Vaciar el buffer: quien lee el .part en paralelo debe ver el trozo
+    f.write(chunk)
+    f.flush()
+
+
+async def iter_upstream(
+    resp: aiohttp.ClientResponse,
+    chunk_size: int = CHUNK_SIZE,
+    tee_dir: Optional[str] = None,
+    on_complete: Optional[Callable[[str], Awaitable[Optional[str]]]] = None,
+    flight: Optional[UpstreamFlight] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Reenvía el cuerpo de `resp` por trozos según llegan.
+
+    Si se indica `tee_dir`, los trozos se copian también a un fichero `.part`
+    en ese directorio (escrito desde un hilo); cuando la descarga se completa
+    entera se llama a `on_complete(ruta)` (corrutina) y después se borra el
+    fichero. Si el cliente corta antes, la copia parcial se descarta. Con
+    `flight`, el avance del `.part` se publica para que otras peticiones lo
+    lean mientras crece, y lo que devuelva `on_complete` para quien espere
+    al objeto almacenado.
+    """
+    tee = None
+    tee_path = None
+    if tee_dir:
+        try:
+            os.makedirs(tee_dir, exist_ok=True)
+            fd, tee_path = tempfile.mkstemp(dir=tee_dir, suffix=".part")
+            tee = os.fdopen(fd, "wb")
+        except OSError as e:
+            logger.debug("iter_upstream: sin copia local (%s)", e)
+            tee = tee_path = None
+    if flight is not None:
+        if tee is not None:
+            flight.begin(tee_path)
+        else:
+            # Sin copia que compartir: los demás van al origen
+            flight.finish(None)
+            flight = None
+
+    complete = False
+    received = 0
+    try:
+        async for chunk in resp.content.iter_chunked(chunk_size):
+            received += len(chunk)
+            if tee is not None:
+                try:
+                    await asyncio.to_thread(_write_through, tee, chunk)
+                    if flight is not None:
+                        flight.advance(len(chunk))
+                except OSError as e:
+                    logger.debug("iter_upstream: copia local abortada (%s)", e)
+                    tee.close()
+                    tee = None
+                    if flight is not None:
+                        flight.finish(None)
+            yield chunk
+        # Con Content-Encoding aiohttp descomprime y la longitud no es comparable
+        expected = None if "Content-Encoding" in resp.headers else resp.content_length
+        complete = expected is None or received == expected
+        if complete and tee is not None and flight is not None:
+            flight.mark_complete()
+    finally:
+        resp.release()
+        stored = None
+        if tee is not None:
+            tee.close()
+            if complete and on_complete:
+                try:
+                    stored = await on_complete(tee_path)
+                except Exception as e:
+                    logger.debug("iter_upstream: on_complete falló: %s", e)
+        if tee_path:
+            try:
+                os.unlink(tee_path)
+            except OSError:
+                pass
+        if flight is not None:
+            flight.finish(stored)
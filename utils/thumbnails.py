@@ -0,0 +1,80 @@
+"""
+Generación de miniaturas de portadas (variantes redimensionadas y recomprimidas).
+
+El redimensionado se hace con Pillow (dependencia de requirements.txt) en un
+pool de hilos propio para no bloquear el event loop. Lo usan las variantes
+`?size=` de /api/image y las portadas que se suben a Telegram.
+"""
+
+import io
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+from PIL import Image
+from config.config_settings import config
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def allowed_sizes() -> Set[int]:
+    """Anchos permitidos para `?size=` (THUMBNAIL_SIZES, separados por comas)."""
+    return {
+        int(x.strip())
+        for x in str(config.THUMBNAIL_SIZES).split(",")
+        if x.strip().isdigit()
+    }
+
+
+def make_thumbnail(data: bytes, width: int, quality: int = 80) -> Optional[bytes]:
+    """
+    Redimensiona la imagen a `width` píxeles de ancho (manteniendo proporción)
+    y la recodifica como JPEG. Retorna None si la imagen no se puede
+    decodificar, ya es estrecha o el resultado no es más pequeño que el original.
+    Operación bloqueante.
+    """
+    if not data:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.width <= width:
+                return None
+            height = max(1, round(img.height * width / img.width))
+            img = img.convert("RGB")
+            img.thumbnail((width, height), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(
+                out, format="JPEG", quality=quality, optimize=True, progressive=True
+            )
+    except Exception as e:
+        logger.debug("make_thumbnail: no se pudo redimensionar: %s", e)
+        return None
+    result = out.getvalue()
+    return result if len(result) < len(data) else None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=max(1, config.THUMBNAIL_WORKERS),
+            thread_name_prefix="thumbnails",
+        )
+    return _executor
+
+
+async def render_thumbnail(data: bytes, width: int) -> Optional[bytes]:
+    """Versión asíncrona de make_thumbnail que usa el pool de miniaturas."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), make_thumbnail, data, width, config.THUMBNAIL_QUALITY
+    )
+
+
+def shutdown_thumbnail_pool() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -5,25 +5,21 @@ Sistema de caché persistente para URLs acortadas usando SQLite.
 import sqlite3
 import hashlib
 import os
+import math
 import time
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
 import logging
 from config.config_settings import config
+from utils.sqlite_pool import get_pool
+from utils.database import get_engine, ensure_tables, ensure_indexes, url_mappings
 
 # Optional SQLAlchemy support (for DATABASE_URL)
 _HAS_SQLALCHEMY = False
 try:
     import sqlalchemy as sa
-    from sqlalchemy import (
-        Table,
-        Column,
-        String,
-        Text,
-        Integer,
-        Boolean,
-        MetaData,
-        DateTime,
-    )
     from sqlalchemy.exc import IntegrityError
 
     _HAS_SQLALCHEMY = True
@@ -46,10 +42,16 @@ def _ensure_db_dir():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
 
+def _pool():
+    """Pool de conexiones compartido para DB_PATH (ver utils.sqlite_pool)."""
+    return get_pool(DB_PATH)
+
+
 def _get_conn(retries: int = 3, timeout: float = 0.1) -> sqlite3.Connection:
-    """Open a sqlite connection and apply recommended PRAGMA settings.
+    """Open a standalone sqlite connection and apply recommended PRAGMA settings.
 
-    Retries briefly when encountering SQLITE_BUSY/locked situations.
+    Retries briefly when encountering SQLITE_BUSY/locked situations. The
+    functions in this module use the shared pool (`_pool()`) instead.
     """
     _ensure_db_dir()
     last_exc = None
@@ -77,8 +79,7 @@ def init_db():
         _init_with_sqlalchemy()
         return
 
-    conn = _get_conn()
-    try:
+    with _pool().write() as conn:
         cursor = conn.cursor()
         cursor.execute(
             """
@@ -91,49 +92,67 @@ def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 last_checked TIMESTAMP,
                 is_valid BOOLEAN DEFAULT 1,
-                failed_checks INTEGER DEFAULT 0
+                failed_checks INTEGER DEFAULT 0,
+                hits INTEGER DEFAULT 0,
+                last_hit TIMESTAMP,
+                next_check REAL
             )
         """
         )
-        conn.commit()
-        logger.info(f"URL cache database initialized at {DB_PATH}")
-    finally:
+        existing = {row[1] for row in cursor.execute("PRAGMA table_info(url_mappings)")}
+        for name, ddl in _ADDED_COLUMNS.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE url_mappings ADD COLUMN {name} {ddl}")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ix_url_mappings_validation "
+            "ON url_mappings (next_check, last_checked)"
+        )
         try:
-            conn.close()
-        except Exception:
-            pass
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_url_mappings_url ON url_mappings (url)"
+            )
+        except sqlite3.IntegrityError:
+            # URLs duplicadas de versiones antiguas: el índice normal también
+            # sirve para la búsqueda de create_short_url
+            logger.warning("url_mappings tiene URLs duplicadas; índice no único")
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS ix_url_mappings_url ON url_mappings (url)"
+            )
+    logger.info(f"URL cache database initialized at {DB_PATH}")
+
+
+# Columnas añadidas a url_mappings después de la primera versión; las bases
+# de datos existentes las reciben con ALTER TABLE al arrancar
+_ADDED_COLUMNS = {
+    "hits": "INTEGER DEFAULT 0",
+    "last_hit": "TIMESTAMP",
+    "next_check": "REAL",
+}
 
 
 def _init_with_sqlalchemy():
     """Initialize DB schema using SQLAlchemy (used when DATABASE_URL provided)."""
     if not _HAS_SQLALCHEMY:
         raise RuntimeError("SQLAlchemy not available")
-
-    engine = sa.create_engine(config.DATABASE_URL, future=True, pool_pre_ping=True)
-    meta = MetaData()
-    Table(
-        "url_mappings",
-        meta,
-        Column("hash", String(128), primary_key=True),
-        Column("url", Text, nullable=False),
-        Column("book_title", Text),
-        Column("series_name", Text),
-        Column("volume_number", Text),
-        Column("created_at", DateTime, server_default=sa.text("CURRENT_TIMESTAMP")),
-        Column("last_checked", DateTime),
-        Column("is_valid", Boolean, server_default=sa.true()),
-        Column("failed_checks", Integer, server_default="0"),
-    )
-    meta.create_all(engine)
+    engine = _get_sa_engine()
+    ensure_tables(engine, url_mappings)
+    existing = {c["name"] for c in sa.inspect(engine).get_columns("url_mappings")}
+    missing = [name for name in _ADDED_COLUMNS if name not in existing]
+    if missing:
+        with engine.begin() as conn:
+            for name in missing:
+                conn.execute(
+                    sa.text(
+                        f"ALTER TABLE url_mappings ADD COLUMN {name} {_ADDED_COLUMNS[name]}"
+                    )
+                )
+        # Los índices sobre las columnas nuevas no se pudieron crear antes
+        ensure_indexes(engine, url_mappings)
 
 
 def _get_sa_engine():
-    if not _HAS_SQLALCHEMY:
-        raise RuntimeError("SQLAlchemy not installed")
-    if not config.DATABASE_URL:
-        raise RuntimeError("DATABASE_URL not configured")
-    engine = sa.create_engine(config.DATABASE_URL, future=True, pool_pre_ping=True)
-    return engine
+    """Shared engine for DATABASE_URL (see utils.database)."""
+    return get_engine(config.DATABASE_URL)
 
 
 def create_short_url(
@@ -148,8 +167,6 @@ def create_short_url(
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         try:
             engine = _get_sa_engine()
-            metadata = MetaData()
-            url_mappings = Table("url_mappings", metadata, autoload_with=engine)
 
             full_hash = hashlib.sha256(url.encode("utf-8")).hexdigest()
             base_len = 12
@@ -191,6 +208,8 @@ def create_short_url(
                         logger.debug(
                             f"Created new URL mapping: {url_hash} -> {book_title or url[:50]}"
                         )
+                        # Puede haber un "no existe" cacheado para este hash
+                        invalidate_link_cache(url_hash)
                         return url_hash
                     except IntegrityError:
                         # Collision: check if points to same URL
@@ -219,6 +238,7 @@ def create_short_url(
                                 "vn": volume_number,
                             },
                         )
+                        invalidate_link_cache(url_hash)
                         return url_hash
         except Exception as e:
             logger.exception(
@@ -227,8 +247,7 @@ def create_short_url(
             # fall through to sqlite path
 
     # SQLite native path
-    conn = _get_conn()
-    try:
+    with _pool().write() as conn:
         cursor = conn.cursor()
 
         # Buscar si ya existe un hash para esta URL
@@ -263,6 +282,8 @@ def create_short_url(
                 logger.debug(
                     f"Created new URL mapping: {url_hash} -> {book_title or url[:50]}"
                 )
+                # Puede haber un "no existe" cacheado para este hash
+                invalidate_link_cache(url_hash)
                 return url_hash
             except sqlite3.IntegrityError:
                 # IntegrityError puede indicar que el hash ya existe en la tabla
@@ -286,17 +307,202 @@ def create_short_url(
                         (url_hash, url, book_title, series_name, volume_number),
                     )
                     conn.commit()
+                    invalidate_link_cache(url_hash)
                     return url_hash
                 except Exception as e:
                     logger.error(
                         f"Failed to insert url mapping after collision attempts: {e}"
                     )
                     return full_hash[:12]
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
+
+
+# Máximo de parámetros por consulta IN (SQLite antiguo admite 999)
+_IN_CHUNK = 500
+_INTEGRITY_ERRORS = (sqlite3.IntegrityError,) + (
+    (IntegrityError,) if _HAS_SQLALCHEMY else ()
+)
+
+
+def _chunks(values: List, size: int = _IN_CHUNK):
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _item_url(item) -> str:
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        return item["url"]
+    return item[0]
+
+
+def _normalize_items(items) -> Dict[str, tuple]:
+    """url -> (book_title, series_name, volume_number), sin URLs repetidas."""
+    out: Dict[str, tuple] = {}
+    for item in items:
+        url = _item_url(item)
+        if isinstance(item, str):
+            meta = (None, None, None)
+        elif isinstance(item, dict):
+            meta = (
+                item.get("book_title") or item.get("title"),
+                item.get("series_name"),
+                item.get("volume_number"),
+            )
+        else:
+            meta = (tuple(item[1:]) + (None, None, None))[:3]
+        # Si una URL se repite, gana la primera con título
+        if url not in out or (meta[0] and not out[url][0]):
+            out[url] = meta
+    return out
+
+
+def _assign_hashes(urls: List[str], fetch_taken) -> Dict[str, str]:
+    """
+    Hash corto de cada URL nueva: los 12 primeros caracteres del SHA256,
+    alargados de uno en uno si ya están ocupados en la BD (`fetch_taken`
+    devuelve {hash: url} de los que existen) o por otra URL del lote.
+    """
+    full = {u: hashlib.sha256(u.encode("utf-8")).hexdigest() for u in urls}
+    length = dict.fromkeys(urls, 12)
+    assigned: Dict[str, str] = {}
+    pending = list(urls)
+    while pending:
+        proposals = {u: full[u][: length[u]] for u in pending}
+        taken = fetch_taken(sorted(set(proposals.values())))
+        used = set(assigned.values())
+        retry = []
+        for u in pending:
+            h = proposals[u]
+            if (h in used or h in taken) and length[u] < len(full[u]):
+                length[u] += 1
+                retry.append(u)
+                continue
+            assigned[u] = h
+            used.add(h)
+        pending = retry
+    return assigned
+
+
+def create_short_urls(items: Iterable) -> List[str]:
+    """
+    Versión por lotes de `create_short_url`. `items` son URLs o dicts con
+    url/book_title (o title)/series_name/volume_number. Resuelve las URLs
+    existentes con una consulta IN, inserta las nuevas de una vez y devuelve
+    los hashes en el orden de entrada, todo en una transacción.
+    """
+    items = list(items)
+    wanted = _normalize_items(items)
+    if not wanted:
+        return []
+    urls = list(wanted)
+    try:
+        hashes = _create_short_urls_batch(wanted)
+    except _INTEGRITY_ERRORS:
+        # Otro proceso insertó alguna de estas URLs a la vez: uno a uno, que
+        # ya resuelve esos casos
+        logger.debug("create_short_urls: conflicto concurrente, reintentando uno a uno")
+        hashes = {u: create_short_url(u, *wanted[u]) for u in urls}
+    return [hashes[_item_url(item)] for item in items]
+
+
+def _create_short_urls_batch(wanted: Dict[str, tuple]) -> Dict[str, str]:
+    urls = list(wanted)
+    result: Dict[str, str] = {}
+
+    if config.DATABASE_URL and _HAS_SQLALCHEMY:
+        engine = _get_sa_engine()
+        c = url_mappings.c
+        with engine.begin() as conn:
+            for chunk in _chunks(urls):
+                for h, u in conn.execute(
+                    sa.select(c.hash, c.url).where(c.url.in_(chunk))
+                ):
+                    result[u] = h
+            updates = [
+                {"b_hash": result[u], "b_bt": bt, "b_sn": sn, "b_vn": vn}
+                for u, (bt, sn, vn) in wanted.items()
+                if u in result and bt
+            ]
+            if updates:
+                conn.execute(
+                    url_mappings.update()
+                    .where(c.hash == sa.bindparam("b_hash"))
+                    .values(
+                        book_title=sa.bindparam("b_bt"),
+                        series_name=sa.bindparam("b_sn"),
+                        volume_number=sa.bindparam("b_vn"),
+                    ),
+                    updates,
+                )
+
+            def fetch_taken(hashes):
+                taken = {}
+                for chunk in _chunks(hashes):
+                    sel = sa.select(c.hash, c.url).where(c.hash.in_(chunk))
+                    taken.update(conn.execute(sel).all())
+                return taken
+
+            new = _assign_hashes([u for u in urls if u not in result], fetch_taken)
+            if new:
+                conn.execute(
+                    url_mappings.insert(),
+                    [
+                        {
+                            "hash": h,
+                            "url": u,
+                            "book_title": wanted[u][0],
+                            "series_name": wanted[u][1],
+                            "volume_number": wanted[u][2],
+                            "is_valid": True,
+                        }
+                        for u, h in new.items()
+                    ],
+                )
+    else:
+        with _pool().write() as conn:
+            for chunk in _chunks(urls):
+                marks = ",".join("?" * len(chunk))
+                for h, u in conn.execute(
+                    f"SELECT hash, url FROM url_mappings WHERE url IN ({marks})", chunk
+                ):
+                    result[u] = h
+            conn.executemany(
+                "UPDATE url_mappings SET book_title = ?, series_name = ?, volume_number = ? WHERE hash = ?",
+                [
+                    (bt, sn, vn, result[u])
+                    for u, (bt, sn, vn) in wanted.items()
+                    if u in result and bt
+                ],
+            )
+
+            def fetch_taken(hashes):
+                taken = {}
+                for chunk in _chunks(hashes):
+                    marks = ",".join("?" * len(chunk))
+                    taken.update(
+                        conn.execute(
+                            f"SELECT hash, url FROM url_mappings WHERE hash IN ({marks})",
+                            chunk,
+                        ).fetchall()
+                    )
+                return taken
+
+            new = _assign_hashes([u for u in urls if u not in result], fetch_taken)
+            conn.executemany(
+                "INSERT INTO url_mappings (hash, url, book_title, series_name, volume_number, is_valid) VALUES (?, ?, ?, ?, ?, 1)",
+                [(h, u, *wanted[u]) for u, h in new.items()],
+            )
+
+    for u, h in new.items():
+        # Puede haber un "no existe" cacheado para estos hashes
+        invalidate_link_cache(h)
+        result[u] = h
+    if new:
+        logger.debug(
+            f"create_short_urls: {len(new)} enlaces nuevos, {len(result) - len(new)} existentes"
+        )
+    return result
 
 
 def get_url_from_hash(url_hash: str) -> Optional[str]:
@@ -306,8 +512,6 @@ def get_url_from_hash(url_hash: str) -> Optional[str]:
     """
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         engine = _get_sa_engine()
-        metadata = MetaData()
-        url_mappings = Table("url_mappings", metadata, autoload_with=engine)
         with engine.connect() as conn:
             sel = sa.select(url_mappings.c.url).where(url_mappings.c.hash == url_hash)
             r = conn.execute(sel).first()
@@ -315,123 +519,325 @@ def get_url_from_hash(url_hash: str) -> Optional[str]:
                 return r[0]
             return None
 
-    conn = _get_conn()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT url FROM url_mappings WHERE hash = ?", (url_hash,))
-        result = cursor.fetchone()
+    with _pool().read() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT url FROM url_mappings WHERE hash = ?", (url_hash,))
+            result = cursor.fetchone()
+
+            if result:
+                return result[0]
+            return None
+        except Exception as e:
+            logger.error(f"Error retrieving URL: {e}")
+            return None
+
+
+# --- Caché de resolución de enlaces cortos ---
+# /api/dl/{hash} es el endpoint público más visitado y un post que se hace
+# viral repite el mismo hash miles de veces. Se guarda hash -> (url, título)
+# durante SHORT_LINK_CACHE_TTL segundos, y los hashes desconocidos durante
+# SHORT_LINK_NEGATIVE_TTL. purge_link, create_short_url y el validador
+# invalidan las entradas que cambian; otras réplicas lo ven al caducar.
+_MISSING = object()
+_link_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_link_cache_lock = threading.Lock()
+_link_cache_stats = {"hits": 0, "negative_hits": 0, "misses": 0, "invalidations": 0}
+_link_cache_gen = 0  # se incrementa en cada invalidación
+
+
+def invalidate_link_cache(url_hash: Optional[str] = None) -> None:
+    """Olvida la resolución cacheada de un hash, o de todos si no se indica."""
+    global _link_cache_gen
+    with _link_cache_lock:
+        _link_cache_gen += 1
+        if url_hash is None:
+            _link_cache.clear()
+        else:
+            _link_cache.pop(url_hash, None)
+        _link_cache_stats["invalidations"] += 1
 
-        if result:
-            return result[0]
-        return None
-    except Exception as e:
-        logger.error(f"Error retrieving URL: {e}")
-        return None
-    finally:
-        conn.close()
+
+def get_link_cache_stats() -> Dict[str, float]:
+    with _link_cache_lock:
+        stats = {**_link_cache_stats, "size": len(_link_cache)}
+    served = stats["hits"] + stats["negative_hits"]
+    total = served + stats["misses"]
+    stats["hit_ratio"] = served / total if total else 0.0
+    return stats
+
+
+def _title_from_url(url: str) -> str:
+    return unquote(urlparse(url).path.split("/")[-1]).replace(".epub", "")
+
+
+def resolve_short_link(url_hash: str) -> Optional[Tuple[str, str]]:
+    """
+    (url, título) de un hash corto, desde la caché o la BD. Retorna None si
+    el hash no existe. El título sale del nombre del fichero de la URL.
+    """
+    ttl = config.SHORT_LINK_CACHE_TTL
+    if ttl <= 0:
+        url = get_url_from_hash(url_hash)
+        return (url, _title_from_url(url)) if url else None
+
+    now = time.monotonic()
+    with _link_cache_lock:
+        entry = _link_cache.get(url_hash)
+        if entry is not None and entry[0] > now:
+            _link_cache.move_to_end(url_hash)
+            if entry[1] is _MISSING:
+                _link_cache_stats["negative_hits"] += 1
+                return None
+            _link_cache_stats["hits"] += 1
+            return entry[1]
+        _link_cache_stats["misses"] += 1
+        gen = _link_cache_gen
+
+    url = get_url_from_hash(url_hash)
+    value = (url, _title_from_url(url)) if url else None
+    with _link_cache_lock:
+        # Si hubo una escritura mientras se leía, no guardar un valor viejo
+        if gen != _link_cache_gen:
+            return value
+        if value is None:
+            _link_cache[url_hash] = (now + config.SHORT_LINK_NEGATIVE_TTL, _MISSING)
+        else:
+            _link_cache[url_hash] = (now + ttl, value)
+        _link_cache.move_to_end(url_hash)
+        while len(_link_cache) > config.SHORT_LINK_CACHE_SIZE:
+            _link_cache.popitem(last=False)
+    return value
 
 
 def count_mappings() -> int:
     """Retorna el número total de mappings almacenados."""
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         engine = _get_sa_engine()
-        metadata = MetaData()
-        url_mappings = Table("url_mappings", metadata, autoload_with=engine)
         with engine.connect() as conn:
             sel = sa.select(sa.func.count()).select_from(url_mappings)
             r = conn.execute(sel).scalar()
             return int(r or 0)
 
-    conn = _get_conn()
-    cursor = conn.cursor()
-
-    try:
+    with _pool().read() as conn:
+        cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM url_mappings")
         return cursor.fetchone()[0]
-    finally:
-        conn.close()
 
 
-async def validate_and_update_url(url_hash: str, url: str) -> bool:
-    """Valida una URL y actualiza su estado. Retorna True si es válida."""
+# Respuestas a HEAD que se aceptan como definitivas; el resto (405, 403,
+# 5xx...) se confirma con un GET parcial, porque muchos orígenes no
+# implementan HEAD o lo tratan distinto
+_HEAD_FINAL_STATUSES = {404, 410}
+
+
+async def check_url(url: str, session=None) -> bool:
+    """
+    Comprueba si `url` responde (sin tocar la base de datos). Prueba primero
+    con HEAD y, si la respuesta no es concluyente, con un GET de 1KB.
+    """
     import aiohttp
+    from utils.host_limiter import Priority, get_host_limiter
+
+    if session is None:
+        from core.session_manager import session_manager
+
+        # Sesión compartida: reutiliza conexiones y DNS con el resto del bot
+        session = session_manager.get_session()
+    timeout = aiohttp.ClientTimeout(total=15)
+    # Prioridad más baja: cede el origen a usuarios y descargas
+    async with get_host_limiter(url).slot(Priority.BACKGROUND) as slot:
+        async with session.head(url, timeout=timeout, allow_redirects=True) as resp:
+            slot.response(resp.status)
+            if 200 <= resp.status < 300:
+                return True
+            if resp.status in _HEAD_FINAL_STATUSES:
+                return False
+        headers = {"Range": "bytes=0-1024"}  # Solo descargar los primeros 1KB
+        async with session.get(
+            url, headers=headers, timeout=timeout, allow_redirects=True
+        ) as resp:
+            slot.response(resp.status)
+            # Aceptar 200 (OK) o 206 (Partial Content)
+            return 200 <= resp.status < 300
+
+
+def revalidate_after(hits: int, failed_checks: int, interval: float) -> float:
+    """
+    Segundos hasta la siguiente comprobación de un enlace.
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            # Usar GET con range limitado en lugar de HEAD para mejor compatibilidad
-            headers = {"Range": "bytes=0-1024"}  # Solo descargar los primeros 1KB
-            async with session.get(
-                url,
-                headers=headers,
-                timeout=aiohttp.ClientTimeout(total=15),
-                allow_redirects=True,
-            ) as resp:
-                # Aceptar 200 (OK) o 206 (Partial Content)
-                is_valid = 200 <= resp.status < 300
-    except Exception as e:
-        logger.debug("validate_and_update_url check failed for %s: %s", url_hash, e)
-        is_valid = False
+    Los enlaces válidos se revisan cada `interval`, antes cuanto más tráfico
+    tienen (1 clic: la mitad; 3: un tercio... hasta 1/8). Los rotos esperan
+    `interval` tras el primer fallo y el doble con cada fallo seguido, hasta
+    VALIDATOR_MAX_BACKOFF: un enlace muerto deja de consumir comprobaciones.
+    """
+    if failed_checks > 0:
+        cap = max(interval, config.VALIDATOR_MAX_BACKOFF)
+        return min(interval * 2 ** min(failed_checks - 1, 30), cap)
+    return interval / min(8.0, 1.0 + math.log2(1 + max(0, hits)))
+
+
+def record_validation_results(results, interval: Optional[float] = None) -> int:
+    """
+    Guarda en una sola transacción el resultado de varias comprobaciones y
+    programa la siguiente de cada enlace (ver `revalidate_after`). `results`
+    es un iterable de (hash, es_valido). Retorna cuántas se guardaron.
+    """
+    results = dict(results)
+    if not results:
+        return 0
+    interval = interval or config.VALIDATOR_INTERVAL
+    now = time.time()
+
+    def _updates(rows):
+        # rows: (hash, hits, failed_checks) actuales
+        for url_hash, hits, failed in rows:
+            ok = results[url_hash]
+            failed = 0 if ok else (failed or 0) + 1
+            yield url_hash, ok, failed, now + revalidate_after(
+                hits or 0, failed, interval
+            )
 
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         engine = _get_sa_engine()
-        metadata = MetaData()
-        url_mappings = Table("url_mappings", metadata, autoload_with=engine)
         with engine.begin() as conn:
-            if is_valid:
-                upd = (
-                    url_mappings.update()
-                    .where(url_mappings.c.hash == url_hash)
-                    .values(
-                        last_checked=sa.text("CURRENT_TIMESTAMP"),
-                        is_valid=True,
-                        failed_checks=0,
-                    )
-                )
-                conn.execute(upd)
-            else:
-                upd = (
+            rows = conn.execute(
+                sa.select(
+                    url_mappings.c.hash,
+                    url_mappings.c.hits,
+                    url_mappings.c.failed_checks,
+                ).where(url_mappings.c.hash.in_(list(results)))
+            ).all()
+            params = [
+                {"b_hash": h, "b_valid": ok, "b_failed": failed, "b_next": next_check}
+                for h, ok, failed, next_check in _updates(rows)
+            ]
+            if params:
+                conn.execute(
                     url_mappings.update()
-                    .where(url_mappings.c.hash == url_hash)
+                    .where(url_mappings.c.hash == sa.bindparam("b_hash"))
                     .values(
                         last_checked=sa.text("CURRENT_TIMESTAMP"),
-                        is_valid=False,
-                        failed_checks=url_mappings.c.failed_checks + 1,
-                    )
+                        is_valid=sa.bindparam("b_valid"),
+                        failed_checks=sa.bindparam("b_failed"),
+                        # Cada comprobación parte a la mitad el tráfico acumulado:
+                        # cuenta más el reciente
+                        hits=url_mappings.c.hits / 2,
+                        next_check=sa.bindparam("b_next"),
+                    ),
+                    params,
                 )
-                conn.execute(upd)
-        return is_valid
+        _invalidate_broken(results)
+        return len(params)
+
+    with _pool().write() as conn:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(results))
+        rows = cursor.execute(
+            f"SELECT hash, hits, failed_checks FROM url_mappings WHERE hash IN ({placeholders})",
+            list(results),
+        ).fetchall()
+        params = [
+            (int(ok), failed, next_check, h)
+            for h, ok, failed, next_check in _updates(rows)
+        ]
+        # Cada comprobación parte a la mitad el tráfico acumulado: cuenta más el
+        # reciente. Un enlace válido reinicia su contador de fallos.
+        cursor.executemany(
+            "UPDATE url_mappings SET last_checked = CURRENT_TIMESTAMP, is_valid = ?, "
+            "failed_checks = ?, hits = hits / 2, next_check = ? WHERE hash = ?",
+            params,
+        )
+        # Auto‑deletion after 3 fallos ha sido desactivada.
+        # Se mantiene el registro para que el admin pueda revisarlo manualmente.
+    _invalidate_broken(results)
+    return len(params)
 
-    conn = _get_conn()
-    cursor = conn.cursor()
 
+def _invalidate_broken(results: Dict[str, bool]) -> None:
+    # Un enlace roto puede haberse corregido o purgado desde otra réplica:
+    # que el siguiente clic lo vuelva a leer de la BD
+    for url_hash, ok in results.items():
+        if not ok:
+            invalidate_link_cache(url_hash)
+
+
+_pending_hits: Dict[str, int] = {}
+_hits_lock = threading.Lock()
+
+
+def record_hit(url_hash: str) -> None:
+    """Cuenta una resolución de /api/dl/{hash} (se guarda con `flush_hits`)."""
+    with _hits_lock:
+        _pending_hits[url_hash] = _pending_hits.get(url_hash, 0) + 1
+
+
+def flush_hits(interval: Optional[float] = None) -> int:
+    """
+    Suma a la BD los clics pendientes y adelanta la revalidación de los
+    enlaces válidos que los reciben. Retorna cuántos enlaces se actualizaron.
+    """
+    with _hits_lock:
+        pending = dict(_pending_hits)
+        _pending_hits.clear()
+    if not pending:
+        return 0
+    interval = interval or config.VALIDATOR_INTERVAL
+    now = time.time()
+    # Plazo máximo según el tráfico de esta tanda; si ya había uno antes se
+    # conserva (MIN). Sin comprobación programada (NULL) ya es candidato.
+    params = [
+        (count, now + revalidate_after(count, 0, interval), h)
+        for h, count in pending.items()
+    ]
     try:
-        if is_valid:
-            # Restablecer contador de fallos
-            cursor.execute(
-                "UPDATE url_mappings SET last_checked = CURRENT_TIMESTAMP, is_valid = 1, failed_checks = 0 WHERE hash = ?",
-                (url_hash,),
-            )
+        if config.DATABASE_URL and _HAS_SQLALCHEMY:
+            engine = _get_sa_engine()
+            with engine.begin() as conn:
+                conn.execute(
+                    url_mappings.update()
+                    .where(url_mappings.c.hash == sa.bindparam("b_hash"))
+                    .values(
+                        hits=url_mappings.c.hits + sa.bindparam("b_count"),
+                        last_hit=sa.text("CURRENT_TIMESTAMP"),
+                        next_check=sa.case(
+                            (
+                                sa.and_(
+                                    url_mappings.c.failed_checks == 0,
+                                    url_mappings.c.next_check > sa.bindparam("b_due"),
+                                ),
+                                sa.bindparam("b_due"),
+                            ),
+                            else_=url_mappings.c.next_check,
+                        ),
+                    ),
+                    [{"b_count": c, "b_due": due, "b_hash": h} for c, due, h in params],
+                )
         else:
-            # Incrementar contador de fallos
-            cursor.execute(
-                "UPDATE url_mappings SET last_checked = CURRENT_TIMESTAMP, is_valid = 0, failed_checks = failed_checks + 1 WHERE hash = ?",
-                (url_hash,),
-            )
-
-            # Borrar si alcanzó 3 fallos
-            # Auto‑deletion after 3 fallos ha sido desactivada.
-            # Se mantiene el registro para que el admin pueda revisarlo manualmente.
-            # Si deseas volver a habilitar la eliminación automática, descomenta el bloque siguiente.
-            # cursor.execute("SELECT failed_checks FROM url_mappings WHERE hash = ?", (url_hash,))
-            # result = cursor.fetchone()
-            # if result and result[0] >= 3:
-            #     cursor.execute("DELETE FROM url_mappings WHERE hash = ?", (url_hash,))
-            #     logger.warning(f"Deleted URL mapping {url_hash} after 3 failed checks")
+            with _pool().write() as conn:
+                conn.executemany(
+                    "UPDATE url_mappings SET hits = hits + ?, last_hit = CURRENT_TIMESTAMP, "
+                    "next_check = CASE WHEN failed_checks = 0 THEN MIN(next_check, ?) "
+                    "ELSE next_check END WHERE hash = ?",
+                    params,
+                )
+    except Exception:
+        # No perder los clics: se reintentan en el siguiente volcado
+        with _hits_lock:
+            for h, count in pending.items():
+                _pending_hits[h] = _pending_hits.get(h, 0) + count
+        raise
+    return len(pending)
 
-        conn.commit()
-    finally:
-        conn.close()
 
+async def validate_and_update_url(url_hash: str, url: str) -> bool:
+    """Valida una URL y actualiza su estado. Retorna True si es válida."""
+    try:
+        is_valid = await check_url(url)
+    except Exception as e:
+        logger.debug("validate_and_update_url check failed for %s: %s", url_hash, e)
+        is_valid = False
+    record_validation_results([(url_hash, is_valid)])
     return is_valid
 
 
@@ -439,8 +845,6 @@ def get_stats() -> dict:
     """Retorna estadísticas de los links."""
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         engine = _get_sa_engine()
-        metadata = MetaData()
-        url_mappings = Table("url_mappings", metadata, autoload_with=engine)
         with engine.connect() as conn:
             total = (
                 conn.execute(
@@ -479,10 +883,8 @@ def get_stats() -> dict:
                 "at_risk": int(at_risk),
             }
 
-    conn = _get_conn()
-    cursor = conn.cursor()
-
-    try:
+    with _pool().read() as conn:
+        cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM url_mappings")
         total = cursor.fetchone()[0]
 
@@ -496,16 +898,12 @@ def get_stats() -> dict:
         at_risk = cursor.fetchone()[0]
 
         return {"total": total, "valid": valid, "broken": broken, "at_risk": at_risk}
-    finally:
-        conn.close()
 
 
 def get_broken_links(limit: int = 10):
     """Retorna lista de links rotos con su información."""
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         engine = _get_sa_engine()
-        metadata = MetaData()
-        url_mappings = Table("url_mappings", metadata, autoload_with=engine)
         with engine.connect() as conn:
             sel = (
                 sa.select(
@@ -523,10 +921,8 @@ def get_broken_links(limit: int = 10):
             )
             return list(conn.execute(sel).all())
 
-    conn = _get_conn()
-    cursor = conn.cursor()
-
-    try:
+    with _pool().read() as conn:
+        cursor = conn.cursor()
         cursor.execute(
             """SELECT hash, book_title, failed_checks, last_checked 
                FROM url_mappings 
@@ -536,8 +932,6 @@ def get_broken_links(limit: int = 10):
             (limit,),
         )
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 
 def get_recent_links(limit: int = 20):
@@ -547,8 +941,6 @@ def get_recent_links(limit: int = 20):
     """
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         engine = _get_sa_engine()
-        metadata = MetaData()
-        url_mappings = Table("url_mappings", metadata, autoload_with=engine)
         sel = (
             sa.select(
                 url_mappings.c.hash,
@@ -562,9 +954,8 @@ def get_recent_links(limit: int = 20):
         with engine.connect() as conn:
             return [tuple(r) for r in conn.execute(sel).all()]
 
-    conn = _get_conn()
-    cursor = conn.cursor()
-    try:
+    with _pool().read() as conn:
+        cursor = conn.cursor()
         cursor.execute(
             """SELECT hash, url, book_title, created_at
                FROM url_mappings
@@ -573,55 +964,67 @@ def get_recent_links(limit: int = 20):
             (limit,),
         )
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 
 def get_candidates_for_validation(limit: int = 100, older_than_seconds: int = 3600):
-    """Return list of (hash, url) candidates that need validation.
+    """Return list of (hash, url) candidates that need validation, most urgent first.
 
-    Criteria (sqlite path): last_checked IS NULL OR last_checked older than threshold
-    or is_valid == 0.
+    A link is due when its scheduled `next_check` has passed (see
+    `revalidate_after`: traffic pulls it earlier, a failure streak pushes it
+    back exponentially). Links never scheduled keep the original criteria:
+    last_checked IS NULL OR older than threshold, or is_valid == 0.
     """
     from datetime import datetime, timedelta
 
     # Compute cutoff datetime in Python (UTC) so comparisons work in both SQLite and Postgres
     cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+    now = time.time()
 
     if config.DATABASE_URL and _HAS_SQLALCHEMY:
         engine = _get_sa_engine()
-        metadata = MetaData()
-        url_mappings = Table("url_mappings", metadata, autoload_with=engine)
 
+        c = url_mappings.c
+        order = [c.next_check, c.last_checked]
+        if engine.dialect.name != "sqlite":
+            # SQLite ya pone los NULL primero (y así recorre el índice en orden)
+            order = [col.asc().nulls_first() for col in order]
         with engine.connect() as conn:
             sel = (
-                sa.select(url_mappings.c.hash, url_mappings.c.url)
+                sa.select(c.hash, c.url)
                 .where(
                     sa.or_(
-                        url_mappings.c.last_checked == None,
-                        url_mappings.c.last_checked < cutoff,
-                        url_mappings.c.is_valid == False,
+                        c.next_check <= now,
+                        sa.and_(
+                            c.next_check == None,
+                            sa.or_(
+                                c.last_checked == None,
+                                c.last_checked < cutoff,
+                                c.is_valid == False,
+                            ),
+                        ),
                     )
                 )
+                .order_by(*order)
                 .limit(limit)
             )
             return [tuple(r) for r in conn.execute(sel).all()]
 
-    conn = _get_conn()
-    cursor = conn.cursor()
-    try:
+    with _pool().read() as conn:
+        cursor = conn.cursor()
         # Use a concrete cutoff string so it's portable across SQLite/Postgres
         cutoff_str = cutoff.isoformat(sep=" ", timespec="seconds")
+        # SQLite ordena los NULL primero: recorre ix_url_mappings_validation en
+        # orden y para en LIMIT, sin ordenar toda la tabla
         cursor.execute(
             """SELECT hash, url FROM url_mappings
-               WHERE last_checked IS NULL OR last_checked < ?
-                 OR is_valid = 0
+               WHERE next_check <= ?
+                  OR (next_check IS NULL
+                      AND (last_checked IS NULL OR last_checked < ? OR is_valid = 0))
+               ORDER BY next_check, last_checked
                LIMIT ?""",
-            (cutoff_str, limit),
+            (now, cutoff_str, limit),
         )
         return cursor.fetchall()
-    finally:
-        conn.close()
 
 
 # Inicializar BD al importar el módulo
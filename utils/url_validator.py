@@ -1,34 +1,163 @@
+"""
+Validación periódica de los enlaces acortados.
+
+Cada lote se comprueba con la sesión HTTP compartida, con un máximo de
+VALIDATOR_CONCURRENCY comprobaciones a la vez y un espacio mínimo de
+VALIDATOR_HOST_INTERVAL segundos entre peticiones al mismo host; los
+resultados se guardan juntos en una sola transacción.
+
+El orden lo marca la próxima comprobación programada de cada enlace
+(`url_cache.revalidate_after`): los clics en /api/dl la adelantan y los
+fallos seguidos la retrasan de forma exponencial.
+
+Modos (VALIDATOR_MODE):
+- "batch": cada `interval` segundos valida hasta `batch_size` candidatos.
+- "continuous": cada VALIDATOR_TICK segundos valida la parte proporcional
+  de todos los enlaces, de modo que cada uno se revisa una vez por
+  `interval` sin ráfagas cada hora.
+"""
+
+import math
+import time
 import asyncio
 import logging
-from typing import Optional
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
 
-from .url_cache import get_candidates_for_validation, validate_and_update_url
+from config.config_settings import config
+from .url_cache import (
+    check_url,
+    count_mappings,
+    flush_hits,
+    get_candidates_for_validation,
+    record_validation_results,
+)
 
 logger = logging.getLogger(__name__)
 
 _validator_task: Optional[asyncio.Task] = None
 
 
-async def _validator_loop(interval: int = 3600, batch_size: int = 50):
+class _HostPacer:
+    """Espacia el inicio de las peticiones a un mismo host."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next: Dict[str, float] = {}
+
+    async def wait(self, url: str) -> None:
+        if self.interval <= 0:
+            return
+        host = urlsplit(url).netloc.lower()
+        now = time.monotonic()
+        start = max(now, self._next.get(host, 0.0))
+        # Reservar el turno antes de esperar para que el siguiente vaya detrás
+        self._next[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+async def validate_urls(
+    candidates: Iterable[Tuple[str, str]],
+    concurrency: Optional[int] = None,
+    host_interval: Optional[float] = None,
+    session=None,
+    interval: Optional[float] = None,
+) -> Dict[str, bool]:
+    """
+    Comprueba (hash, url) en paralelo y guarda todos los resultados en una
+    transacción, programando la siguiente comprobación de cada enlace a
+    partir de `interval`. Retorna {hash: es_valido}.
+    """
+    candidates = list(candidates)
+    if not candidates:
+        return {}
+    if session is None:
+        from core.session_manager import session_manager
+
+        session = session_manager.get_session()
+    semaphore = asyncio.Semaphore(max(1, concurrency or config.VALIDATOR_CONCURRENCY))
+    pacer = _HostPacer(
+        config.VALIDATOR_HOST_INTERVAL if host_interval is None else host_interval
+    )
+
+    async def _check(url_hash: str, url: str) -> Tuple[str, bool]:
+        async with semaphore:
+            await pacer.wait(url)
+            try:
+                return url_hash, await check_url(url, session=session)
+            except Exception as e:
+                logger.debug("URL check failed for %s: %s", url_hash, e)
+                return url_hash, False
+
+    results = dict(await asyncio.gather(*(_check(h, u) for h, u in candidates)))
+    await asyncio.to_thread(record_validation_results, results.items(), interval)
+    return results
+
+
+def _per_tick(total: int, interval: float, tick: float) -> int:
+    """Enlaces por tick para revisar `total` una vez cada `interval` segundos."""
+    if total <= 0:
+        return 0
+    return max(1, math.ceil(total * tick / interval))
+
+
+async def _run_batch(interval: int, batch_size: int) -> None:
+    # Consultas síncronas a la DB: fuera del event loop
+    candidates = await asyncio.to_thread(
+        get_candidates_for_validation, limit=batch_size, older_than_seconds=interval
+    )
+    logger.debug("Validator found %d candidates", len(candidates))
+    if candidates:
+        results = await validate_urls(candidates, interval=interval)
+        logger.debug(
+            "Validator run completed: %d valid, %d broken",
+            sum(results.values()),
+            len(results) - sum(results.values()),
+        )
+
+
+async def _run_tick(interval: int, tick: float) -> None:
+    total = await asyncio.to_thread(count_mappings)
+    limit = _per_tick(total, interval, tick)
+    if not limit:
+        return
+    candidates = await asyncio.to_thread(
+        get_candidates_for_validation, limit=limit, older_than_seconds=interval
+    )
+    if candidates:
+        await validate_urls(candidates, interval=interval)
+
+
+async def _validator_loop(
+    interval: int = 3600,
+    batch_size: int = 50,
+    mode: str = "batch",
+    tick: float = 60,
+):
     logger.info(
-        "URL validator started (interval=%s sec, batch=%s)", interval, batch_size
+        "URL validator started (mode=%s, interval=%s sec, batch=%s)",
+        mode,
+        interval,
+        batch_size,
     )
+    continuous = mode == "continuous"
     try:
         while True:
+            started = time.monotonic()
             try:
-                candidates = get_candidates_for_validation(
-                    limit=batch_size, older_than_seconds=interval
-                )
-                logger.debug("Validator found %d candidates", len(candidates))
-                coros = []
-                for url_hash, url in candidates:
-                    coros.append(validate_and_update_url(url_hash, url))
-                if coros:
-                    results = await asyncio.gather(*coros, return_exceptions=True)
-                    logger.debug("Validator run completed: %s", results)
+                # Los clics recientes adelantan la revalidación de sus enlaces
+                await asyncio.to_thread(flush_hits, interval)
+                if continuous:
+                    await _run_tick(interval, tick)
+                else:
+                    await _run_batch(interval, batch_size)
             except Exception as e:
                 logger.exception("Error during validator run: %s", e)
-            await asyncio.sleep(interval)
+            if continuous:
+                await asyncio.sleep(max(0.0, tick - (time.monotonic() - started)))
+            else:
+                await asyncio.sleep(interval)
     except asyncio.CancelledError:
         logger.info("URL validator stopped")
         raise
@@ -36,8 +165,9 @@ async def _validator_loop(interval: int = 3600, batch_size: int = 50):
 
 def start_background_validator(
     loop: Optional[asyncio.AbstractEventLoop] = None,
-    interval: int = 3600,
-    batch_size: int = 50,
+    interval: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    mode: Optional[str] = None,
 ):
     global _validator_task
     if _validator_task and not _validator_task.done():
@@ -45,7 +175,12 @@ def start_background_validator(
         return _validator_task
     _loop = loop or asyncio.get_event_loop()
     _validator_task = _loop.create_task(
-        _validator_loop(interval=interval, batch_size=batch_size)
+        _validator_loop(
+            interval=interval or config.VALIDATOR_INTERVAL,
+            batch_size=batch_size or config.VALIDATOR_BATCH_SIZE,
+            mode=mode or config.VALIDATOR_MODE,
+            tick=config.VALIDATOR_TICK,
+        )
     )
     return _validator_task
 
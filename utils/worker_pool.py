@@ -0,0 +1,157 @@
+"""
+Pool de trabajadores para tareas CPU (parseo de EPUB, etc.) fuera del event loop.
+
+Envuelve un ThreadPoolExecutor o ProcessPoolExecutor con concurrencia acotada
+(las tareas esperan turno en un semáforo en lugar de amontonarse en el
+executor), timeout por tarea y métricas de tiempo de espera en cola.
+En modo "process" las funciones y argumentos deben poder serializarse (pickle).
+"""
+
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_call(fn: Callable, args: tuple) -> Tuple[float, Any]:
+    """Ejecuta fn(*args) en el trabajador y devuelve (instante de inicio, resultado)."""
+    started = time.time()
+    return started, fn(*args)
+
+
+class WorkerPool:
+    """Executor con concurrencia acotada, timeout y métricas de espera."""
+
+    def __init__(
+        self,
+        name: str,
+        mode: str = "thread",
+        workers: int = 2,
+        timeout: Optional[float] = 60,
+        slow_wait: float = 2.0,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(
+                f"WorkerPool mode must be 'thread' or 'process', not {mode!r}"
+            )
+        self.name = name
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.slow_wait = slow_wait
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._stats: Dict[str, float] = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "waiting": 0,
+            "running": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "run_time_total": 0.0,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix=self.name
+                )
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._semaphore
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Ejecuta fn(*args) en el pool. Lanza asyncio.TimeoutError si la tarea
+        supera el timeout (la espera en cola no cuenta) y propaga sus excepciones.
+        Una tarea que vence el timeout sigue ocupando su plaza hasta que el
+        trabajador termina de verdad, así nunca hay más de `workers` en marcha.
+        """
+        stats = self._stats
+        stats["submitted"] += 1
+        stats["waiting"] += 1
+        enqueued = time.time()
+        timeout = self.timeout if timeout is None else timeout
+        semaphore = self._get_semaphore()
+        try:
+            await semaphore.acquire()
+        finally:
+            # Con turno o cancelada mientras esperaba: ya no está en cola
+            stats["waiting"] -= 1
+        stats["running"] += 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            job = self._get_executor().submit(_timed_call, fn, args)
+        except BaseException:
+            self._finished()
+            stats["failed"] += 1
+            raise
+        job.add_done_callback(lambda _job: self._finished_threadsafe(loop))
+        try:
+            started, result = await asyncio.wait_for(asyncio.wrap_future(job), timeout)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            logger.warning(
+                "WorkerPool[%s]: %s superó el timeout de %ss",
+                self.name,
+                getattr(fn, "__name__", fn),
+                timeout,
+            )
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            stats["failed"] += 1
+            raise
+
+        waited = max(0.0, started - enqueued)
+        stats["completed"] += 1
+        stats["queue_wait_total"] += waited
+        stats["queue_wait_max"] = max(stats["queue_wait_max"], waited)
+        stats["run_time_total"] += max(0.0, time.time() - started)
+        if waited >= self.slow_wait:
+            logger.info(
+                "WorkerPool[%s]: %s esperó %.2fs en cola",
+                self.name,
+                getattr(fn, "__name__", fn),
+                waited,
+            )
+        return result
+
+    def _finished(self) -> None:
+        """Libera la plaza de una tarea que ya no ocupa a ningún trabajador."""
+        self._stats["running"] -= 1
+        self._semaphore.release()
+
+    def _finished_threadsafe(self, loop: asyncio.AbstractEventLoop) -> None:
+        # Callback del executor: se ejecuta en el hilo (o gestor) del trabajador
+        try:
+            loop.call_soon_threadsafe(self._finished)
+        except RuntimeError:
+            pass  # event loop ya cerrado
+
+    def stats(self) -> Dict[str, float]:
+        out = dict(self._stats)
+        done = out["completed"] or 1
+        out["queue_wait_avg"] = out["queue_wait_total"] / done
+        out["run_time_avg"] = out["run_time_total"] / done
+        out["mode"] = self.mode
+        out["workers"] = self.workers
+        return out
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None